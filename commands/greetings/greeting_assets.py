@@ -0,0 +1,113 @@
+"""
+Заранее подготовленные приветствия: текст и картинка на ближайшую отправку
+хранятся в data/greetings/, чтобы в момент публикации ничего не генерировать.
+"""
+import copy
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+from utils.journal import SnapshotSaver
+from utils.lazy import LazyProxy
+
+logger = logging.getLogger(__name__)
+
+GREETINGS_DIR = "data/greetings"
+
+
+class GreetingAssetStore:
+
+    def __init__(self, directory: str = GREETINGS_DIR):
+        self.directory = os.path.abspath(directory)
+        self.index_file = os.path.join(self.directory, "prepared.json")
+        os.makedirs(self.directory, exist_ok=True)
+        self.prepared: Dict[str, dict] = self._load()
+        self._saver = SnapshotSaver(self.index_file, lambda: copy.deepcopy(self.prepared),
+                                    "подготовленных приветствий")
+
+    def _load(self) -> Dict[str, dict]:
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки подготовленных приветствий: {e}", exc_info=True)
+        return {}
+
+    def _save(self):
+        self._saver.save()
+
+    async def flush(self):
+        await self._saver.flush()
+
+    def _entry(self, kind: str, target_date: str) -> dict:
+        entry = self.prepared.get(kind)
+        if not entry or entry.get("date") != target_date:
+            # Устаревшая заготовка на прошедшую дату больше не нужна
+            self.discard(kind)
+            entry = {"date": target_date, "text": None, "image": None, "file_id": None}
+            self.prepared[kind] = entry
+        return entry
+
+    def get(self, kind: str, target_date: str) -> Optional[dict]:
+        entry = self.prepared.get(kind)
+        if entry and entry.get("date") == target_date:
+            return entry
+        return None
+
+    def is_complete(self, kind: str, target_date: str, with_image: bool = True) -> bool:
+        entry = self.get(kind, target_date)
+        if not entry or not entry.get("text"):
+            return False
+        return not with_image or self.image_path(entry) is not None
+
+    def save_text(self, kind: str, target_date: str, text: str):
+        entry = self._entry(kind, target_date)
+        entry["text"] = text
+        entry["text_created_at"] = datetime.now().isoformat()
+        self._save()
+
+    def save_image(self, kind: str, target_date: str, image_bytes: bytes) -> str:
+        entry = self._entry(kind, target_date)
+        filename = f"{kind}_{target_date}.jpg"
+        path = os.path.join(self.directory, filename)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(image_bytes)
+        os.replace(tmp_path, path)
+
+        entry["image"] = filename
+        entry["file_id"] = None
+        entry["image_created_at"] = datetime.now().isoformat()
+        self._save()
+        return path
+
+    def set_file_id(self, kind: str, target_date: str, file_id: str):
+        entry = self.get(kind, target_date)
+        if entry:
+            entry["file_id"] = file_id
+            self._save()
+
+    def image_path(self, entry: dict) -> Optional[str]:
+        if not entry.get("image"):
+            return None
+        path = os.path.join(self.directory, entry["image"])
+        return path if os.path.exists(path) else None
+
+    def discard(self, kind: str):
+        entry = self.prepared.pop(kind, None)
+        if not entry:
+            return
+        path = self.image_path(entry)
+        if path:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить {path}: {e}")
+        self._save()
+
+
+greeting_assets = LazyProxy(GreetingAssetStore, "greeting_assets")
@@ -1,22 +1,25 @@
 import os
+import asyncio
 import logging
 from typing import Literal
 import datetime
 
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, BufferedInputFile
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from aiogram.types import Message, BufferedInputFile, FSInputFile
 from dateutil import tz
 
-from utils.openrouter_text_generator import OpenRouterTextGenerator
 from commands.schedule.schedule_parser import fetch_ics_from_json, parse_schedule, extract_teacher_name, URL
 import re
-from utils.pollinations_image import PollinationsImageAPI
-
-from io import BytesIO
-from PIL import Image
+from utils.provider_router import ProviderRouter
+from utils.admission import single_flight
+from utils.lazy import LazyProxy
+from commands.greetings.greeting_assets import greeting_assets
+from commands.greetings.image_pool import ImagePool, GREETING_IMAGE_SOURCE
+from utils.image_pipeline import process_image, process_image_async, cap_caption
+from utils.metrics import record_loop_iteration
+from utils.leader import is_leader
+from utils.lifecycle import TaskTracker
 
 
 router = Router()
@@ -24,26 +27,91 @@ logger = logging.getLogger(__name__)
 
 ADMIN_ID = int(os.getenv('ADMIN_ID', '0'))
 NOTIFICATION_CHAT_ID = os.getenv('NOTIFICATION_CHAT_ID', '0')
+GREETING_PREGENERATE_INTERVAL = int(os.getenv('GREETING_PREGENERATE_INTERVAL', '30'))
+GREETING_STARTUP_DELAY = int(os.getenv('GREETING_STARTUP_DELAY', '30'))
+MOSCOW_TZ = tz.gettz("Europe/Moscow")
 
-text_gen = OpenRouterTextGenerator(
-    api_key=os.getenv('OPENROUTER_API_KEY'),
-    model=os.getenv('OPENROUTER_MODEL', 'x-ai/grok-2-1212')
-)
+# Клиенты провайдеров, планировщик и пул создаются при первом использовании:
+# их модули тянут requests, httpx и APScheduler, а запуск бота ждать этого не должен.
 
-image_api = PollinationsImageAPI()
-logger.info("✅ Система генерации изображений Pollinations.ai инициализирована (без API ключей)")
+def _create_text_gen():
+    from utils.openrouter_text_generator import OpenRouterTextGenerator
+    from utils.text_queue import TextQueue
 
-scheduler = AsyncIOScheduler()
+    return OpenRouterTextGenerator(
+        api_key=os.getenv('OPENROUTER_API_KEY'),
+        model=os.getenv('OPENROUTER_MODEL', 'x-ai/grok-2-1212'),
+        text_queue=TextQueue()
+    )
 
 
-def normalize_image(image_bytes: bytes) -> bytes | None:
-    try:
-        img = Image.open(BytesIO(image_bytes))
-        out = BytesIO()
-        img.convert("RGB").save(out, format="JPEG", quality=90)
-        return out.getvalue()
-    except Exception:
+def _create_image_api():
+    from utils.pollinations_image import PollinationsImageAPI
+
+    return PollinationsImageAPI()
+
+
+def _create_wispbyte_gen():
+    if not (os.getenv('WISPBYTE_API_URL') and os.getenv('WISPBYTE_API_KEY')):
         return None
+    from utils.text_generator import TextGenerator
+
+    return TextGenerator()
+
+
+def _create_fusion_api():
+    if not (os.getenv('FUSIONBRAIN_API_KEY') and os.getenv('FUSIONBRAIN_SECRET_KEY')):
+        return None
+    from utils.fusion_brain import FusionBrainAPI
+
+    return FusionBrainAPI(
+        url=os.getenv('FUSIONBRAIN_URL', 'https://api-key.fusionbrain.ai/'),
+        api_key=os.getenv('FUSIONBRAIN_API_KEY'),
+        secret_key=os.getenv('FUSIONBRAIN_SECRET_KEY')
+    )
+
+
+def _create_text_router() -> ProviderRouter:
+    providers = ProviderRouter(
+        "text",
+        min_hedge_delay=float(os.getenv('TEXT_HEDGE_DELAY', '5')),
+        deadline=float(os.getenv('TEXT_ROUTER_DEADLINE', '30'))
+    )
+    if text_gen.api_key:
+        providers.add("openrouter", text_gen.agenerate_text)
+    if wispbyte_gen:
+        providers.add("wispbyte", wispbyte_gen.agenerate_text)
+    return providers
+
+
+def _create_image_router() -> ProviderRouter:
+    providers = ProviderRouter(
+        "image",
+        min_hedge_delay=float(os.getenv('IMAGE_HEDGE_DELAY', '60')),
+        deadline=float(os.getenv('IMAGE_ROUTER_DEADLINE', '240'))
+    )
+    providers.add("huggingface", image_api.generate_image_bytes)
+    if fusion_api:
+        providers.add("fusionbrain", fusion_api.generate_image_bytes)
+    return providers
+
+
+def _create_scheduler():
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+    return AsyncIOScheduler()
+
+
+text_gen = LazyProxy(_create_text_gen, "greetings.text_gen")
+image_api = LazyProxy(_create_image_api, "greetings.image_api")
+wispbyte_gen = LazyProxy(_create_wispbyte_gen, "greetings.wispbyte_gen")
+fusion_api = LazyProxy(_create_fusion_api, "greetings.fusion_api")
+text_router = LazyProxy(_create_text_router, "greetings.text_router")
+image_router = LazyProxy(_create_image_router, "greetings.image_router")
+scheduler = LazyProxy(_create_scheduler, "greetings.scheduler")
+image_pool = LazyProxy(lambda: ImagePool(process_image), "greetings.image_pool")
+# Запущенные планировщиком задания: AsyncIOScheduler.shutdown их не ждет
+greeting_jobs = TaskTracker("задание приветствий")
 
 
 def get_image_prompt(kind: Literal["morning", "evening"]) -> str:
@@ -101,41 +169,166 @@ def get_tomorrow_schedule() -> str:
         return "\n\n📅 <b>Не удалось загрузить расписание на завтра</b>"
 
 
+def get_send_time(kind: Literal["morning", "evening"]) -> tuple[int, int]:
+    if kind == "morning":
+        value = os.getenv('MORNING_TIME', '08:00')
+    else:
+        value = os.getenv('EVENING_TIME', '22:00')
+    hour, minute = map(int, value.split(':'))
+    return hour, minute
+
+
+def get_next_send_date(kind: Literal["morning", "evening"]) -> datetime.date:
+    hour, minute = get_send_time(kind)
+    now = datetime.datetime.now(MOSCOW_TZ)
+    send_at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if now < send_at:
+        return send_at.date()
+    return send_at.date() + datetime.timedelta(days=1)
+
+
+async def build_greeting_caption(kind: Literal["morning", "evening"], text: str) -> str:
+    if kind == "evening":
+        # Расписание всегда берем свежее, а не из заготовки
+        schedule_text = await asyncio.to_thread(get_tomorrow_schedule)
+        text = text + schedule_text
+
+    caption = cap_caption(text)
+    if caption != text:
+        logger.warning(f"Текст слишком длинный ({len(text)} символов), обрезан до лимита подписи")
+    return caption
+
+
+async def generate_greeting_text(kind: Literal["morning", "evening"]) -> str:
+    text = text_gen.take_queued(kind)
+    if text:
+        return text
+
+    text = await text_router.call(kind)
+    return text or text_gen.fallback_text(kind)
+
+
+async def generate_greeting_image(kind: Literal["morning", "evening"]) -> bytes | None:
+    if GREETING_IMAGE_SOURCE == "pool":
+        return None
+
+    image_bytes = await image_router.call(get_image_prompt(kind))
+    image_bytes = await process_image_async(image_bytes) if image_bytes else None
+    if image_bytes:
+        await asyncio.to_thread(image_pool.add, image_bytes)
+    return image_bytes
+
+
+def pick_pool_photo() -> tuple[str | None, str | FSInputFile | None]:
+    pooled = image_pool.pick()
+    if not pooled:
+        return None, None
+    logger.info(f"Берем изображение из пула: {pooled['name']}")
+    return pooled["name"], pooled["file_id"] or FSInputFile(pooled["path"], filename="greeting.jpg")
+
+
+async def pregenerate_greeting(kind: Literal["morning", "evening"]):
+    target_date = get_next_send_date(kind).isoformat()
+    with_image = GREETING_IMAGE_SOURCE != "pool"
+    if greeting_assets.is_complete(kind, target_date, with_image=with_image):
+        return
+    
+    prepared = greeting_assets.get(kind, target_date) or {}
+    
+    if not prepared.get("text"):
+        text = await generate_greeting_text(kind)
+        if text and text.strip() and not text_gen.is_fallback_text(kind, text):
+            greeting_assets.save_text(kind, target_date, text.strip())
+            logger.info(f"Текст {kind} приветствия на {target_date} подготовлен")
+        else:
+            logger.warning(f"Не удалось подготовить текст {kind} приветствия, повторим позже")
+    
+    if with_image and not greeting_assets.image_path(prepared):
+        image_bytes = await generate_greeting_image(kind)
+        if image_bytes:
+            greeting_assets.save_image(kind, target_date, image_bytes)
+            logger.info(f"Изображение {kind} приветствия на {target_date} подготовлено")
+        else:
+            logger.warning(f"Не удалось подготовить изображение {kind} приветствия, повторим позже")
+
+
+async def pregenerate_greetings():
+    # Подготовка повторится на следующем запуске, ждать ее при остановке незачем
+    greeting_jobs.track("pregenerate", interruptible=True)
+    await asyncio.to_thread(image_pool.ensure_seeded)
+    failed = False
+    
+    try:
+        await text_gen.top_up_text_queue()
+    except Exception as e:
+        failed = True
+        logger.error(f"Ошибка пополнения очереди текстов: {e}", exc_info=True)
+    
+    for kind in ("morning", "evening"):
+        try:
+            await pregenerate_greeting(kind)
+        except Exception as e:
+            failed = True
+            logger.error(f"Ошибка подготовки {kind} приветствия: {e}", exc_info=True)
+    
+    record_loop_iteration("greetings_pregenerate", failed)
+
+
 async def send_greeting_message(bot, kind: Literal["morning", "evening"]):
+    greeting_jobs.track(f"send {kind}")
     if NOTIFICATION_CHAT_ID == '0':
         logger.warning("NOTIFICATION_CHAT_ID не установлен")
         return
 
+    target_date = datetime.datetime.now(MOSCOW_TZ).date().isoformat()
+    prepared = greeting_assets.get(kind, target_date) or {}
+
     try:
-        logger.info(f"Генерируем текст для {kind} приветствия...")
-        text = text_gen.generate_greeting(kind)
+        text = prepared.get("text")
+        if text:
+            logger.info(f"Используем заранее подготовленный текст для {kind} приветствия")
+        else:
+            logger.info(f"Генерируем текст для {kind} приветствия...")
+            text = await generate_greeting_text(kind)
 
         if not text or len(text.strip()) == 0:
             logger.error("Сгенерированный текст пустой!")
             text = "Доброе утро! 🌅" if kind == "morning" else "Спокойной ночи! 🌙"
 
-        if kind == "evening":
-            schedule_text = get_tomorrow_schedule()
-            text = text + schedule_text
-
-        if len(text) > 1024:
-            logger.warning(f"Текст слишком длинный ({len(text)} символов), обрезаем до 1020")
-            text = text[:1020] + "..."
-
-        logger.info(f"Генерируем изображение для {kind}...")
-        image_prompt = get_image_prompt(kind)
+        text = await build_greeting_caption(kind, text)
+
+        photo = None
+        pool_name = None
+        image_path = greeting_assets.image_path(prepared) if prepared else None
+        if prepared.get("file_id"):
+            photo = prepared["file_id"]
+        elif image_path:
+            photo = FSInputFile(image_path, filename="greeting.jpg")
+        else:
+            logger.info(f"Генерируем изображение для {kind}...")
+            image_bytes = await generate_greeting_image(kind)
+            if image_bytes:
+                photo = BufferedInputFile(image_bytes, filename="greeting.jpg")
+            else:
+                pool_name, photo = pick_pool_photo()
 
-        image_bytes = image_api.generate_image_bytes(image_prompt)
-        image_bytes = normalize_image(image_bytes) if image_bytes else None
+        # Генерация могла занять минуты: за это время лидерство могло перейти к другому экземпляру
+        if not is_leader():
+            logger.warning(f"Аренда лидера истекла, {kind} приветствие не отправлено")
+            return
 
-        if image_bytes:
-            photo = BufferedInputFile(image_bytes, filename="greeting.jpg")
-            await bot.send_photo(
+        if photo:
+            sent = await bot.send_photo(
                 chat_id=NOTIFICATION_CHAT_ID,
                 photo=photo,
                 caption=text,
                 parse_mode="HTML"
             )
+            file_id = sent.photo[-1].file_id if sent.photo else None
+            if image_path and file_id:
+                greeting_assets.set_file_id(kind, target_date, file_id)
+            if pool_name:
+                image_pool.mark_used(pool_name, file_id)
             logger.info("Отправлено приветствие с изображением")
             return  
 
@@ -150,6 +343,17 @@ async def send_greeting_message(bot, kind: Literal["morning", "evening"]):
         logger.error(f"Ошибка отправки приветствия: {e}", exc_info=True)
 
 
+async def render_preview(kind: Literal["morning", "evening"]) -> tuple[str, bytes | None]:
+    text = await generate_greeting_text(kind)
+    
+    if not text or len(text.strip()) == 0:
+        text = "Доброе утро! 🌅" if kind == "morning" else "Спокойной ночи! 🌙"
+    
+    text = await build_greeting_caption(kind, text)
+    image_bytes = await generate_greeting_image(kind)
+    return text, image_bytes
+
+
 @router.message(Command("preview"))
 async def preview_greeting(message: Message):
     if message.from_user.id != ADMIN_ID:
@@ -170,23 +374,15 @@ async def preview_greeting(message: Message):
     )
     
     try:
-        text = text_gen.generate_greeting(kind)
-        
-        if not text or len(text.strip()) == 0:
-            text = "Доброе утро! 🌅" if kind == "morning" else "Спокойной ночи! 🌙"
-        
-        if kind == "evening":
-            schedule_text = get_tomorrow_schedule()
-            text = text + schedule_text
-        
-        if len(text) > 1024:
-            text = text[:1020] + "..."
-        
-        image_prompt = get_image_prompt(kind)
-        image_bytes = image_api.generate_image_bytes(image_prompt)
+        # Повторный /preview того же вида, пока готовится первый, получит тот же пост
+        text, image_bytes = await single_flight.run(("preview", kind), lambda: render_preview(kind))
         
         if image_bytes:
             photo = BufferedInputFile(image_bytes, filename="preview.jpg")
+        else:
+            _, photo = pick_pool_photo()
+        
+        if photo:
             await message.answer_photo(photo=photo, caption=text, parse_mode="HTML")
             return
         
@@ -208,11 +404,20 @@ async def show_greeting_schedule(message: Message):
     morning_time = os.getenv('MORNING_TIME', '08:00')
     evening_time = os.getenv('EVENING_TIME', '22:00')
     
+    prepared_lines = []
+    for kind, title in (("morning", "🌅"), ("evening", "🌙")):
+        target_date = get_next_send_date(kind).isoformat()
+        entry = greeting_assets.get(kind, target_date) or {}
+        text_status = "✅" if entry.get("text") else "⏳"
+        image_status = "✅" if greeting_assets.image_path(entry) else "⏳"
+        prepared_lines.append(f"{title} {target_date}: текст {text_status}, картинка {image_status}")
+    
     await message.answer(
         f"📅 <b>Расписание приветствий:</b>\n\n"
         f"🌅 Доброе утро: {morning_time}\n"
         f"🌙 Спокойной ночи: {evening_time}\n"
         f"   (с расписанием на следующий день)\n\n"
+        f"<b>Подготовлено заранее:</b>\n" + "\n".join(prepared_lines) + "\n\n"
         f"Чат: {NOTIFICATION_CHAT_ID}\n\n"
         f"Для изменения расписания отредактируйте переменные окружения "
         f"MORNING_TIME и EVENING_TIME в формате HH:MM",
@@ -232,12 +437,31 @@ async def check_greeting_config(message: Message):
     status.append(f"🤖 BOT_TOKEN: {'✅ Настроен' if bot_token else '❌ Не найден'}")
     
     status.append(f"🎨 Генерация изображений: ✅ Pollinations.ai (без API ключей)")
+    status.append(f"🖼 Источник картинок: {GREETING_IMAGE_SOURCE}, в пуле: {len(image_pool)}")
     
     openrouter_key = os.getenv('OPENROUTER_API_KEY')
     openrouter_model = os.getenv('OPENROUTER_MODEL', 'x-ai/grok-2-1212')
     status.append(f"🔐 OPENROUTER_API_KEY: {'✅ Настроен' if openrouter_key else '❌ Не найден'}")
     status.append(f"🤖 OPENROUTER_MODEL: {openrouter_model}")
     
+    stats = text_gen.get_stats()
+    avg_latency = f"{stats['avg_latency']:.1f}с" if stats["avg_latency"] is not None else "—"
+    status.append(
+        f"📈 OpenRouter: запросов {stats['requests']}, успешно {stats['success']}, "
+        f"ошибок {stats['errors']} (таймаутов {stats['timeouts']}), "
+        f"пропущено {stats['short_circuited']}, средняя задержка {avg_latency}, "
+        f"breaker: {stats['breaker_state']}"
+    )
+    status.append(
+        f"📝 Очередь текстов: утро {text_gen.text_queue.size('morning')}, "
+        f"вечер {text_gen.text_queue.size('evening')}"
+    )
+    
+    status.append("\n<b>Провайдеры текста:</b>")
+    status.extend(text_router.describe() or ["❌ Не настроены"])
+    status.append("\n<b>Провайдеры изображений:</b>")
+    status.extend(image_router.describe())
+    
     status.append(f"💬 NOTIFICATION_CHAT_ID: {'✅ ' + NOTIFICATION_CHAT_ID if NOTIFICATION_CHAT_ID != '0' else '❌ Не настроен'}")
     
     status.append(f"👨‍💼 ADMIN_ID: {'✅ ' + str(ADMIN_ID) if ADMIN_ID != 0 else '❌ Не настроен'}")
@@ -265,14 +489,34 @@ async def check_greeting_config(message: Message):
     await message.answer(config_text, parse_mode="HTML")
 
 
+async def close_providers():
+    # Закрываем только те клиенты, которые успели создаться
+    for provider in (image_api, text_gen, wispbyte_gen, fusion_api):
+        if provider.lazy_initialized and provider:
+            await provider.close()
+
+
+async def flush_stores():
+    # Индексы пишутся в фоне (SnapshotSaver): дожидаемся последней записи
+    if greeting_assets.lazy_initialized:
+        await greeting_assets.flush()
+    if image_pool.lazy_initialized:
+        await image_pool.flush()
+    if text_gen.lazy_initialized and text_gen.text_queue:
+        await text_gen.text_queue.flush()
+
+
 def setup_scheduler(bot):
+    from apscheduler.triggers.cron import CronTrigger
+    from apscheduler.triggers.interval import IntervalTrigger
+
     morning_time = os.getenv('MORNING_TIME', '08:00')
     evening_time = os.getenv('EVENING_TIME', '22:00')
     
-    morning_hour, morning_minute = map(int, morning_time.split(':'))
-    evening_hour, evening_minute = map(int, evening_time.split(':'))
+    morning_hour, morning_minute = get_send_time("morning")
+    evening_hour, evening_minute = get_send_time("evening")
     
-    moscow_tz = tz.gettz("Europe/Moscow")
+    moscow_tz = MOSCOW_TZ
     
     scheduler.add_job(
         send_greeting_message,
@@ -290,10 +534,43 @@ def setup_scheduler(bot):
         replace_existing=True
     )
     
+    # Подготовка текста и картинки заранее; неудачные попытки повторяются на следующем запуске.
+    # Первый запуск откладывается, чтобы не конкурировать с обработкой первых обновлений.
+    scheduler.add_job(
+        pregenerate_greetings,
+        IntervalTrigger(minutes=GREETING_PREGENERATE_INTERVAL, timezone=moscow_tz),
+        id="pregenerate_greetings",
+        next_run_time=datetime.datetime.now(moscow_tz) + datetime.timedelta(seconds=GREETING_STARTUP_DELAY),
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    
     logger.info(f"✅ Планировщик приветствий настроен: утро - {morning_time}, вечер - {evening_time} (МСК)")
 
 
 def start_scheduler():
+    from apscheduler.schedulers.base import STATE_PAUSED
+
     if not scheduler.running:
         scheduler.start()
         logger.info("✅ Планировщик приветствий запущен")
+    elif scheduler.state == STATE_PAUSED:
+        scheduler.resume()
+        logger.info("✅ Планировщик приветствий возобновлен")
+
+
+def pause_scheduler():
+    # Экземпляр перестал быть лидером: задания остаются, но не запускаются
+    if scheduler.lazy_initialized and scheduler.running:
+        scheduler.pause()
+        logger.info("Планировщик приветствий приостановлен")
+
+
+async def stop_scheduler():
+    # shutdown(wait=False) только перестает запускать задания: для AsyncIOExecutor
+    # wait не действует, начатые задания дожидаемся сами (в пределах срока остановки)
+    if scheduler.lazy_initialized and scheduler.running:
+        scheduler.shutdown(wait=False)
+        logger.info("Планировщик приветствий остановлен")
+    await greeting_jobs.drain()
@@ -0,0 +1,154 @@
+"""
+Пул готовых картинок для приветствий: каждая удачная генерация сохраняется
+в уже нормализованном JPEG, после первой загрузки запоминается её file_id.
+Если провайдер недоступен, берется давно не использованная картинка из пула.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from utils.journal import SnapshotSaver
+
+logger = logging.getLogger(__name__)
+
+POOL_DIR = "data/greetings/pool"
+SEED_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "test", "mirea_cats")
+POOL_MAX_IMAGES = int(os.getenv("GREETING_POOL_MAX_IMAGES", "200"))
+
+# generate — генерировать, пул только при ошибке провайдера; pool — всегда брать из пула
+GREETING_IMAGE_SOURCE = os.getenv("GREETING_IMAGE_SOURCE", "generate").lower()
+
+
+class ImagePool:
+
+    def __init__(self, normalize: Callable[[bytes], Optional[bytes]], directory: str = POOL_DIR,
+                 seed_dir: str = SEED_DIR):
+        self.normalize = normalize
+        self.directory = os.path.abspath(directory)
+        self.seed_dir = seed_dir
+        self.index_file = os.path.join(self.directory, "index.json")
+        os.makedirs(self.directory, exist_ok=True)
+        self.images: Dict[str, dict] = self._load()
+        # add и ensure_seeded выполняются в потоке (to_thread), pick и mark_used — на цикле
+        # событий; блокировка держится только на время работы со словарем, без файлового I/O
+        self._lock = threading.Lock()
+        # С цикла событий (mark_used) индекс записывается в потоке
+        self._saver = SnapshotSaver(self.index_file, self._snapshot, "пула изображений")
+
+    def _load(self) -> Dict[str, dict]:
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    return json.load(f).get("images", {})
+            except Exception as e:
+                logger.error(f"Ошибка загрузки пула изображений: {e}", exc_info=True)
+        return {}
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {"images": {name: dict(info) for name, info in self.images.items()}}
+
+    def _save(self):
+        self._saver.save()
+
+    async def flush(self):
+        await self._saver.flush()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.images)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def ensure_seeded(self) -> int:
+        """Заполняет пустой пул картинками из test/mirea_cats (блокирующая операция)."""
+        if len(self) or not os.path.isdir(self.seed_dir):
+            return 0
+
+        added = 0
+        for filename in sorted(os.listdir(self.seed_dir)):
+            if not filename.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
+                continue
+            try:
+                with open(os.path.join(self.seed_dir, filename), 'rb') as f:
+                    image_bytes = self.normalize(f.read())
+            except OSError as e:
+                logger.warning(f"Не удалось прочитать {filename}: {e}")
+                continue
+            if image_bytes:
+                self._store(image_bytes, source="seed", save=False)
+                added += 1
+
+        if added:
+            self._save()
+            logger.info(f"Пул изображений заполнен из {self.seed_dir}: {added} шт.")
+        return added
+
+    def _store(self, image_bytes: bytes, source: str, save: bool = True) -> str:
+        name = f"{uuid.uuid4().hex[:12]}.jpg"
+        with open(self.path(name), 'wb') as f:
+            f.write(image_bytes)
+
+        with self._lock:
+            self.images[name] = {
+                "source": source,
+                "file_id": None,
+                "added_at": time.time(),
+                "last_used_at": None,
+                "uses": 0
+            }
+            evicted = self._evict()
+        for old_name in evicted:
+            try:
+                os.remove(self.path(old_name))
+            except OSError:
+                pass
+        if save:
+            self._save()
+        return name
+
+    def add(self, image_bytes: bytes, source: str = "generated") -> str:
+        """Добавляет уже нормализованную картинку."""
+        return self._store(image_bytes, source)
+
+    def _evict(self) -> List[str]:
+        """Убирает лишние записи из индекса (под блокировкой), файлы удаляет вызывающий."""
+        overflow = len(self.images) - POOL_MAX_IMAGES
+        if overflow <= 0:
+            return []
+
+        # Первыми уходят самые давно использованные сгенерированные картинки
+        candidates = sorted(
+            (name for name, info in self.images.items() if info["source"] != "seed"),
+            key=lambda name: self.images[name]["last_used_at"] or self.images[name]["added_at"]
+        )
+        for name in candidates[:overflow]:
+            del self.images[name]
+        return candidates[:overflow]
+
+    def pick(self) -> Optional[dict]:
+        """Самая давно не использованная картинка из пула."""
+        with self._lock:
+            images = {name: dict(info) for name, info in self.images.items()}
+        available = [name for name in images if os.path.exists(self.path(name))]
+        if not available:
+            return None
+
+        name = min(available, key=lambda n: (images[n]["last_used_at"] or 0, images[n]["added_at"]))
+        return {"name": name, "path": self.path(name), **images[name]}
+
+    def mark_used(self, name: str, file_id: Optional[str] = None):
+        with self._lock:
+            info = self.images.get(name)
+            if not info:
+                return
+            info["last_used_at"] = time.time()
+            info["uses"] = info.get("uses", 0) + 1
+            if file_id:
+                info["file_id"] = file_id
+        self._save()
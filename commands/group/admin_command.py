@@ -38,7 +38,8 @@ async def cmd_admin(message: Message, state: FSMContext):
         inline_keyboard=[[
             InlineKeyboardButton(text="✏️ Изменить данные участника", callback_data="admin_edit_member")],
             [InlineKeyboardButton(text="👥 Список всех участников", callback_data="admin_list_members")],
-            [InlineKeyboardButton(text="👔 Управление ролями", callback_data="admin_roles")]
+            [InlineKeyboardButton(text="👔 Управление ролями", callback_data="admin_roles")],
+            [InlineKeyboardButton(text="📭 Недоступные получатели", callback_data="admin_dead_recipients")]
         ]
     )
     
@@ -204,14 +205,8 @@ async def process_notifications_choice(callback: CallbackQuery, state: FSMContex
     data = await state.get_data()
     user_id = data.get("edit_user_id")
     
-    member = group_manager.get_member(user_id)
-    notifications = member.get('notifications', {})
-    
     notifications_enabled = callback.data == "notif_on"
-    for key in notifications:
-        notifications[key] = notifications_enabled
-    
-    group_manager.update_member(user_id, notifications=notifications)
+    group_manager.set_all_notifications(user_id, notifications_enabled)
     
     status = "включены" if notifications_enabled else "выключены"
     
@@ -416,6 +411,49 @@ async def admin_roles(callback: CallbackQuery):
     await callback.answer()
 
 
+DELIVERY_ERROR_TITLES = {
+    "forbidden": "заблокировал бота",
+    "chat_not_found": "не открывал чат с ботом",
+    "deactivated": "аккаунт удален"
+}
+
+
+@router.callback_query(F.data == "admin_dead_recipients")
+async def admin_dead_recipients(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    dead = group_manager.get_dead_recipients()
+    
+    text = "📭 <b>Недоступные получатели</b>\n\n"
+    
+    if dead:
+        for member in dead:
+            delivery = member["delivery"]
+            reason = DELIVERY_ERROR_TITLES.get(delivery.get("error_class"), delivery.get("error_class"))
+            last_failure = delivery.get("last_failure_at", "")[:16].replace("T", " ")
+            text += (
+                f"  • {member['full_name']} (ID: <code>{member['user_id']}</code>)\n"
+                f"    {reason}, ошибок: {delivery.get('failures', 0)}, последняя: {last_failure}\n"
+            )
+        text += (
+            f"\n<b>Всего:</b> {len(dead)}\n\n"
+            f"<i>Рассылки этим участникам не отправляются, пока они снова не напишут боту /start.</i>"
+        )
+    else:
+        text += "Все участники получают рассылки."
+    
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[[
+            InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin")
+        ]]
+    )
+    
+    await callback.message.edit_text(text, reply_markup=keyboard)
+    await callback.answer()
+
+
 @router.callback_query(F.data == "back_to_admin")
 async def back_to_admin(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
@@ -426,7 +464,8 @@ async def back_to_admin(callback: CallbackQuery):
         inline_keyboard=[[
             InlineKeyboardButton(text="✏️ Изменить данные участника", callback_data="admin_edit_member")],
             [InlineKeyboardButton(text="👥 Список всех участников", callback_data="admin_list_members")],
-            [InlineKeyboardButton(text="👔 Управление ролями", callback_data="admin_roles")]
+            [InlineKeyboardButton(text="👔 Управление ролями", callback_data="admin_roles")],
+            [InlineKeyboardButton(text="📭 Недоступные получатели", callback_data="admin_dead_recipients")]
         ]
     )
     
@@ -1,9 +1,21 @@
+import asyncio
+import copy
 import json
+import logging
 import os
 from typing import Dict, List, Optional
 from enum import Enum
 from datetime import datetime
 
+from utils.journal import write_snapshot
+from utils.lazy import LazyProxy
+from utils.metrics import STORAGE_SAVES
+
+logger = logging.getLogger(__name__)
+
+# Изменения реестра копятся в памяти и пишутся на диск не чаще раза в GROUP_FLUSH_DELAY секунд
+GROUP_FLUSH_DELAY = float(os.environ.get("GROUP_FLUSH_DELAY", "1.0"))
+
 
 class Role(str, Enum):
     STAROSTA = "Староста"
@@ -13,34 +25,85 @@ class Role(str, Enum):
     GUEST = "Гость"
 
 
+# Ошибки доставки, после которых писать пользователю бессмысленно,
+# пока он сам снова не откроет бота
+DEAD_ERROR_CLASSES = ("forbidden", "chat_not_found", "deactivated")
+
+
 class GroupManager:
     
-    def __init__(self, data_file: str = "data/group_data.json"):
+    def __init__(self, data_file: str = "data/group_data.json", flush_delay: float = GROUP_FLUSH_DELAY):
         self.data_file = data_file
+        self.flush_delay = flush_delay
+        self._data: Optional[dict] = None
+        self._mtime: Optional[int] = None
+        self._dirty = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
         self._ensure_data_file()
     
     def _ensure_data_file(self):
         os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
         if not os.path.exists(self.data_file):
-            self._save_data({"members": {}})
+            self._data = {"members": {}}
+            self._dirty = True
+            self.flush()
     
-    def _load_data(self) -> dict:
+    def _get_mtime(self) -> Optional[int]:
         try:
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {"members": {}}
+            return os.stat(self.data_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _load_data(self) -> dict:
+        # Файл перечитывается, только если его изменили снаружи, а у нас нет несохраненных правок
+        if self._data is None or (not self._dirty and self._get_mtime() != self._mtime):
+            try:
+                with open(self.data_file, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._data = {"members": {}}
+            self._mtime = self._get_mtime()
+        return self._data
     
     def _save_data(self, data: dict):
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        self._data = data
+        self._dirty = True
+        STORAGE_SAVES.inc("group_data", "requested")
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        
+        if loop is None or self.flush_delay <= 0:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_delay, self.flush)
+    
+    def flush(self):
+        """Записывает накопленные изменения реестра одним снимком."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._dirty:
+            return
+        
+        try:
+            write_snapshot(os.path.abspath(self.data_file), self._data)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения реестра группы: {e}", exc_info=True)
+            return
+        self._dirty = False
+        self._mtime = self._get_mtime()
+        STORAGE_SAVES.inc("group_data", "written")
     
     def get_member(self, user_id: int) -> Optional[dict]:
         data = self._load_data()
-        return data["members"].get(str(user_id))
+        # Копия: вызывающий код может менять запись, не сохраняя ее
+        return copy.deepcopy(data["members"].get(str(user_id)))
     
     def is_member_registered(self, user_id: int) -> bool:
-        return self.get_member(user_id) is not None
+        return str(user_id) in self._load_data()["members"]
     
     def add_member(self, user_id: int, telegram_username: Optional[str], 
                    full_name: str, birth_date: str, notifications: dict,
@@ -86,18 +149,98 @@ class GroupManager:
         self._save_data(data)
         return True
     
+    def set_all_notifications(self, user_id: int, enabled: bool) -> bool:
+        """Включает или выключает все уведомления участника за одно чтение реестра."""
+        data = self._load_data()
+        member = data["members"].get(str(user_id))
+        if member is None:
+            return False
+        
+        notifications = member.get("notifications", {})
+        for key in notifications:
+            notifications[key] = enabled
+        member["notifications"] = notifications
+        
+        self._save_data(data)
+        return True
+    
     def get_all_members(self) -> Dict[str, dict]:
         data = self._load_data()
-        return data["members"]
+        return copy.deepcopy(data["members"])
     
     def get_members_by_role(self, role: Role) -> List[dict]:
         data = self._load_data()
-        return [member for member in data["members"].values() 
+        return [copy.deepcopy(member) for member in data["members"].values() 
                 if member["role"] == role.value]
     
+    def get_subscribers(self, category: str, include_dead: bool = False) -> List[int]:
+        data = self._load_data()
+        return [int(member_id) for member_id, member in data["members"].items()
+                if member.get("notifications", {}).get(category, False)
+                and (include_dead or not self._is_dead(member))]
+    
+    @staticmethod
+    def _is_dead(member: dict) -> bool:
+        return member.get("delivery", {}).get("status") == "dead"
+    
+    def is_dead_recipient(self, user_id: int) -> bool:
+        member = self._load_data()["members"].get(str(user_id))
+        return member is not None and self._is_dead(member)
+    
+    def record_delivery_results(self, failures: Dict[int, str], successes: List[int]) -> int:
+        """
+        Сохраняет итоги рассылки: failures — {user_id: класс ошибки}.
+        Возвращает количество участников, помеченных недоступными.
+        """
+        data = self._load_data()
+        changed = False
+        marked_dead = 0
+        now = datetime.now().isoformat()
+        
+        for user_id, error_class in failures.items():
+            member = data["members"].get(str(user_id))
+            if not member or error_class not in DEAD_ERROR_CLASSES:
+                continue
+            
+            delivery = member.setdefault("delivery", {})
+            if delivery.get("status") != "dead":
+                marked_dead += 1
+            delivery["status"] = "dead"
+            delivery["error_class"] = error_class
+            delivery["failures"] = delivery.get("failures", 0) + 1
+            delivery["last_failure_at"] = now
+            changed = True
+        
+        for user_id in successes:
+            member = data["members"].get(str(user_id))
+            if member and "delivery" in member:
+                del member["delivery"]
+                changed = True
+        
+        if changed:
+            self._save_data(data)
+        return marked_dead
+    
+    def record_delivery_failure(self, user_id: int, error_class: str) -> bool:
+        return self.record_delivery_results({user_id: error_class}, []) > 0
+    
+    def reactivate_recipient(self, user_id: int) -> bool:
+        data = self._load_data()
+        member = data["members"].get(str(user_id))
+        if not member or "delivery" not in member:
+            return False
+        
+        del member["delivery"]
+        self._save_data(data)
+        return True
+    
+    def get_dead_recipients(self) -> List[dict]:
+        data = self._load_data()
+        return [copy.deepcopy(member) for member in data["members"].values() if self._is_dead(member)]
+    
     def get_headman(self) -> Optional[dict]:
         headmen = self.get_members_by_role(Role.STAROSTA)
         return headmen[0] if headmen else None
 
 
-group_manager = GroupManager()
+group_manager = LazyProxy(GroupManager, "group_manager")
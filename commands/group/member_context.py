@@ -0,0 +1,50 @@
+"""
+Контекст участника группы: запись из реестра и роль загружаются один раз на
+обновление и передаются обработчикам как данные `member` и `role`.
+
+Обработчику достаточно объявить параметры:
+
+    async def handler(message: Message, member: Optional[dict] = None, role: Optional[str] = None)
+
+Ограничение по ролям задается фильтром RoleFilter(Role.STAROSTA, ...).
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.filters import Filter
+from aiogram.types import TelegramObject, User
+
+from commands.group.group_manager import group_manager, Role
+
+# Староста, зам и профорг: управление ДЗ, файлами пар, уведомлениями и дайджестом
+MANAGER_ROLES = (Role.STAROSTA, Role.ZAM_STAROSTA, Role.PROFORG)
+
+
+def has_role(role: Optional[str], *roles: Role) -> bool:
+    return role is not None and role in roles
+
+
+class MemberContextMiddleware(BaseMiddleware):
+    """Внешний middleware на dp.update: одно обращение к реестру на обновление."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user: Optional[User] = data.get("event_from_user")
+        member = group_manager.get_member(user.id) if user else None
+        data["member"] = member
+        data["role"] = member.get("role") if member else None
+        return await handler(event, data)
+
+
+class RoleFilter(Filter):
+    """Пропускает обновление, если роль отправителя входит в перечисленные."""
+
+    def __init__(self, *roles: Role):
+        self.roles = roles
+
+    async def __call__(self, event: TelegramObject, role: Optional[str] = None) -> bool:
+        return has_role(role, *self.roles)
@@ -18,9 +18,10 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.enums import ChatType  
 from dateutil import tz
 
-from commands.group.group_manager import group_manager
-from commands.homework.homework_storage import HomeworkStorage
-from commands.schedule.schedule_storage import ScheduleStorage, ALL_SUBJECTS
+from commands.group.member_context import MANAGER_ROLES, RoleFilter, has_role
+from commands.homework.homework_storage import homework_storage
+from commands.schedule.schedule_storage import schedule_storage, ALL_SUBJECTS
+from utils.callback_coalescer import callback_coalescer
 from utils.calendar_keyboard import (
     CalendarKeyboard, format_date_ru
 )
@@ -30,8 +31,6 @@ logger = logging.getLogger(__name__)
 
 WEEKDAYS_RU = ["ПН", "ВТ", "СР", "ЧТ", "ПТ", "СБ", "ВС"]
 
-homework_storage = HomeworkStorage()
-schedule_storage = ScheduleStorage()
 
 quick_hw_pending = {}
 
@@ -120,7 +119,7 @@ def create_subjects_keyboard(page: int = 0, items_per_page: int = 8, prefix: str
 
 
 @router.message(Command("homework"))
-async def cmd_homework(message: Message):
+async def cmd_homework(message: Message, role: Optional[str] = None):
     homework_storage.reload_data()
     
     upcoming_hw = homework_storage.get_all_upcoming_homework()
@@ -151,7 +150,7 @@ async def cmd_homework(message: Message):
                     text += f"      ⚠️ {desc}\n"
                 text += "\n"
     
-    if is_headman_or_proforg(message.from_user.id):
+    if has_role(role, *MANAGER_ROLES):
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [
                 InlineKeyboardButton(text="📝 Добавить ДЗ", callback_data="start_add_hw"),
@@ -167,41 +166,41 @@ async def cmd_homework(message: Message):
 
 
 
-@router.message(F.text == "📝 Добавить ДЗ")
-async def handle_add_hw_button(message: Message, state: FSMContext):
-    """Обработка кнопки 'Добавить ДЗ'."""
+@router.message(F.text.in_({"📝 Добавить ДЗ", "📋 Добавить КМ"}), ~RoleFilter(*MANAGER_ROLES))
+async def handle_add_buttons_denied(message: Message):
     if message.chat.type != ChatType.PRIVATE:
         return
     
-    if not is_headman_or_proforg(message.from_user.id):
-        await message.answer("⛔ Эта функция доступна только старосте и профоргу.")
+    await message.answer("⛔ Эта функция доступна только старосте и профоргу.")
+
+
+@router.message(F.text == "📝 Добавить ДЗ", RoleFilter(*MANAGER_ROLES))
+async def handle_add_hw_button(message: Message, state: FSMContext):
+    """Обработка кнопки 'Добавить ДЗ'."""
+    if message.chat.type != ChatType.PRIVATE:
         return
     
     await start_add_homework(message, state)
 
 
-@router.message(F.text == "📋 Добавить КМ")
+@router.message(F.text == "📋 Добавить КМ", RoleFilter(*MANAGER_ROLES))
 async def handle_add_km_button(message: Message, state: FSMContext):
     if message.chat.type != ChatType.PRIVATE:
         return
     
-    if not is_headman_or_proforg(message.from_user.id):
-        await message.answer("⛔ Эта функция доступна только старосте и профоргу.")
-        return
-    
     await start_add_control_measure(message, state)
 
 
 @router.message(F.text == "📚 Текущие ДЗ")
-async def handle_view_hw_button(message: Message):
+async def handle_view_hw_button(message: Message, role: Optional[str] = None):
     if message.chat.type != ChatType.PRIVATE:
         return
     
-    await cmd_homework(message)
+    await cmd_homework(message, role)
 
 
 @router.message(F.text == "📊 Текущие КМ")
-async def handle_view_km_button(message: Message):
+async def handle_view_km_button(message: Message, role: Optional[str] = None):
     if message.chat.type != ChatType.PRIVATE:
         return
     
@@ -222,7 +221,7 @@ async def handle_view_km_button(message: Message):
                 text += f"      ⚠️ {desc}\n"
             text += "\n"
     
-    if is_headman_or_proforg(message.from_user.id):
+    if has_role(role, *MANAGER_ROLES):
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="📋 Добавить КМ", callback_data="start_add_km")],
             [InlineKeyboardButton(text="🗑 Управление КМ", callback_data="manage_km")]
@@ -233,23 +232,23 @@ async def handle_view_km_button(message: Message):
 
 
 
-@router.callback_query(F.data == "start_add_hw")
+@router.callback_query(
+    F.data.in_({"start_add_hw", "start_add_km", "manage_homework"}),
+    ~RoleFilter(*MANAGER_ROLES)
+)
+async def manager_callback_denied(callback: CallbackQuery):
+    await callback.answer("⛔ Только для старосты!", show_alert=True)
+
+
+@router.callback_query(F.data == "start_add_hw", RoleFilter(*MANAGER_ROLES))
 async def callback_start_add_hw(callback: CallbackQuery, state: FSMContext):
     """Начать добавление ДЗ через inline-кнопку."""
-    if not is_headman_or_proforg(callback.from_user.id):
-        await callback.answer("⛔ Только для старосты!", show_alert=True)
-        return
-    
     await callback.answer()
     await start_add_homework(callback.message, state, edit=True)
 
 
-@router.callback_query(F.data == "start_add_km")
+@router.callback_query(F.data == "start_add_km", RoleFilter(*MANAGER_ROLES))
 async def callback_start_add_km(callback: CallbackQuery, state: FSMContext):
-    if not is_headman_or_proforg(callback.from_user.id):
-        await callback.answer("⛔ Только для старосты!", show_alert=True)
-        return
-    
     await callback.answer()
     await start_add_control_measure(callback.message, state, edit=True)
 
@@ -274,12 +273,13 @@ async def hw_page_navigation(callback: CallbackQuery, state: FSMContext):
     await state.update_data(current_page=page)
     
     keyboard = create_subjects_keyboard(page=page, prefix="hw")
-    await callback.message.edit_text(
+    await callback.answer()
+    await callback_coalescer.edit_text(
+        callback,
         "📝 <b>Добавление домашнего задания</b>\n\n📚 Выберите предмет:",
         reply_markup=keyboard,
         parse_mode="HTML"
     )
-    await callback.answer()
 
 
 @router.callback_query(F.data == "hw_page_info")
@@ -449,12 +449,13 @@ async def km_page_navigation(callback: CallbackQuery, state: FSMContext):
     await state.update_data(current_page=page)
     
     keyboard = create_subjects_keyboard(page=page, prefix="km")
-    await callback.message.edit_text(
+    await callback.answer()
+    await callback_coalescer.edit_text(
+        callback,
         "📋 <b>Добавление контрольного мероприятия</b>\n\n📚 Выберите предмет:",
         reply_markup=keyboard,
         parse_mode="HTML"
     )
-    await callback.answer()
 
 
 @router.callback_query(F.data == "km_page_info")
@@ -606,12 +607,8 @@ async def km_cancel_confirm(callback: CallbackQuery, state: FSMContext):
 
 
 
-@router.callback_query(F.data == "manage_homework")
+@router.callback_query(F.data == "manage_homework", RoleFilter(*MANAGER_ROLES))
 async def manage_homework(callback: CallbackQuery):
-    if not is_headman_or_proforg(callback.from_user.id):
-        await callback.answer("⛔ Только для старосты!", show_alert=True)
-        return
-    
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🗑 Удалить ДЗ", callback_data="delete_hw_menu")],
         [InlineKeyboardButton(text="🗑 Удалить КМ", callback_data="delete_km_menu")],
@@ -1028,13 +1025,6 @@ async def quick_hw_cancel_general(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 
-def is_headman_or_proforg(user_id: int) -> bool:
-    user_data = group_manager.get_member(user_id)
-    if not user_data:
-        return False
-    return user_data.get("role") in ["Староста", "Профорг", "Зам старосты"]
-
-
 def _extract_subject_from_message(message_text: str) -> str:
 
     import re
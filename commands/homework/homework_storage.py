@@ -7,6 +7,9 @@ from datetime import datetime, date, timedelta
 from typing import Dict, List, Optional, Tuple
 from dateutil import tz
 
+from utils.journal import JOURNAL_ENABLED, JsonJournal, write_snapshot
+from utils.lazy import LazyProxy
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,10 +30,15 @@ class HomeworkStorage:
     def __init__(self, storage_file: str = "data/homework_data.json"):
         self.storage_file = os.path.abspath(storage_file)
         self.moscow_tz = tz.gettz("Europe/Moscow")
+        self._journal = JsonJournal(self.storage_file) if JOURNAL_ENABLED else None
         self.data = self._load_data()
         logger.info(f"HomeworkStorage инициализирован: {self.storage_file}")
+        
+        if self._journal and self._journal.needs_compaction():
+            self._save_data()
     
     def _load_data(self) -> Dict:
+        data = None
         if os.path.exists(self.storage_file):
             try:
                 with open(self.storage_file, 'r', encoding='utf-8') as f:
@@ -43,26 +51,44 @@ class HomeworkStorage:
                         data["last_sent_homework"] = None
                     if "last_sent_control" not in data:
                         data["last_sent_control"] = None
-                    return data
             except Exception as e:
                 logger.error(f"Ошибка загрузки данных: {e}", exc_info=True)
         
-        return {
-            "homework": {},
-            "control_measures": {},
-            "last_sent_homework": None,
-            "last_sent_control": None
-        }
+        if data is None:
+            data = {
+                "homework": {},
+                "control_measures": {},
+                "last_sent_homework": None,
+                "last_sent_control": None
+            }
+        
+        if self._journal:
+            self._journal.replay(data)
+        
+        return data
     
     def _save_data(self):
         try:
-            os.makedirs(os.path.dirname(self.storage_file), exist_ok=True)
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            if self._journal:
+                self._journal.write_snapshot(self.data)
+            else:
+                write_snapshot(self.storage_file, self.data)
             logger.info("Данные успешно сохранены")
         except Exception as e:
             logger.error(f"Ошибка сохранения: {e}", exc_info=True)
     
+    def _record(self, op: str, path: List[str], value=None):
+        if not self._journal:
+            self._save_data()
+            return
+        
+        try:
+            if self._journal.append(op, path, value):
+                self._save_data()
+        except Exception as e:
+            logger.error(f"Ошибка записи в журнал, сохраняем снимок целиком: {e}", exc_info=True)
+            self._save_data()
+    
     def reload_data(self):
         self.data = self._load_data()
     
@@ -91,7 +117,7 @@ class HomeworkStorage:
                 self.data["homework"][week_num][date_str][subject] = []
             
             self.data["homework"][week_num][date_str][subject].append(task)
-            self._save_data()
+            self._record("append", ["homework", week_num, date_str, subject], task)
             
             logger.info(f"Добавлено ДЗ: {subject} -> {task} к {date_str}")
             return True
@@ -178,7 +204,7 @@ class HomeworkStorage:
                 self.data["control_measures"][week_num][date_str][subject] = []
             
             self.data["control_measures"][week_num][date_str][subject].append(description)
-            self._save_data()
+            self._record("append", ["control_measures", week_num, date_str, subject], description)
             
             logger.info(f"Добавлено КМ: {subject} -> {description} на {date_str}")
             return True
@@ -309,4 +335,6 @@ class HomeworkStorage:
         }
 
 
-homework_storage = HomeworkStorage()
+# Один экземпляр на файл: журнал и снимок ведет только он. Отдельные экземпляры
+# сворачивали бы журнал каждый из своей копии данных и теряли чужие записи.
+homework_storage = LazyProxy(HomeworkStorage, "homework_storage")
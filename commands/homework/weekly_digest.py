@@ -14,9 +14,14 @@ from aiogram.types import (
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from commands.group.group_manager import group_manager, Role
-from commands.homework.homework_storage import HomeworkStorage, get_academic_week_number
+from commands.group.group_manager import group_manager
+from commands.group.member_context import MANAGER_ROLES, has_role
+from commands.homework.homework_storage import homework_storage, get_academic_week_number
 from commands.notifications.notifications import get_user_notifications
+from commands.notifications.broadcast_queue import get_broadcast_queue
+from utils.leader import is_leader
+from utils.lifecycle import interruptible_sleep
+from utils.metrics import record_loop_iteration
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -39,9 +44,10 @@ class WeeklyDigestNotifier:
     
     def __init__(self, bot: Bot):
         self.bot = bot
-        self.storage = HomeworkStorage()
+        self.storage = homework_storage
         self.moscow_tz = tz.gettz("Europe/Moscow")
         self.is_running = False
+        self._stop_event = asyncio.Event()
         self.check_interval = 60  
         self.digest_hour = 20  
         self.digest_minute = 0
@@ -55,19 +61,26 @@ class WeeklyDigestNotifier:
     
     async def start(self):
         self.is_running = True
+        self._stop_event.clear()
+        # Отметку last_digest_date мог оставить прежний лидер уже после нашего чтения файла
+        self.storage.reload_data()
         logger.info("Система еженедельных дайджестов запущена")
         
         while self.is_running:
+            failed = False
             try:
                 await self._check_and_send_digest()
                 await self._check_and_cleanup_old_weeks()
             except Exception as e:
+                failed = True
                 logger.error(f"Ошибка в системе дайджестов: {e}", exc_info=True)
+            record_loop_iteration("weekly_digest", failed)
             
-            await asyncio.sleep(self.check_interval)
+            await interruptible_sleep(self._stop_event, self.check_interval)
     
     def stop(self):
         self.is_running = False
+        self._stop_event.set()
         logger.info("Система еженедельных дайджестов остановлена")
     
     async def _check_and_cleanup_old_weeks(self):
@@ -103,6 +116,10 @@ class WeeklyDigestNotifier:
             if self.storage.data.get("last_digest_date") == today_str:
                 return
             
+            if not is_leader():
+                logger.warning("Аренда лидера истекла, еженедельный дайджест пропущен")
+                return
+            
             logger.info("Время отправки еженедельного дайджеста!")
             await self._send_digest_to_headman()
             
@@ -269,31 +286,32 @@ class WeeklyDigestNotifier:
         except Exception as e:
             logger.error(f"Ошибка отправки дайджеста старосте: {e}", exc_info=True)
     
-    async def send_digest_to_subscribers(self, digest_type: str, text: str) -> Tuple[int, int]:
-        
-        all_members = group_manager.get_all_members()
+    def send_digest_to_subscribers(self, digest_type: str, text: str, progress_message: Message,
+                                   owner_id: int) -> Optional[dict]:
+        queue = get_broadcast_queue()
+        if not queue:
+            logger.error("Очередь рассылок не инициализирована, дайджест не отправлен")
+            return None
         
-        success_count = 0
-        failed_count = 0
+        subscribers = group_manager.get_subscribers(digest_type)
+        category_title = "📚 Домашние задания" if digest_type == "homework" else "📋 Контрольные мероприятия"
+        digest_text = (
+            f"📢 <b>Еженедельная рассылка: {category_title}</b>\n"
+            f"{'─' * 30}\n\n{text}"
+        )
         
-        for member_id, member_data in all_members.items():
-            notifications = member_data.get('notifications', {})
-            if notifications.get(digest_type, False):
-                try:
-                    category_title = "📚 Домашние задания" if digest_type == "homework" else "📋 Контрольные мероприятия"
-                    
-                    await self.bot.send_message(
-                        chat_id=int(member_id),
-                        text=f"📢 <b>Еженедельная рассылка: {category_title}</b>\n"
-                             f"{'─' * 30}\n\n{text}",
-                        parse_mode="HTML"
-                    )
-                    success_count += 1
-                except Exception as e:
-                    failed_count += 1
-                    logger.error(f"Ошибка отправки дайджеста пользователю {member_id}: {e}")
-        
-        return success_count, failed_count
+        job = queue.create_job(
+            kind="text",
+            payload={"text": digest_text},
+            recipients=subscribers,
+            owner_id=owner_id,
+            progress_chat_id=progress_message.chat.id,
+            progress_message_id=progress_message.message_id,
+            title="Дайджест ДЗ" if digest_type == "homework" else "Дайджест КМ",
+            prefix=text
+        )
+        queue.submit(job)
+        return job
 
 
 weekly_digest_notifier: Optional[WeeklyDigestNotifier] = None
@@ -330,17 +348,13 @@ async def handle_send_hw_digest(callback: CallbackQuery):
         parse_mode="HTML"
     )
     
-    success, failed = await notifier.send_digest_to_subscribers("homework", hw_text)
+    job = notifier.send_digest_to_subscribers("homework", hw_text, callback.message, user_id)
+    if not job:
+        await callback.answer("Ошибка: система рассылок не инициализирована", show_alert=True)
+        return
     
     notifier.pending_digests[user_id]["hw_sent"] = True
     
-    await callback.message.edit_text(
-        f"{hw_text}\n\n"
-        f"✅ <b>Дайджест ДЗ отправлен!</b>\n"
-        f"Доставлено: {success} | Ошибок: {failed}",
-        parse_mode="HTML"
-    )
-    
     await _send_km_digest(callback, notifier, user_id)
     await callback.answer()
 
@@ -496,20 +510,16 @@ async def handle_send_km_digest(callback: CallbackQuery):
         parse_mode="HTML"
     )
     
-    success, failed = await notifier.send_digest_to_subscribers("control_works", km_text)
+    job = notifier.send_digest_to_subscribers("control_works", km_text, callback.message, user_id)
+    if not job:
+        await callback.answer("Ошибка: система рассылок не инициализирована", show_alert=True)
+        return
     
     if user_id in notifier.pending_digests:
         notifier.pending_digests[user_id]["km_sent"] = True
         del notifier.pending_digests[user_id]
     
-    await callback.message.edit_text(
-        f"{km_text}\n\n"
-        f"✅ <b>Дайджест КМ отправлен!</b>\n"
-        f"Доставлено: {success} | Ошибок: {failed}\n\n"
-        f"🎉 Еженедельная рассылка завершена!",
-        parse_mode="HTML"
-    )
-    await callback.answer()
+    await callback.answer("🎉 Еженедельная рассылка запущена!")
 
 
 @router.callback_query(F.data == "digest_skip_km")
@@ -624,12 +634,11 @@ from aiogram.enums import ChatType
 
 
 @router.message(Command("test_digest"))
-async def cmd_test_digest(message: Message):
+async def cmd_test_digest(message: Message, role: Optional[str] = None):
     if message.chat.type != ChatType.PRIVATE:
         return
     
-    member = group_manager.get_member(message.from_user.id)
-    if not member or member.get("role") not in ["Староста", "Зам старосты", "Профорг"]:
+    if not has_role(role, *MANAGER_ROLES):
         await message.answer("⛔ Эта команда доступна только старосте и профоргу.")
         return
     
@@ -668,12 +677,11 @@ async def cmd_test_digest(message: Message):
 
 
 @router.message(Command("digest_preview"))
-async def cmd_digest_preview(message: Message):
+async def cmd_digest_preview(message: Message, role: Optional[str] = None):
     if message.chat.type != ChatType.PRIVATE:
         return
     
-    member = group_manager.get_member(message.from_user.id)
-    if not member or member.get("role") not in ["Староста", "Зам старосты", "Профорг"]:
+    if not has_role(role, *MANAGER_ROLES):
         await message.answer("⛔ Эта команда доступна только старосте и профоргу.")
         return
     
@@ -1,10 +1,12 @@
 from commands.notifications.notifications import router as notifications_router
 from commands.notifications.notifications_command import router as notifications_command_router
 from commands.notifications.notification_panel_command import router as notification_panel_router
+from commands.notifications.broadcast_queue import router as broadcast_queue_router
 
 
 __all__ = [
     'notifications_router',
     'notifications_command_router',
-    'notification_panel_router'
+    'notification_panel_router',
+    'broadcast_queue_router'
 ]
@@ -0,0 +1,475 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from aiogram import Bot, Router, F
+from aiogram.exceptions import TelegramBadRequest, TelegramNotFound
+from aiogram.types import (
+    CallbackQuery,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InputMediaAudio,
+    InputMediaDocument,
+    InputMediaPhoto,
+    InputMediaVideo,
+)
+from dateutil import tz
+
+from commands.group.group_manager import group_manager, Role
+from commands.group.member_context import has_role
+from utils.broadcast import BroadcastReport, broadcast_engine, classify_delivery_error
+from utils.journal import write_snapshot
+from utils.leader import INSTANCE_ID, is_leader
+from utils.lifecycle import interruptible_sleep
+from utils.metrics import record_loop_iteration
+
+router = Router()
+logger = logging.getLogger(__name__)
+
+PROGRESS_EDIT_INTERVAL = float(os.environ.get("BROADCAST_PROGRESS_INTERVAL", "2"))
+MAX_FINISHED_JOBS = 50
+# Рассылку, владелец которой не сохранял позицию дольше этого срока, подхватывает лидер
+BROADCAST_JOB_TTL = float(os.environ.get("BROADCAST_JOB_TTL", "120"))
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_CANCELLED = "cancelled"
+STATUS_FAILED = "failed"
+
+ALBUM_MEDIA_TYPES = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio
+}
+
+
+class SourceChatUnavailable(Exception):
+    """Пересылка или копирование не удались из-за чата-источника, а не получателя."""
+
+
+def build_album_media(items: List[dict]) -> list:
+    return [
+        ALBUM_MEDIA_TYPES[item["type"]](
+            media=item["file_id"],
+            caption=item.get("caption"),
+            parse_mode="HTML"
+        )
+        for item in items
+    ]
+
+
+class BroadcastJobStore:
+
+    def __init__(self, storage_file: str = "data/broadcast_jobs.json"):
+        self.storage_file = os.path.abspath(storage_file)
+        self.jobs: Dict[str, dict] = self._load_jobs()
+
+    def _load_jobs(self) -> Dict[str, dict]:
+        if os.path.exists(self.storage_file):
+            try:
+                with open(self.storage_file, 'r', encoding='utf-8') as f:
+                    return json.load(f).get("jobs", {})
+            except Exception as e:
+                logger.error(f"Ошибка загрузки очереди рассылок: {e}", exc_info=True)
+        return {}
+
+    def save(self):
+        finished = sorted(
+            (job for job in self.jobs.values() if job["status"] != STATUS_RUNNING),
+            key=lambda job: job["created_at"]
+        )
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            del self.jobs[job["id"]]
+
+        try:
+            write_snapshot(self.storage_file, {"jobs": self.jobs})
+        except Exception as e:
+            logger.error(f"Ошибка сохранения очереди рассылок: {e}", exc_info=True)
+
+    def reload(self, keep: Iterable[str] = ()):
+        """Перечитывает файл; рассылки из keep (выполняются в этом процессе) остаются прежними объектами."""
+        jobs = self._load_jobs()
+        for job_id in keep:
+            if job_id in self.jobs:
+                jobs[job_id] = self.jobs[job_id]
+        self.jobs = jobs
+
+    def get_running(self) -> List[dict]:
+        return [job for job in self.jobs.values() if job["status"] == STATUS_RUNNING]
+
+
+class BroadcastQueue:
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.store = BroadcastJobStore()
+        self.moscow_tz = tz.gettz("Europe/Moscow")
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._last_progress_edit: Dict[str, float] = {}
+        # Рассылки, которые должны остановиться на границе пачки (drain); новые сюда не попадают
+        self._draining: Set[str] = set()
+        self._watch_task: Optional[asyncio.Task] = None
+        self._watch_stop = asyncio.Event()
+
+    def create_job(
+        self,
+        kind: str,
+        payload: dict,
+        recipients: List[int],
+        owner_id: int,
+        progress_chat_id: int,
+        progress_message_id: int,
+        title: str,
+        prefix: str = ""
+    ) -> dict:
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "kind": kind,
+            "payload": payload,
+            "recipients": list(dict.fromkeys(recipients)),
+            "cursor": 0,
+            "sent": 0,
+            "failed": 0,
+            "status": STATUS_RUNNING,
+            "owner_id": owner_id,
+            "progress_chat_id": progress_chat_id,
+            "progress_message_id": progress_message_id,
+            "title": title,
+            "prefix": prefix,
+            "created_at": datetime.now(self.moscow_tz).isoformat(),
+            "owner": INSTANCE_ID,
+            "heartbeat_at": time.time()
+        }
+        self.store.jobs[job["id"]] = job
+        self.store.save()
+        return job
+
+    def submit(self, job: dict) -> Optional[asyncio.Task]:
+        if not is_leader():
+            # Обработчик, начатый до потери лидерства: рассылку без владельца подхватит новый лидер
+            job["owner"] = None
+            self.store.jobs[job["id"]] = job
+            self.store.save()
+            logger.warning(f"Рассылка {job['id']} поставлена не лидером, ее начнет новый лидер")
+            return None
+        self._draining.discard(job["id"])
+        job["owner"] = INSTANCE_ID
+        job["heartbeat_at"] = time.time()
+        self.store.jobs[job["id"]] = job
+        self.store.save()
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda done: self._forget(job["id"], done))
+        logger.info(f"Рассылка {job['id']} поставлена в очередь: {len(job['recipients'])} получателей")
+        return task
+
+    def _forget(self, job_id: str, task: asyncio.Task):
+        if self._tasks.get(job_id) is task:
+            del self._tasks[job_id]
+            self._draining.discard(job_id)
+
+    def resume_pending(self) -> int:
+        """
+        Вызывается при избрании лидером: подхватывает брошенные рассылки и дальше
+        следит за теми, которые еще ведет другой экземпляр.
+        """
+        resumed = self._adopt_orphaned()
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_stop.clear()
+            self._watch_task = asyncio.create_task(self._watch_orphaned())
+        return resumed
+
+    def _is_orphaned(self, job: dict) -> bool:
+        owner = job.get("owner")
+        if owner is None or owner == INSTANCE_ID:
+            return True
+        return time.time() - job.get("heartbeat_at", 0) >= BROADCAST_JOB_TTL
+
+    def _adopt_orphaned(self) -> int:
+        # Позиции рассылок мог сохранить прежний владелец уже после нашего чтения файла
+        self.store.reload(keep=self._tasks)
+        resumed = 0
+        for job in self.store.get_running():
+            if job["id"] in self._tasks:
+                continue
+            if not self._is_orphaned(job):
+                logger.info(f"Рассылку {job['id']} ведет {job['owner']}, подхватим, если она остановится")
+                continue
+            logger.info(
+                f"Возобновляем рассылку {job['id']} с позиции "
+                f"{job['cursor']}/{len(job['recipients'])}"
+            )
+            self.submit(job)
+            resumed += 1
+        return resumed
+
+    async def _watch_orphaned(self):
+        while not self._watch_stop.is_set():
+            await interruptible_sleep(self._watch_stop, BROADCAST_JOB_TTL / 2)
+            if self._watch_stop.is_set():
+                break
+            try:
+                self._adopt_orphaned()
+            except Exception as e:
+                logger.error(f"Ошибка проверки брошенных рассылок: {e}", exc_info=True)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        return self.store.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.store.jobs.get(job_id)
+        if not job or job["status"] != STATUS_RUNNING:
+            return False
+        job["status"] = STATUS_CANCELLED
+        self.store.save()
+        logger.info(f"Рассылка {job_id} отменена")
+        return True
+
+    async def drain(self):
+        """
+        Рассылки останавливаются на границе пачки: текущая пачка дописывается,
+        позиция сохраняется, после перезапуска рассылка продолжится с нее.
+        """
+        self._watch_stop.set()
+        self._draining.update(self._tasks)
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        try:
+            await asyncio.wait(tasks)
+        except asyncio.CancelledError:
+            await self.stop()
+            raise
+
+    def get_unfinished(self) -> List[str]:
+        return [
+            f"рассылка {job['id']} ({job['title']}): осталось {len(job['recipients']) - job['cursor']} получателей"
+            for job in self.store.get_running()
+        ]
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _deliver(self, job: dict, chat_id: int):
+        payload = job["payload"]
+
+        if job["kind"] == "forward":
+            await broadcast_engine.call(chat_id, lambda: self.bot.send_message(
+                chat_id,
+                payload["header"],
+                parse_mode="HTML"
+            ))
+            message_ids = payload.get("message_ids") or [payload["message_id"]]
+            if len(message_ids) > 1:
+                await self._call_from_source(job, chat_id, lambda: self.bot.forward_messages(
+                    chat_id=chat_id,
+                    from_chat_id=payload["from_chat_id"],
+                    message_ids=message_ids
+                ))
+            else:
+                await self._call_from_source(job, chat_id, lambda: self.bot.forward_message(
+                    chat_id=chat_id,
+                    from_chat_id=payload["from_chat_id"],
+                    message_id=message_ids[0]
+                ))
+        elif job["kind"] == "copy":
+            await self._call_from_source(job, chat_id, lambda: self.bot.copy_message(
+                chat_id=chat_id,
+                from_chat_id=payload["from_chat_id"],
+                message_id=payload["message_id"],
+                caption=payload["caption"],
+                parse_mode="HTML"
+            ))
+        elif job["kind"] == "album":
+            if payload.get("header"):
+                await broadcast_engine.call(chat_id, lambda: self.bot.send_message(
+                    chat_id,
+                    payload["header"],
+                    parse_mode="HTML"
+                ))
+            await broadcast_engine.call(chat_id, lambda: self.bot.send_media_group(
+                chat_id=chat_id,
+                media=build_album_media(payload["items"])
+            ))
+        elif job["kind"] == "text":
+            await broadcast_engine.call(chat_id, lambda: self.bot.send_message(
+                chat_id=chat_id,
+                text=payload["text"],
+                parse_mode="HTML"
+            ))
+        else:
+            raise ValueError(f"Неизвестный тип рассылки: {job['kind']}")
+
+    async def _call_from_source(self, job: dict, chat_id: int, request):
+        """
+        Запрос с двумя чатами (from_chat_id и получатель): "chat not found" может
+        относиться к источнику, поэтому получателя недоступным не помечаем, а рассылку
+        останавливаем — с недоступным источником не дойдет ни одно сообщение.
+        """
+        try:
+            return await broadcast_engine.call(chat_id, request)
+        except (TelegramBadRequest, TelegramNotFound) as e:
+            if classify_delivery_error(e) != "chat_not_found":
+                raise
+            job["source_error"] = str(e)
+            raise SourceChatUnavailable(str(e)) from e
+
+    async def _run(self, job: dict):
+        recipients = job["recipients"]
+        chunk_size = broadcast_engine.concurrency
+
+        await self._update_progress(job, force=True)
+
+        while job["status"] == STATUS_RUNNING and job["cursor"] < len(recipients) and job["id"] not in self._draining:
+            if not is_leader():
+                break
+            chunk = recipients[job["cursor"]:job["cursor"] + chunk_size]
+
+            report: BroadcastReport = await broadcast_engine.send(
+                chunk,
+                lambda chat_id: self._deliver(job, chat_id)
+            )
+
+            job["sent"] += report.sent
+            job["failed"] += report.failed
+            job["cursor"] += len(chunk)
+            job["heartbeat_at"] = time.time()
+            if job.get("source_error") and job["status"] == STATUS_RUNNING:
+                job["status"] = STATUS_FAILED
+                logger.error(f"Рассылка {job['id']} остановлена: чат-источник недоступен ({job['source_error']})")
+            self.store.save()
+
+            self._record_delivery(report)
+            record_loop_iteration("broadcast_queue")
+
+            await self._update_progress(job)
+
+        if job["status"] == STATUS_RUNNING and job["cursor"] < len(recipients):
+            # Владельца снимаем, чтобы следующий лидер подхватил рассылку сразу, а не через BROADCAST_JOB_TTL
+            job["owner"] = None
+            self.store.save()
+            logger.info(f"Рассылка {job['id']} приостановлена на {job['cursor']}/{len(recipients)} до перезапуска")
+            return
+
+        if job["status"] == STATUS_RUNNING:
+            job["status"] = STATUS_DONE
+            self.store.save()
+
+        logger.info(
+            f"Рассылка {job['id']} завершена ({job['status']}): "
+            f"доставлено {job['sent']}, ошибок {job['failed']}"
+        )
+        await self._update_progress(job, force=True)
+        self._last_progress_edit.pop(job["id"], None)
+
+    def _record_delivery(self, report: BroadcastReport):
+        try:
+            marked_dead = group_manager.record_delivery_results(
+                {r.chat_id: r.error_class for r in report.dead_results},
+                [r.chat_id for r in report.results if r.ok]
+            )
+            if marked_dead:
+                logger.info(f"Помечено недоступными получателей: {marked_dead}")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения статусов доставки: {e}", exc_info=True)
+
+    def _format_progress(self, job: dict) -> str:
+        remaining = len(job["recipients"]) - job["cursor"]
+        text = f"{job['prefix']}\n\n" if job["prefix"] else ""
+
+        if job["status"] == STATUS_DONE:
+            text += f"✅ <b>{job['title']}: рассылка завершена</b>\n"
+            text += f"Доставлено: <b>{job['sent']}</b> | Ошибок: <b>{job['failed']}</b>"
+        elif job["status"] == STATUS_FAILED:
+            text += f"❌ <b>{job['title']}: рассылка остановлена</b>\n"
+            text += "Исходное сообщение недоступно — перешлите его заново.\n"
+            text += f"Доставлено: <b>{job['sent']}</b> | Ошибок: <b>{job['failed']}</b> | "
+            text += f"Не отправлено: <b>{remaining}</b>"
+        elif job["status"] == STATUS_CANCELLED:
+            text += f"🛑 <b>{job['title']}: рассылка отменена</b>\n"
+            text += f"Доставлено: <b>{job['sent']}</b> | Ошибок: <b>{job['failed']}</b> | "
+            text += f"Не отправлено: <b>{remaining}</b>"
+        else:
+            text += f"⏳ <b>{job['title']}: отправка...</b>\n"
+            text += f"Доставлено: <b>{job['sent']}</b> | Ошибок: <b>{job['failed']}</b> | "
+            text += f"Осталось: <b>{remaining}</b>"
+
+        return text
+
+    async def _update_progress(self, job: dict, force: bool = False):
+        if not job.get("progress_chat_id") or not job.get("progress_message_id"):
+            return
+
+        now = time.monotonic()
+        last = self._last_progress_edit.get(job["id"], 0.0)
+        if not force and now - last < PROGRESS_EDIT_INTERVAL:
+            return
+        self._last_progress_edit[job["id"]] = now
+
+        keyboard = None
+        if job["status"] == STATUS_RUNNING:
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="🛑 Остановить рассылку", callback_data=f"bcast_cancel:{job['id']}")
+            ]])
+
+        try:
+            await self.bot.edit_message_text(
+                text=self._format_progress(job),
+                chat_id=job["progress_chat_id"],
+                message_id=job["progress_message_id"],
+                reply_markup=keyboard,
+                parse_mode="HTML"
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.warning(f"Не удалось обновить прогресс рассылки {job['id']}: {e}")
+        except Exception as e:
+            logger.warning(f"Не удалось обновить прогресс рассылки {job['id']}: {e}")
+
+
+_broadcast_queue: Optional[BroadcastQueue] = None
+
+
+def set_broadcast_queue(queue: BroadcastQueue):
+    global _broadcast_queue
+    _broadcast_queue = queue
+
+
+def get_broadcast_queue() -> Optional[BroadcastQueue]:
+    return _broadcast_queue
+
+
+@router.callback_query(F.data.startswith("bcast_cancel:"))
+async def handle_cancel_broadcast(callback: CallbackQuery, role: Optional[str] = None):
+    queue = get_broadcast_queue()
+    if not queue:
+        await callback.answer("Ошибка: система рассылок не инициализирована", show_alert=True)
+        return
+
+    job_id = callback.data.split(":", 1)[1]
+    job = queue.get_job(job_id)
+    if not job:
+        await callback.answer("Рассылка не найдена", show_alert=True)
+        return
+
+    if callback.from_user.id != job["owner_id"] and not has_role(role, Role.STAROSTA):
+        await callback.answer("⛔ Остановить рассылку может только её автор или староста.", show_alert=True)
+        return
+
+    if queue.cancel(job_id):
+        await callback.answer("🛑 Рассылка будет остановлена")
+    else:
+        await callback.answer("Рассылка уже завершена")
@@ -1,12 +1,17 @@
+import asyncio
+import os
+
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.enums import ChatType
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 from commands.group.group_manager import group_manager, Role
+from commands.group.member_context import MANAGER_ROLES, has_role
+from commands.notifications.broadcast_queue import get_broadcast_queue
 
 router = Router()
 
@@ -24,36 +29,99 @@ NOTIFICATION_CATEGORIES = {
     "schedule_changes": "📅 Изменения в расписании"
 }
 
+# auto — копирование одним запросом для больших рассылок, пересылка для маленьких;
+# copy / forward — принудительно один из режимов
+NOTIFICATION_DELIVERY_MODE = os.environ.get("NOTIFICATION_DELIVERY_MODE", "auto").lower()
+COPY_MODE_MIN_RECIPIENTS = int(os.environ.get("NOTIFICATION_COPY_MIN_RECIPIENTS", "10"))
+ALBUM_COLLECT_DELAY = 1.0
 
-def is_allowed_to_send_notifications(user_id: int) -> tuple[bool, Optional[str]]:
-    member = group_manager.get_member(user_id)
-    if not member:
-        return False, None
-    
-    role = member.get('role')
-    if role in [Role.STAROSTA.value, Role.ZAM_STAROSTA.value, Role.PROFORG.value]:
-        return True, role
-    
-    return False, None
+TEXT_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+_album_buffer: Dict[str, List[Message]] = {}
+
+
+def use_copy_mode(recipients_count: int) -> bool:
+    if NOTIFICATION_DELIVERY_MODE == "copy":
+        return True
+    if NOTIFICATION_DELIVERY_MODE == "forward":
+        return False
+    return recipients_count >= COPY_MODE_MIN_RECIPIENTS
+
+
+def merge_header(header: str, body: Optional[str]) -> str:
+    return f"{header}\n\n{body}" if body else header
+
+
+def get_album_item(message: Message) -> Optional[dict]:
+    if message.photo:
+        item = {"type": "photo", "file_id": message.photo[-1].file_id}
+    elif message.video:
+        item = {"type": "video", "file_id": message.video.file_id}
+    elif message.document:
+        item = {"type": "document", "file_id": message.document.file_id}
+    elif message.audio:
+        item = {"type": "audio", "file_id": message.audio.file_id}
+    else:
+        return None
+
+    if message.caption:
+        item["caption"] = message.html_text
+    return item
+
+
+def build_delivery(messages: List[Message], header: str, recipients_count: int) -> Tuple[str, dict]:
+    """Выбирает способ доставки: по возможности один запрос на получателя."""
+    first = messages[0]
+    forward = ("forward", {
+        "header": header,
+        "from_chat_id": first.chat.id,
+        "message_ids": [m.message_id for m in messages]
+    })
+
+    if not use_copy_mode(recipients_count):
+        return forward
+
+    if len(messages) > 1:
+        items = [get_album_item(m) for m in messages]
+        if any(item is None for item in items):
+            return forward
+
+        caption = merge_header(header, items[0].get("caption"))
+        if len(caption) <= CAPTION_LIMIT:
+            items[0]["caption"] = caption
+            return "album", {"items": items}
+        return "album", {"items": items, "header": header}
+
+    if first.text:
+        text = merge_header(header, first.html_text)
+        if len(text) <= TEXT_LIMIT:
+            return "text", {"text": text}
+    elif first.photo or first.video or first.document or first.audio or first.animation or first.voice:
+        caption = merge_header(header, first.html_text if first.caption else None)
+        if len(caption) <= CAPTION_LIMIT:
+            return "copy", {
+                "from_chat_id": first.chat.id,
+                "message_id": first.message_id,
+                "caption": caption
+            }
+
+    return forward
 
 
 @router.message(Command("notif_panel"))
-async def cmd_notif_panel(message: Message, state: FSMContext):
+async def cmd_notif_panel(message: Message, state: FSMContext, role: Optional[str] = None):
     if message.chat.type != ChatType.PRIVATE:
         return
     
-    user_id = message.from_user.id
-    
-    allowed, user_role = is_allowed_to_send_notifications(user_id)
-    
-    if not allowed:
+    if not has_role(role, *MANAGER_ROLES):
         await message.answer(
             "❌ <b>Доступ запрещен</b>\n\n"
             "Данная команда доступна только старосте, заму старосты и профоргу."
         )
         return
     
-    if user_role == Role.PROFORG.value:
+    if role == Role.PROFORG:
         await state.update_data(notification_category="proforg")
         await state.set_state(NotificationStates.waiting_for_message)
         
@@ -95,12 +163,8 @@ async def cmd_notif_panel(message: Message, state: FSMContext):
 
 
 @router.callback_query(F.data.startswith("notif_cat_"))
-async def process_category_selection(callback: CallbackQuery, state: FSMContext):
-    user_id = callback.from_user.id
-    
-    allowed, user_role = is_allowed_to_send_notifications(user_id)
-    
-    if not allowed:
+async def process_category_selection(callback: CallbackQuery, state: FSMContext, role: Optional[str] = None):
+    if not has_role(role, *MANAGER_ROLES):
         await callback.answer("❌ Доступ запрещен", show_alert=True)
         return
     
@@ -136,26 +200,27 @@ async def cancel_notification(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(NotificationStates.waiting_for_message)
-async def process_notification_message(message: Message, state: FSMContext):
-    user_id = message.from_user.id
-    
-    allowed, user_role = is_allowed_to_send_notifications(user_id)
-    
-    if not allowed:
+async def process_notification_message(message: Message, state: FSMContext, role: Optional[str] = None):
+    if not has_role(role, *MANAGER_ROLES):
         await state.clear()
         return
     
+    if message.media_group_id:
+        # Альбом приходит отдельными сообщениями — собираем его целиком
+        album = _album_buffer.setdefault(message.media_group_id, [])
+        album.append(message)
+        if len(album) > 1:
+            return
+        await asyncio.sleep(ALBUM_COLLECT_DELAY)
+        messages = sorted(_album_buffer.pop(message.media_group_id), key=lambda m: m.message_id)
+    else:
+        messages = [message]
+    
     data = await state.get_data()
     category_key = data.get('notification_category')
     category_title = NOTIFICATION_CATEGORIES.get(category_key, "Неизвестная категория")
     
-    all_members = group_manager.get_all_members()
-    
-    subscribers = []
-    for member_id, member_data in all_members.items():
-        notifications = member_data.get('notifications', {})
-        if notifications.get(category_key, False):
-            subscribers.append(int(member_id))
+    subscribers = group_manager.get_subscribers(category_key)
     
     if not subscribers:
         await message.answer(
@@ -166,49 +231,36 @@ async def process_notification_message(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    await message.answer(
+    queue = get_broadcast_queue()
+    if not queue:
+        await message.answer("❌ Система рассылок не инициализирована. Перезапустите бота.")
+        await state.clear()
+        return
+    
+    progress_message = await message.answer(
         f"⏳ <b>Отправка уведомления...</b>\n\n"
         f"Категория: <b>{category_title}</b>\n"
         f"Подписчиков: <b>{len(subscribers)}</b>"
     )
     
-    success_count = 0
-    failed_count = 0
-    
-    for subscriber_id in subscribers:
-        if subscriber_id == user_id:
-            continue
-        
-        try:
-            notification_header = (
-                f"📢 <b>Уведомление: {category_title}</b>\n"
-                f"{'─' * 30}"
-            )
-            await message.bot.send_message(
-                subscriber_id,
-                notification_header,
-                parse_mode="HTML"
-            )
-            
-            await message.bot.forward_message(
-                chat_id=subscriber_id,
-                from_chat_id=message.chat.id,
-                message_id=message.message_id
-            )
-            
-            success_count += 1
-        except Exception as e:
-            failed_count += 1
-            print(f"Ошибка отправки уведомления пользователю {subscriber_id}: {e}")
-    
-    report_text = (
-        f"✅ <b>Уведомление отправлено</b>\n\n"
-        f"Категория: <b>{category_title}</b>\n"
-        f"Успешно доставлено: <b>{success_count}</b>\n"
+    notification_header = (
+        f"📢 <b>Уведомление: {category_title}</b>\n"
+        f"{'─' * 30}"
     )
     
-    if failed_count > 0:
-        report_text += f"Не удалось доставить: <b>{failed_count}</b>\n"
+    user_id = message.from_user.id
+    recipients = [subscriber_id for subscriber_id in subscribers if subscriber_id != user_id]
+    kind, payload = build_delivery(messages, notification_header, len(recipients))
     
-    await message.answer(report_text)
+    job = queue.create_job(
+        kind=kind,
+        payload=payload,
+        recipients=recipients,
+        owner_id=user_id,
+        progress_chat_id=progress_message.chat.id,
+        progress_message_id=progress_message.message_id,
+        title="Уведомление",
+        prefix=f"Категория: <b>{category_title}</b>"
+    )
+    queue.submit(job)
     await state.clear()
@@ -1,7 +1,10 @@
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 
 from commands.group.group_manager import group_manager
+from utils.callback_coalescer import callback_coalescer
 
 router = Router()
 
@@ -14,29 +17,35 @@ NOTIFICATION_TYPES = {
 }
 
 
-def get_user_notifications(user_id: int) -> dict:
-    member = group_manager.get_member(user_id)
+def get_member_notifications(member: Optional[dict]) -> dict:
     if member and "notifications" in member:
         return member["notifications"]
     return {key: True for key in NOTIFICATION_TYPES.keys()}
 
 
-def toggle_notification(user_id: int, notification_type: str) -> bool:
-    notifications = get_user_notifications(user_id)
+def get_user_notifications(user_id: int) -> dict:
+    return get_member_notifications(group_manager.get_member(user_id))
+
+
+def toggle_notification(user_id: int, notification_type: str, notifications: Optional[dict] = None) -> bool:
+    if notifications is None:
+        notifications = get_user_notifications(user_id)
     notifications[notification_type] = not notifications[notification_type]
     group_manager.update_member(user_id, notifications=notifications)
     return notifications[notification_type]
 
 
-def toggle_all_notifications(user_id: int, enable: bool):
-    notifications = get_user_notifications(user_id)
+def toggle_all_notifications(user_id: int, enable: bool, notifications: Optional[dict] = None):
+    if notifications is None:
+        notifications = get_user_notifications(user_id)
     for key in notifications:
         notifications[key] = enable
     group_manager.update_member(user_id, notifications=notifications)
 
 
-def get_notifications_keyboard(user_id: int) -> InlineKeyboardMarkup:
-    notifications = get_user_notifications(user_id)
+def get_notifications_keyboard(user_id: int, notifications: Optional[dict] = None) -> InlineKeyboardMarkup:
+    if notifications is None:
+        notifications = get_user_notifications(user_id)
     
     buttons = []
     for key, title in NOTIFICATION_TYPES.items():
@@ -81,9 +90,8 @@ def get_notifications_keyboard(user_id: int) -> InlineKeyboardMarkup:
 
 
 @router.callback_query(F.data == "notifications_menu")
-async def show_notifications_menu(callback: CallbackQuery):
-    user_id = callback.from_user.id
-    keyboard = get_notifications_keyboard(user_id)
+async def show_notifications_menu(callback: CallbackQuery, member: Optional[dict] = None):
+    keyboard = get_notifications_keyboard(callback.from_user.id, get_member_notifications(member))
     
     await callback.message.edit_text(
         "🔔 <b>Настройки уведомлений</b>\n\n"
@@ -96,20 +104,21 @@ async def show_notifications_menu(callback: CallbackQuery):
 
 
 @router.callback_query(F.data.startswith("toggle_"))
-async def toggle_notification_handler(callback: CallbackQuery):
+async def toggle_notification_handler(callback: CallbackQuery, member: Optional[dict] = None):
     user_id = callback.from_user.id
+    notifications = get_member_notifications(member)
     
     if callback.data == "toggle_all_on":
-        toggle_all_notifications(user_id, True)
+        toggle_all_notifications(user_id, True, notifications)
         await callback.answer("✅ Все уведомления включены")
     elif callback.data == "toggle_all_off":
-        toggle_all_notifications(user_id, False)
+        toggle_all_notifications(user_id, False, notifications)
         await callback.answer("❌ Все уведомления выключены")
     else:
         notification_type = callback.data.replace("toggle_", "")
-        new_state = toggle_notification(user_id, notification_type)
+        new_state = toggle_notification(user_id, notification_type, notifications)
         status = "включено" if new_state else "выключено"
         await callback.answer(f"Уведомление {status}")
     
-    keyboard = get_notifications_keyboard(user_id)
-    await callback.message.edit_reply_markup(reply_markup=keyboard)
+    keyboard = get_notifications_keyboard(user_id, notifications)
+    await callback_coalescer.edit_reply_markup(callback, keyboard)
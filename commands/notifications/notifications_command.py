@@ -1,20 +1,21 @@
+from typing import Optional
+
 from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.enums import ChatType
 
-from commands.notifications.notifications import get_notifications_keyboard
+from commands.notifications.notifications import get_member_notifications, get_notifications_keyboard
 
 router = Router()
 
 
 @router.message(Command("notifications"))
-async def cmd_notifications(message: Message):
+async def cmd_notifications(message: Message, member: Optional[dict] = None):
     if message.chat.type != ChatType.PRIVATE:
         return
     
-    user_id = message.from_user.id
-    keyboard = get_notifications_keyboard(user_id)
+    keyboard = get_notifications_keyboard(message.from_user.id, get_member_notifications(member))
     
     await message.answer(
         "🔔 <b>Настройки уведомлений</b>\n\n"
@@ -1,18 +1,20 @@
 import logging
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
 
-from commands.group.group_manager import group_manager
-from commands.schedule.schedule_storage import ScheduleStorage
+from commands.group.group_manager import group_manager, Role
+from commands.group.member_context import has_role
+from commands.schedule.schedule_storage import schedule_storage as storage
+from utils.callback_coalescer import callback_coalescer
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-storage = ScheduleStorage()
-
 
 @router.callback_query(F.data.startswith("att:"))
-async def handle_attendance_request(callback: CallbackQuery):
+async def handle_attendance_request(callback: CallbackQuery, member: Optional[dict] = None):
     try:
         lesson_id = callback.data.split(":", 1)[1]
         
@@ -21,9 +23,8 @@ async def handle_attendance_request(callback: CallbackQuery):
         first_name = callback.from_user.first_name
         last_name = callback.from_user.last_name or ""
         
-        user_data = group_manager.get_member(user_id)
-        if user_data:
-            full_name = user_data.get("full_name", f"{first_name} {last_name}".strip())
+        if member:
+            full_name = member.get("full_name", f"{first_name} {last_name}".strip())
         else:
             full_name = f"{first_name} {last_name}".strip()
         
@@ -116,7 +117,8 @@ async def _update_attendance_counter(callback: CallbackQuery, lesson_id: str):
         
         keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
         
-        await callback.message.edit_reply_markup(reply_markup=keyboard)
+        # Нажатия разных студентов на одном сообщении склеиваются в одно редактирование
+        await callback_coalescer.edit_reply_markup(callback, keyboard, per_user=False)
         logger.info(f"Обновлена клавиатура для lesson_id={lesson_id}, счетчик={count}")
         
     except Exception as e:
@@ -124,12 +126,9 @@ async def _update_attendance_counter(callback: CallbackQuery, lesson_id: str):
 
 
 @router.callback_query(F.data.startswith("view_attendance:"))
-async def handle_view_attendance(callback: CallbackQuery):
+async def handle_view_attendance(callback: CallbackQuery, role: Optional[str] = None):
     try:
-        user_id = callback.from_user.id
-        user_data = group_manager.get_member(user_id)
-        
-        if not user_data or user_data.get("role") != "Староста":
+        if not has_role(role, Role.STAROSTA):
             await callback.answer(
                 "⛔ Эта функция доступна только старосте.",
                 show_alert=True
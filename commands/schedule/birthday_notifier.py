@@ -4,6 +4,10 @@ from datetime import datetime, timedelta
 from typing import Optional
 from aiogram import Bot, Router
 from commands.group.group_manager import group_manager
+from utils.broadcast import classify_delivery_error
+from utils.leader import is_leader
+from utils.lifecycle import interruptible_sleep
+from utils.metrics import record_loop_iteration
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -14,24 +18,30 @@ class BirthdayNotifier:
     def __init__(self, bot: Bot):
         self.bot = bot
         self.is_running = False
+        self._stop_event = asyncio.Event()
         self._task: Optional[asyncio.Task] = None
         self.check_interval = 60 
         logger.info("BirthdayNotifier инициализирован")
     
     async def start(self):
         self.is_running = True
+        self._stop_event.clear()
         logger.info("BirthdayNotifier запущен")
         
         while self.is_running:
+            failed = False
             try:
                 await self._check_birthdays()
             except Exception as e:
+                failed = True
                 logger.error(f"Ошибка при проверке дней рождения: {e}")
+            record_loop_iteration("birthday_notifier", failed)
             
-            await asyncio.sleep(self.check_interval)
+            await interruptible_sleep(self._stop_event, self.check_interval)
     
     def stop(self):
         self.is_running = False
+        self._stop_event.set()
         logger.info("BirthdayNotifier остановлен")
     
     async def _check_birthdays(self):
@@ -45,6 +55,10 @@ class BirthdayNotifier:
         if not is_evening_time and not is_morning_time:
             return
         
+        if not is_leader():
+            logger.warning("Аренда лидера истекла, уведомления о днях рождения пропущены")
+            return
+        
         headman = group_manager.get_headman()
         if not headman:
             logger.debug("Староста не найден, пропускаем проверку дней рождения")
@@ -55,6 +69,10 @@ class BirthdayNotifier:
             logger.warning("У старосты отсутствует user_id")
             return
         
+        if group_manager.is_dead_recipient(headman_id):
+            logger.info(f"Староста {headman_id} недоступен для личных сообщений, пропускаем уведомления")
+            return
+        
         all_members = group_manager.get_all_members()
         
         today = now.date()
@@ -87,6 +105,11 @@ class BirthdayNotifier:
                 logger.warning(f"Некорректный формат даты рождения у пользователя {user_id}: {birth_date_str}")
                 continue
     
+    def _record_delivery_error(self, chat_id: int, error: Exception):
+        error_class = classify_delivery_error(error)
+        if error_class and group_manager.record_delivery_failure(chat_id, error_class):
+            logger.warning(f"Пользователь {chat_id} помечен недоступным: {error_class}")
+    
     async def _send_eve_notification(self, headman_id: int, member_name: str, birth_date: str):
         try:
             birth = datetime.strptime(birth_date, "%d.%m.%Y")
@@ -108,6 +131,7 @@ class BirthdayNotifier:
             
         except Exception as e:
             logger.error(f"Ошибка при отправке уведомления о дне рождения (канун): {e}")
+            self._record_delivery_error(headman_id, e)
     
     async def _send_birthday_notification(self, headman_id: int, member_name: str, birth_date: str):
         try:
@@ -130,6 +154,7 @@ class BirthdayNotifier:
             
         except Exception as e:
             logger.error(f"Ошибка при отправке уведомления о дне рождения: {e}")
+            self._record_delivery_error(headman_id, e)
     
     async def test_birthday_check(self):
         logger.info("Запуск тестовой проверки дней рождения...")
@@ -1,19 +1,19 @@
 import logging
 import os
+from typing import Optional
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from commands.group.group_manager import group_manager
-from commands.schedule.schedule_storage import ScheduleStorage
+from commands.group.member_context import MANAGER_ROLES, has_role
+from commands.schedule.schedule_storage import schedule_storage as storage
+from utils.callback_coalescer import callback_coalescer
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-storage = ScheduleStorage()
-
 ALL_SUBJECTS = [
     "ЛК Информатика",
     "ЛК Структуры и алгоритмы обработки данных",
@@ -98,11 +98,8 @@ def create_subjects_keyboard(page: int = 0, items_per_page: int = 8) -> InlineKe
 
 
 @router.message(Command("manage_files"))
-async def cmd_manage_files(message: Message):
-    user_id = message.from_user.id
-    user_data = group_manager.get_member(user_id)
-    
-    if not user_data or user_data.get("role") not in ["Староста", "Профорг", "Зам старосты"]:
+async def cmd_manage_files(message: Message, role: Optional[str] = None):
+    if not has_role(role, *MANAGER_ROLES):
         await message.answer(
             "⛔ Эта команда доступна только старосте и профоргу."
         )
@@ -163,13 +160,14 @@ async def handle_subject_page(callback: CallbackQuery, state: FSMContext):
     
     keyboard = create_subjects_keyboard(page=page)
     
-    await callback.message.edit_text(
+    await callback.answer()
+    await callback_coalescer.edit_text(
+        callback,
         "📚 <b>Выберите предмет для добавления файлов:</b>\n\n"
         "Нажмите на кнопку с нужным предметом:",
         reply_markup=keyboard,
         parse_mode="HTML"
     )
-    await callback.answer()
 
 
 @router.callback_query(F.data == "subj_page_info")
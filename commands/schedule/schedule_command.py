@@ -2,6 +2,7 @@ from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.enums import ChatType
+import asyncio
 import logging
 
 from commands.schedule.schedule_parser import (
@@ -13,18 +14,36 @@ from commands.schedule.schedule_parser import (
     URL,
     get_week_number
 )
+from utils.admission import single_flight
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+SCHEDULE_FLIGHT_KEY = ("schedule_events",)
+
+
+def _load_events():
+    return parse_schedule(fetch_ics_from_json(URL))
+
+
+async def load_events():
+    """Загрузка и разбор календаря; одновременные /schedule и /today делят один запрос."""
+    return await single_flight.run(SCHEDULE_FLIGHT_KEY, lambda: asyncio.to_thread(_load_events))
+
+
+def _loading_text(period: str) -> str:
+    if single_flight.in_flight(SCHEDULE_FLIGHT_KEY):
+        return f"⏳ Расписание уже загружается, сейчас покажу на {period}..."
+    return f"⏳ Загружаю расписание на {period}..."
+
+
 @router.message(Command("schedule"))
 async def cmd_schedule(message: Message):
     
     try:
-        loading_msg = await message.answer("⏳ Загружаю расписание на неделю...")
+        loading_msg = await message.answer(_loading_text("неделю"))
         
-        ical_str = fetch_ics_from_json(URL)
-        events = parse_schedule(ical_str)
+        events = await load_events()
         week_events = get_week_lessons(events)
         
         schedule_text = format_schedule_message(week_events, "неделю")
@@ -56,10 +75,9 @@ async def cmd_today_schedule(message: Message):
     
     
     try:
-        loading_msg = await message.answer("⏳ Загружаю расписание на сегодня...")
+        loading_msg = await message.answer(_loading_text("сегодня"))
         
-        ical_str = fetch_ics_from_json(URL)
-        events = parse_schedule(ical_str)
+        events = await load_events()
         today_events = get_today_lessons(events)
         
         import datetime
@@ -17,7 +17,10 @@ from commands.schedule.schedule_parser import (
     extract_teacher_name,
     URL
 )
-from commands.schedule.schedule_storage import ScheduleStorage
+from commands.schedule.schedule_storage import schedule_storage
+from utils.leader import is_leader
+from utils.lifecycle import interruptible_sleep
+from utils.metrics import record_loop_iteration
 
 logger = logging.getLogger(__name__)
 
@@ -25,9 +28,10 @@ logger = logging.getLogger(__name__)
 class ScheduleNotifier:
     def __init__(self, bot: Bot):
         self.bot = bot
-        self.storage = ScheduleStorage()
+        self.storage = schedule_storage
         self.notification_chat_id = os.environ.get("NOTIFICATION_CHAT_ID")
         self.is_running = False
+        self._stop_event = asyncio.Event()
         self.tz_moscow = tz.gettz("Europe/Moscow")
         
         self.test_mode = os.environ.get("TEST_MODE", "false").lower() == "true"
@@ -72,32 +76,40 @@ class ScheduleNotifier:
             logger.warning("NOTIFICATION_CHAT_ID не установлен, но тестовый режим активен.")
             
         self.is_running = True
+        self._stop_event.clear()
+        # start() вызывается при каждом избрании лидером: прежний лидер мог отметить
+        # уведомленные пары в файле после того, как этот экземпляр его прочитал
+        self.storage.reload_data()
         logger.info("Система уведомлений о парах запущена")
         
         while self.is_running:
+            failed = False
             try:
                 await self._check_and_notify()
             except Exception as e:
+                failed = True
                 logger.error(f"Ошибка в системе уведомлений: {e}", exc_info=True)
+            record_loop_iteration("schedule_notifier", failed)
             
-            await asyncio.sleep(self.check_interval)
+            await interruptible_sleep(self._stop_event, self.check_interval)
     
     def stop(self):
         self.is_running = False
+        self._stop_event.set()
         logger.info("Система уведомлений остановлена")
     
     async def _check_and_notify(self):
         try:
             now = self.get_current_time()
             
-            logger.info(f"Проверка расписания. Время: {now.strftime('%H:%M:%S')}")
+            logger.debug("Проверка расписания. Время: %s", now.strftime("%H:%M:%S"))
             
             ical_str = fetch_ics_from_json(URL)
             events = parse_schedule(ical_str)
             
             today_events = [e for e in events if e["start"].date() == now.date()]
             today_events = sorted(today_events, key=lambda x: x["start"])
-            logger.info(f"Найдено {len(today_events)} пар на сегодня")
+            logger.debug("Найдено %d пар на сегодня", len(today_events))
             
             for event in today_events:
                 start_time = event["start"]
@@ -117,6 +129,10 @@ class ScheduleNotifier:
                     lesson_full_id = f"{start_time.strftime('%Y%m%d%H%M')}_{event['title']}"
                     lesson_id = hashlib.md5(lesson_full_id.encode()).hexdigest()[:16]
                     
+                    if not is_leader():
+                        logger.warning(f"Аренда лидера истекла, уведомление о паре {lesson_id} пропущено")
+                        return
+                    
                     if not self.storage.was_notified(lesson_id):
                         if self.notification_chat_id:
                             await self._send_lesson_notification(event, lesson_id, lesson_full_id, notify_minutes)
@@ -148,7 +164,7 @@ class ScheduleNotifier:
                         
                         self.storage.mark_as_notified(lesson_id)
                     else:
-                        logger.info(f"  Пара уже была уведомлена ранее: {lesson_id}")
+                        logger.debug("  Пара уже была уведомлена ранее: %s", lesson_id)
                         
         except Exception as e:
             logger.error(f"Ошибка при проверке расписания: {e}", exc_info=True)
@@ -203,7 +219,8 @@ class ScheduleNotifier:
             if notify_minutes == self.notify_minutes_before_long_break:
                 break_minutes = 30  
 
-            logger.info(f"Сохраняем данные о паре: lesson_id={lesson_id}, full_subject='{full_subject}', lesson_name='{lesson_name}'")
+            logger.debug("Сохраняем данные о паре: lesson_id=%s, full_subject='%s', lesson_name='%s'",
+                         lesson_id, full_subject, lesson_name)
             self.storage.save_attendance_message(
                 lesson_id, 
                 0,  
@@ -212,7 +229,7 @@ class ScheduleNotifier:
                 lesson_start=start_time.isoformat(),
                 break_minutes=break_minutes
             )
-            logger.info(f"Данные сохранены в storage до отправки сообщения")
+            logger.debug("Данные сохранены в storage до отправки сообщения")
 
             # keyboard = InlineKeyboardMarkup(inline_keyboard=[
             #     [InlineKeyboardButton(
@@ -225,11 +242,10 @@ class ScheduleNotifier:
             #     )]
             # ])
             
-            logger.info(f"Ищем файлы для пары: '{title}'")
             files = self.storage.get_lesson_files(lesson_id, title)
             
             if files:
-                logger.info(f"Найдено {len(files)} файлов для отправки")
+                logger.debug("Найдено %d файлов для отправки", len(files))
                 message_text += f"\n📎 Прикрепленные материалы: {len(files)} файл(ов)"
             
             sent_message = await self.bot.send_message(
@@ -247,7 +263,7 @@ class ScheduleNotifier:
                 lesson_start=start_time.isoformat(),
                 break_minutes=break_minutes
             )
-            logger.info(f"Обновлен message_id={sent_message.message_id} для lesson_id={lesson_id}")
+            logger.debug("Обновлен message_id=%s для lesson_id=%s", sent_message.message_id, lesson_id)
             logger.info(f"Отправлено уведомление о паре: {title} в {start_time.strftime('%H:%M')}")
             
             if files:
@@ -262,7 +278,7 @@ class ScheduleNotifier:
                                 media=file,
                                 caption=caption
                             ))
-                            logger.info(f"Добавлен файл в группу: {file_path}")
+                            logger.debug("Добавлен файл в группу: %s", file_path)
                         else:
                             logger.warning(f"Файл не существует: {file_path}")
                     
@@ -276,7 +292,7 @@ class ScheduleNotifier:
                 except Exception as e:
                     logger.error(f"Ошибка при отправке группы файлов: {e}", exc_info=True)
             else:
-                logger.info(f"Файлы для пары '{title}' не найдены")
+                logger.debug("Файлы для пары '%s' не найдены", title)
             
         except Exception as e:
             logger.error(f"Ошибка при отправке уведомления о паре: {e}", exc_info=True)
@@ -300,7 +316,8 @@ class ScheduleNotifier:
                 logger.info(f"  Перерыв до пары '{event['title']}': {break_minutes:.0f} мин (предыдущая: '{prev_event['title']}' до {prev_event['end'].strftime('%H:%M')})")
             
             if 25 <= break_minutes <= 35:
-                logger.info(f"  >>> 30-минутный перерыв обнаружен! Уведомление за {self.notify_minutes_before_long_break} минут")
+                logger.debug("  30-минутный перерыв перед '%s': уведомление за %d минут",
+                             event["title"], self.notify_minutes_before_long_break)
                 return self.notify_minutes_before_long_break
         else:
             if self.test_mode:
@@ -1,14 +1,16 @@
-import requests
 import datetime
 import re
-from icalendar import Calendar
-from dateutil import rrule, tz 
-from dateutil.rrule import rrulestr, rruleset
+from dateutil import tz
+
+# requests, icalendar и dateutil.rrule импортируются при первом разборе расписания,
+# чтобы не замедлять запуск бота
 
 URL = "https://schedule-of.mirea.ru/?s=1_5578"
 
 
 def fetch_ics_from_json(url):
+    import requests
+
     headers = {"User-Agent": "Mozilla/5.0"}
     text = requests.get(url, headers=headers).text
 
@@ -28,6 +30,9 @@ def fetch_ics_from_json(url):
 
 
 def parse_schedule(ical_str):
+    from icalendar import Calendar
+    from dateutil.rrule import rrulestr, rruleset
+
     cal = Calendar.from_ical(ical_str)
     tz_moscow = tz.gettz("Europe/Moscow")
     events = []
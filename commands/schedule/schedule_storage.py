@@ -6,6 +6,9 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from dateutil import tz
 
+from utils.journal import JOURNAL_ENABLED, JsonJournal, write_snapshot
+from utils.lazy import LazyProxy
+
 logger = logging.getLogger(__name__)
 
 ALL_SUBJECTS = [
@@ -44,53 +47,79 @@ class ScheduleStorage:
     
     def __init__(self, storage_file="data/schedule_data.json"):
         self.storage_file = os.path.abspath(storage_file)  
-        logger.info(f"ScheduleStorage инициализирован с фай лом: {self.storage_file}")
+        logger.info("ScheduleStorage инициализирован с файлом: %s", self.storage_file)
+        self._journal = JsonJournal(self.storage_file) if JOURNAL_ENABLED else None
         self.data = self._load_data()
         self.moscow_tz = tz.gettz("Europe/Moscow")
+        
+        if self._journal and self._journal.needs_compaction():
+            self._save_data()
     
     def reload_data(self):
         self.data = self._load_data()
-        logger.info(f"Данные перезагружены. Файлы для пар: {list(self.data.get('lesson_files', {}).keys())}")
+        logger.debug("Данные перезагружены. Файлов для пар: %d", len(self.data.get("lesson_files", {})))
     
     def _load_data(self) -> Dict:
-        logger.info(f"Загрузка данных из файла: {self.storage_file}")
+        logger.debug("Загрузка данных из файла: %s", self.storage_file)
+        data = None
         if os.path.exists(self.storage_file):
             try:
                 with open(self.storage_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    logger.info(f"Данные загружены успешно. Ключи: {list(data.keys())}")
-                    lesson_files = data.get('lesson_files', {})
-                    logger.info(f"Загружено файлов для пар: {list(lesson_files.keys())}")
-                    return data
+                    logger.debug("Данные загружены. Ключи: %s, файлов для пар: %d",
+                                 list(data), len(data.get("lesson_files", {})))
             except Exception as e:
                 logger.error(f"Ошибка при загрузке данных: {e}", exc_info=True)
         else:
             logger.info(f"Файл не существует: {self.storage_file}")
         
-        return {
-            "notified_lessons": {},
-            "lesson_files": {},
-            "attendance_messages": {},
-            "attendance_requests": {}
-        }
+        if data is None:
+            data = {
+                "notified_lessons": {},
+                "lesson_files": {},
+                "attendance_messages": {},
+                "attendance_requests": {}
+            }
+        
+        if self._journal:
+            applied = self._journal.replay(data)
+            if applied:
+                logger.info(f"Применено записей журнала: {applied}")
+        
+        return data
     
     def _save_data(self):
         try:
-            os.makedirs(os.path.dirname(self.storage_file), exist_ok=True)
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
-            logger.info(f"Данные сохранены в {self.storage_file}")
-            logger.info(f"Сохранено файлов для пар: {list(self.data.get('lesson_files', {}).keys())}")
+            if self._journal:
+                self._journal.write_snapshot(self.data)
+            else:
+                write_snapshot(self.storage_file, self.data)
+            logger.debug("Данные сохранены в %s, файлов для пар: %d",
+                         self.storage_file, len(self.data.get("lesson_files", {})))
         except Exception as e:
             logger.error(f"Ошибка при сохранении данных: {e}", exc_info=True)
     
+    def _record(self, op: str, path: List[str], value=None):
+        if not self._journal:
+            self._save_data()
+            return
+        
+        try:
+            if self._journal.append(op, path, value):
+                logger.info(f"Журнал достиг порога ({self._journal.records} записей), сворачиваем в снимок")
+                self._save_data()
+        except Exception as e:
+            logger.error(f"Ошибка записи в журнал, сохраняем снимок целиком: {e}", exc_info=True)
+            self._save_data()
+    
     def was_notified(self, lesson_id: str) -> bool:
         self._cleanup_old_notifications()
         return lesson_id in self.data["notified_lessons"]
     
     def mark_as_notified(self, lesson_id: str):
-        self.data["notified_lessons"][lesson_id] = datetime.now(self.moscow_tz).isoformat()
-        self._save_data()
+        timestamp = datetime.now(self.moscow_tz).isoformat()
+        self.data["notified_lessons"][lesson_id] = timestamp
+        self._record("set", ["notified_lessons", lesson_id], timestamp)
     
     def _cleanup_old_notifications(self):
         now = datetime.now(self.moscow_tz)
@@ -148,29 +177,22 @@ class ScheduleStorage:
             
             stored_files = self.data.get("lesson_files", {})
             
-            logger.info(f"=== ПОИСК ФАЙЛОВ ===")
-            logger.info(f"Искомая пара: '{lesson_title}'")
-            logger.info(f"Файл хранилища: {self.storage_file}")
-            logger.info(f"Доступные предметы ({len(stored_files)}): {list(stored_files.keys())}")
-            
             if not stored_files:
-                logger.info(f"Хранилище пустое!")
+                logger.debug("Поиск файлов для '%s': хранилище пустое", lesson_title)
                 return []
             
             search_type, search_discipline = self._parse_lesson_name(lesson_title)
-            logger.info(f"Разбор искомой пары: тип='{search_type}', дисциплина='{search_discipline}'")
+            logger.debug("Поиск файлов для '%s': тип='%s', дисциплина='%s', предметов в хранилище: %d",
+                         lesson_title, search_type, search_discipline, len(stored_files))
             
             for stored_name, files in stored_files.items():
                 stored_type, stored_discipline = self._parse_lesson_name(stored_name)
-                logger.info(f"Сравниваем с '{stored_name}': тип='{stored_type}', дисциплина='{stored_discipline}'")
                 
                 if search_type == stored_type and search_discipline == stored_discipline:
-                    logger.info(f"СОВПАДЕНИЕ! '{stored_name}' -> {len(files)} файлов: {files}")
+                    logger.info("Файлы для '%s' найдены в '%s': %d", lesson_title, stored_name, len(files))
                     return files
-                else:
-                    logger.info(f"Нет совпадения: type_match={search_type == stored_type}, disc_match={search_discipline == stored_discipline}")
             
-            logger.info(f"Файлы для '{lesson_title}' не найдены")
+            logger.debug("Файлы для '%s' не найдены", lesson_title)
             return []
             
         except Exception as e:
@@ -190,41 +212,35 @@ class ScheduleStorage:
     def save_attendance_message(self, lesson_id: str, message_id: int, lesson_name: str = "", full_subject: str = "", 
                                  lesson_start: str = "", break_minutes: int = 10):
         
-        logger.info(f"=== СОХРАНЕНИЕ ДАННЫХ О ПАРЕ ===")
-        logger.info(f"lesson_id: {lesson_id}")
-        logger.info(f"message_id: {message_id}")
-        logger.info(f"lesson_name: '{lesson_name}'")
-        logger.info(f"full_subject: '{full_subject}'")
-        logger.info(f"lesson_start: {lesson_start}")
-        logger.info(f"break_minutes: {break_minutes}")
+        logger.debug("Сохранение данных о паре: lesson_id=%s, message_id=%s, lesson_name='%s', "
+                     "full_subject='%s', lesson_start=%s, break_minutes=%s",
+                     lesson_id, message_id, lesson_name, full_subject, lesson_start, break_minutes)
         
         self.data = self._load_data()
         
         if "attendance_messages" not in self.data:
             self.data["attendance_messages"] = {}
         
-        self.data["attendance_messages"][lesson_id] = {
+        message_info = {
             "message_id": message_id,
             "lesson_name": lesson_name,
             "full_subject": full_subject or lesson_name,
             "lesson_start": lesson_start,
             "break_minutes": break_minutes
         }
-        self._save_data()
+        self.data["attendance_messages"][lesson_id] = message_info
+        self._record("set", ["attendance_messages", lesson_id], message_info)
         
-        logger.info(f"✅ Данные сохранены. Всего записей: {len(self.data['attendance_messages'])}")
-        logger.info(f"Доступные lesson_id: {list(self.data['attendance_messages'].keys())}")
+        logger.info("✅ Данные о паре %s сохранены. Всего записей: %d", lesson_id, len(self.data["attendance_messages"]))
     
     def get_attendance_message_info(self, lesson_id: str) -> Optional[Dict]:
         self.data = self._load_data()
         
         result = self.data.get("attendance_messages", {}).get(lesson_id)
-        logger.info(f"=== ПОЛУЧЕНИЕ ДАННЫХ О ПАРЕ ===")
-        logger.info(f"Запрошен lesson_id: {lesson_id}")
-        logger.info(f"Результат: {result}")
+        logger.debug("Данные о паре %s: %s", lesson_id, result)
         if not result:
-            logger.warning(f"⚠️ Данные не найдены для lesson_id={lesson_id}")
-            logger.info(f"Доступные lesson_id: {list(self.data.get('attendance_messages', {}).keys())}")
+            logger.warning("⚠️ Данные не найдены для lesson_id=%s", lesson_id)
+            logger.debug("Доступные lesson_id: %s", list(self.data.get("attendance_messages", {})))
         return result
     
     def add_attendance_request(self, lesson_id: str, user_data: Dict):
@@ -234,7 +250,7 @@ class ScheduleStorage:
         user_id = user_data["user_id"]
         if not any(req["user_id"] == user_id for req in self.data["attendance_requests"][lesson_id]):
             self.data["attendance_requests"][lesson_id].append(user_data)
-            self._save_data()
+            self._record("append", ["attendance_requests", lesson_id], user_data)
             return True
         
         return False
@@ -252,3 +268,8 @@ class ScheduleStorage:
         self.data["notified_lessons"] = {}
         self._save_data()
         logger.info("Список уведомленных пар очищен")
+
+
+# Один экземпляр на файл: журнал и снимок ведет только он. Отдельные экземпляры
+# сворачивали бы журнал каждый из своей копии данных и теряли чужие записи.
+schedule_storage = LazyProxy(ScheduleStorage, "schedule_storage")
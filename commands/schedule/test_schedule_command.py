@@ -5,8 +5,10 @@ from datetime import datetime, timedelta
 from dateutil import tz
 import logging
 import os
+from typing import Optional
 
-from commands.group.group_manager import GroupManager, Role
+from commands.group.group_manager import Role
+from commands.group.member_context import has_role
 from commands.schedule.notifier_instance import get_notifier
 
 logger = logging.getLogger(__name__)
@@ -14,7 +16,7 @@ router = Router()
 
 
 @router.message(Command("test_schedule"))
-async def test_schedule_command(message: Message):
+async def test_schedule_command(message: Message, member: Optional[dict] = None, role: Optional[str] = None):
         
     test_mode = os.environ.get("TEST_MODE", "false").lower() == "true"
     if not test_mode:
@@ -28,14 +30,11 @@ async def test_schedule_command(message: Message):
         )
         return
     
-    group_manager = GroupManager()
-    member = group_manager.get_member(message.from_user.id)
-    
     if not member:
         await message.reply("❌ Вы не зарегистрированы в системе группы.")
         return
     
-    if member.get("role") != Role.STAROSTA.value:
+    if not has_role(role, Role.STAROSTA):
         await message.reply("❌ Эта команда доступна только старосте группы.")
         return
     
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
@@ -7,6 +9,7 @@ from aiogram.fsm.state import State, StatesGroup
 
 from commands.group.group_manager import group_manager
 from commands.notifications.notifications import get_notifications_keyboard, NOTIFICATION_TYPES
+from utils.callback_coalescer import callback_coalescer
 
 router = Router()
 
@@ -19,7 +22,7 @@ class RegistrationStates(StatesGroup):
 
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, state: FSMContext):
+async def cmd_start(message: Message, state: FSMContext, member: Optional[dict] = None):
     if message.chat.type != ChatType.PRIVATE:
         return
     
@@ -28,9 +31,10 @@ async def cmd_start(message: Message, state: FSMContext):
     user_id = message.from_user.id
     user_name = message.from_user.first_name
     
-    member = group_manager.get_member(user_id)
-    
     if member:
+        # Пользователь снова открыл бота — возвращаем его в рассылки
+        if group_manager.reactivate_recipient(user_id):
+            member.pop("delivery", None)
         await show_user_info(message, member, user_name)
     else:
         await message.answer(
@@ -80,10 +84,7 @@ async def show_user_info(message_or_callback, member: dict, user_name: str):
 
 
 @router.callback_query(F.data == "notifications_menu")
-async def show_notifications_menu(callback: CallbackQuery):
-    user_id = callback.from_user.id
-    member = group_manager.get_member(user_id)
-    
+async def show_notifications_menu(callback: CallbackQuery, member: Optional[dict] = None):
     if not member:
         await callback.answer("❌ Вы не зарегистрированы!", show_alert=True)
         return
@@ -157,9 +158,8 @@ def get_notifications_keyboard_with_back(notifications: dict) -> InlineKeyboardM
 
 
 @router.callback_query(F.data.startswith("start_toggle_"))
-async def toggle_notification_from_start(callback: CallbackQuery):
+async def toggle_notification_from_start(callback: CallbackQuery, member: Optional[dict] = None):
     user_id = callback.from_user.id
-    member = group_manager.get_member(user_id)
     
     if not member:
         await callback.answer("❌ Вы не зарегистрированы!", show_alert=True)
@@ -188,7 +188,8 @@ async def toggle_notification_from_start(callback: CallbackQuery):
     enabled_count = sum(1 for v in notifications.values() if v)
     total_count = len(notifications)
     
-    await callback.message.edit_text(
+    await callback_coalescer.edit_text(
+        callback,
         f"🔔 <b>Настройки уведомлений</b>\n\n"
         f"Выберите, какие уведомления вы хотите получать:\n\n"
         f"🟢 - уведомление <b>включено</b>\n"
@@ -199,10 +200,8 @@ async def toggle_notification_from_start(callback: CallbackQuery):
 
 
 @router.callback_query(F.data == "start_back_to_info")
-async def back_to_user_info(callback: CallbackQuery):
-    user_id = callback.from_user.id
+async def back_to_user_info(callback: CallbackQuery, member: Optional[dict] = None):
     user_name = callback.from_user.first_name
-    member = group_manager.get_member(user_id)
     
     if not member:
         await callback.answer("❌ Вы не зарегистрированы!", show_alert=True)
@@ -469,7 +468,7 @@ async def toggle_registration_notification(callback: CallbackQuery, state: FSMCo
     
     await state.update_data(temp_notifications=temp_notifications)
     keyboard = get_registration_notifications_keyboard(temp_notifications)
-    await callback.message.edit_reply_markup(reply_markup=keyboard)
+    await callback_coalescer.edit_reply_markup(callback, keyboard)
 
 
 @router.callback_query(F.data == "reg_finish", RegistrationStates.waiting_for_notifications)
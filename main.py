@@ -1,8 +1,12 @@
+# Первым импортом: отсчет времени запуска
+from utils import startup
+
 import os 
 from dotenv import *
 
 import asyncio
 import logging
+import signal
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
@@ -15,7 +19,14 @@ from commands.utils.myid import router as myid_router
 from commands.notifications.notifications import router as notifications_router
 from commands.notifications.notifications_command import router as notifications_command_router
 from commands.notifications.notification_panel_command import router as notification_panel_router
+from commands.notifications.broadcast_queue import (
+    router as broadcast_queue_router,
+    BroadcastQueue,
+    set_broadcast_queue
+)
 from commands.group.admin_command import router as admin_router
+from commands.group.group_manager import group_manager
+from commands.group.member_context import MemberContextMiddleware
 from commands.schedule.schedule_command import router as schedule_router
 from commands.schedule.attendance_handler import router as attendance_router
 from commands.schedule.file_manager_command import router as file_manager_router
@@ -25,6 +36,12 @@ from commands.schedule import notifier_instance
 from commands.greetings.greetings_command import router as greetings_router
 from commands.greetings.greetings_command import setup_scheduler as setup_greetings_scheduler
 from commands.greetings.greetings_command import start_scheduler as start_greetings_scheduler
+from commands.greetings.greetings_command import pause_scheduler as pause_greetings_scheduler
+from commands.greetings.greetings_command import close_providers as close_greeting_providers
+from commands.greetings.greetings_command import flush_stores as flush_greeting_stores
+from commands.greetings.greetings_command import stop_scheduler as stop_greetings_scheduler
+from commands.greetings.greetings_command import greeting_jobs
+from utils.image_pipeline import shutdown_image_pipeline
 # from commands.schedule.headman_checker import (
 #     router as headman_checker_router,
 #     HeadmanChecker,
@@ -42,16 +59,63 @@ from commands.homework.weekly_digest import (
     set_weekly_digest_notifier
 )
 from commands.homework.homework_storage import homework_storage
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from utils.fsm_storage import create_fsm_storage
+from utils.metrics import setup_metrics
+from utils.admission import AdmissionMiddleware
+from utils.loop_watchdog import LOOP_WATCHDOG, loop_watchdog
+from utils.logging_setup import setup_logging, shutdown_logging
+from utils.lifecycle import LifecycleManager, TaskTracker, UpdateTrackingMiddleware, drain_task
+from utils.leader import LeaderElector
+from utils.web_server import (
+    BOT_RUN_MODE,
+    SERVICE_HOST,
+    create_app,
+    create_service_app,
+    get_service_port,
+    get_web_server_port,
+    get_webhook_secret,
+    get_webhook_url,
+    start_web_server
 )
+
+setup_logging()
 logger = logging.getLogger(__name__)
 load_dotenv()
 
 BOT_TOKEN = os.environ.get("BOT_TOKEN")
 
+BOT_COMMANDS = [
+    BotCommand(command="start", description="🏠 Главное меню / Регистрация"),
+    BotCommand(command="help", description="❓ Помощь"),
+    BotCommand(command="hello", description="👋 Поздороваться"),
+    BotCommand(command="schedule", description="📚 Расписание на неделю"),
+    BotCommand(command="today", description="📚 Расписание на сегодня"),
+    BotCommand(command="notifications", description="🔔 Настройки уведомлений"),
+    BotCommand(command="notif_panel", description="📢 Панель уведомлений (Староста)"),
+    BotCommand(command="admin", description="👨‍💼 Панель администратора"),
+    BotCommand(command="myid", description="🆔 Узнать свой ID"),
+    BotCommand(command="manage_files", description="📂 Управление файлов для пар (Староста)"),
+    BotCommand(command="test_schedule", description="🧪 Тест уведомлений (Староста)"),
+    BotCommand(command="preview", description="👀 Предпросмотр приветствия (Админ)"),
+    BotCommand(command="greeting_schedule", description="📅 Расписание приветствий (Админ)"),
+    BotCommand(command="greeting_config", description="⚙️ Настройки приветствий (Админ)"),
+    BotCommand(command="homework", description="📚 Домашние задания и КМ"),
+    BotCommand(command="hw_today", description="📝 Задания на сегодня"),
+    BotCommand(command="hw_tomorrow", description="📝 Задания на завтра"),
+    BotCommand(command="hw_week", description="📝 Задания на неделю"),
+    BotCommand(command="test_digest", description="🧪 Тест еженедельного дайджеста (Староста)"),
+]
+
+startup.mark("импорты")
+
+
+async def set_bot_commands(bot: Bot):
+    # Список команд почти не меняется — обновляем в фоне, не задерживая прием обновлений
+    try:
+        await bot.set_my_commands(BOT_COMMANDS, scope=BotCommandScopeDefault())
+    except Exception as e:
+        logger.error(f"Не удалось обновить список команд: {e}")
+
 
 async def main():
     bot = Bot(
@@ -59,7 +123,17 @@ async def main():
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     
-    dp = Dispatcher()
+    dp = Dispatcher(storage=create_fsm_storage())
+    # Обработчики обновлений идут отдельными задачами, которые при остановке никто не ждет
+    update_tasks = TaskTracker("обновление")
+    dp.update.outer_middleware(UpdateTrackingMiddleware(update_tasks))
+    dp.update.outer_middleware(startup.FirstUpdateMiddleware())
+    setup_metrics(dp, bot)
+    dp.update.outer_middleware(MemberContextMiddleware())
+    dp.message.outer_middleware(AdmissionMiddleware())
+    
+    if LOOP_WATCHDOG:
+        loop_watchdog.start()
     
     dp.include_router(start_router)
     dp.include_router(help_router)
@@ -68,6 +142,7 @@ async def main():
     dp.include_router(notifications_router)
     dp.include_router(notifications_command_router)
     dp.include_router(notification_panel_router)
+    dp.include_router(broadcast_queue_router)
     dp.include_router(admin_router)
     dp.include_router(schedule_router)
     dp.include_router(attendance_router)
@@ -78,6 +153,7 @@ async def main():
     dp.include_router(homework_router)
     dp.include_router(view_homework_router)
     dp.include_router(weekly_digest_router)
+    startup.mark("диспетчер")
     
     cleanup_result = homework_storage.cleanup_old_weeks()
     if cleanup_result["removed_homework_weeks"] or cleanup_result["removed_control_weeks"]:
@@ -90,33 +166,11 @@ async def main():
     else:
         logger.info(f"🧹 Очистка не требуется. Текущая учебная неделя: {cleanup_result['current_week']}")
     
-    commands = [
-        BotCommand(command="start", description="🏠 Главное меню / Регистрация"),
-        BotCommand(command="help", description="❓ Помощь"),
-        BotCommand(command="hello", description="👋 Поздороваться"),
-        BotCommand(command="schedule", description="📚 Расписание на неделю"),
-        BotCommand(command="today", description="📚 Расписание на сегодня"),
-        BotCommand(command="notifications", description="🔔 Настройки уведомлений"),
-        BotCommand(command="notif_panel", description="📢 Панель уведомлений (Староста)"),
-        BotCommand(command="admin", description="👨‍💼 Панель администратора"),
-        BotCommand(command="myid", description="🆔 Узнать свой ID"),
-        BotCommand(command="manage_files", description="📂 Управление файлов для пар (Староста)"),
-        BotCommand(command="test_schedule", description="🧪 Тест уведомлений (Староста)"),
-        BotCommand(command="preview", description="👀 Предпросмотр приветствия (Админ)"),
-        BotCommand(command="greeting_schedule", description="📅 Расписание приветствий (Админ)"),
-        BotCommand(command="greeting_config", description="⚙️ Настройки приветствий (Админ)"),
-        BotCommand(command="homework", description="📚 Домашние задания и КМ"),
-        BotCommand(command="hw_today", description="📝 Задания на сегодня"),
-        BotCommand(command="hw_tomorrow", description="📝 Задания на завтра"),
-        BotCommand(command="hw_week", description="📝 Задания на неделю"),
-        BotCommand(command="test_digest", description="🧪 Тест еженедельного дайджеста (Староста)"),
-    ]
-    await bot.set_my_commands(commands, scope=BotCommandScopeDefault())
+    commands_task = asyncio.create_task(set_bot_commands(bot))
     
     logger.info("Бот запущен и готов к работе!")
     
     setup_greetings_scheduler(bot)
-    start_greetings_scheduler()
     logger.info("✅ Система приветствий инициализирована")
     
     schedule_notifier = ScheduleNotifier(bot)
@@ -143,44 +197,129 @@ async def main():
     set_weekly_digest_notifier(weekly_digest_notifier)
     logger.info("WeeklyDigestNotifier создан и зарегистрирован")
     
-    notifier_task = asyncio.create_task(schedule_notifier.start())
-    logger.info(f"ScheduleNotifier запущен, is_running={schedule_notifier.is_running}")
+    broadcast_queue = BroadcastQueue(bot)
+    set_broadcast_queue(broadcast_queue)
+    logger.info("BroadcastQueue создан")
+    
+    # Прием обновлений и фоновые рассылки — работа лидера (utils.leader): хранилища
+    # обработчиков — кэши в памяти процесса, поэтому резервные экземпляры не поллят
+    # и не поднимают публичный webhook-сервер, пока не получат аренду
+    background_tasks = {}
+    receiver = {}
+    stop_event = asyncio.Event()
     
-    birthday_task = asyncio.create_task(birthday_notifier.start())
-    logger.info("BirthdayNotifier запущен")
+    def on_polling_done(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Polling остановился с ошибкой: {task.exception()}")
+            stop_event.set()
     
-    digest_task = asyncio.create_task(weekly_digest_notifier.start())
-    logger.info("WeeklyDigestNotifier запущен")
+    async def start_receiving():
+        if BOT_RUN_MODE == "webhook":
+            await bot.set_webhook(
+                url=get_webhook_url(),
+                secret_token=get_webhook_secret(BOT_TOKEN),
+                allowed_updates=dp.resolve_used_update_types()
+            )
+            receiver["runner"] = await start_web_server(create_app(dp, bot), get_web_server_port())
+            logger.info(f"Бот получает обновления через webhook: {get_webhook_url()}")
+        else:
+            await bot.delete_webhook(drop_pending_updates=startup.DROP_PENDING_UPDATES)
+            polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+            polling.add_done_callback(on_polling_done)
+            receiver["polling"] = polling
+        startup.mark("готов к приему обновлений")
+    
+    async def stop_receiving():
+        runner = receiver.pop("runner", None)
+        if runner:
+            await runner.cleanup()
+        polling = receiver.pop("polling", None)
+        if polling and not polling.done():
+            try:
+                await dp.stop_polling()
+            except RuntimeError:
+                # Задача еще не дошла до запуска polling
+                polling.cancel()
+        await drain_task(polling)
+    
+    async def start_background():
+        await start_receiving()
+        start_greetings_scheduler()
+        
+        resumed_broadcasts = broadcast_queue.resume_pending()
+        logger.info(f"Возобновлено незавершенных рассылок: {resumed_broadcasts}")
+        
+        background_tasks["schedule"] = asyncio.create_task(schedule_notifier.start())
+        background_tasks["birthday"] = asyncio.create_task(birthday_notifier.start())
+        background_tasks["digest"] = asyncio.create_task(weekly_digest_notifier.start())
+        logger.info("ScheduleNotifier, BirthdayNotifier и WeeklyDigestNotifier запущены")
+    
+    async def stop_background():
+        # Сначала перестаем получать обновления и дожидаемся начатых обработчиков:
+        # они могут поставить рассылку, которую затем остановит drain очереди
+        await stop_receiving()
+        await update_tasks.drain()
+        pause_greetings_scheduler()
+        await drain_task(background_tasks.pop("schedule", None), schedule_notifier.stop)
+        await drain_task(background_tasks.pop("birthday", None), birthday_notifier.stop)
+        await drain_task(background_tasks.pop("digest", None), weekly_digest_notifier.stop)
+        # Незавершенные рассылки продолжит новый лидер
+        await broadcast_queue.drain()
+    
+    leader = LeaderElector(start_background, stop_background)
     
     logger.info("✅ Система домашних заданий и КМ инициализирована")
     
+    service_runners = []
+    
+    async def stop_service_server():
+        for runner in service_runners:
+            await runner.cleanup()
+    
+    def flush_group_data():
+        if group_manager.lazy_initialized:
+            group_manager.flush()
+    
+    # Порядок остановки: сначала прием обновлений и источники новой работы,
+    # затем дожидаемся начатых отправок, в конце сбрасываем хранилища и закрываем сессию
+    lifecycle = LifecycleManager()
+    lifecycle.register("прием обновлений и фоновые задачи лидера", leader.stop, pending=update_tasks.get_unfinished)
+    lifecycle.register("планировщик приветствий", stop_greetings_scheduler, pending=greeting_jobs.get_unfinished)
+    lifecycle.register("очередь рассылок", broadcast_queue.drain, pending=broadcast_queue.get_unfinished)
+    lifecycle.register("команды бота", lambda: drain_task(commands_task))
+    lifecycle.register("провайдеры приветствий", close_greeting_providers)
+    lifecycle.register("хранилища приветствий", flush_greeting_stores, force=True)
+    lifecycle.register("реестр группы", flush_group_data, force=True)
+    lifecycle.register("FSM-хранилище", dp.storage.close, force=True)
+    lifecycle.register("обработка изображений", shutdown_image_pipeline)
+    if LOOP_WATCHDOG:
+        lifecycle.register("сторож цикла", loop_watchdog.stop)
+    lifecycle.register("служебный сервер", stop_service_server)
+    lifecycle.register("сессия бота", bot.session.close, force=True)
+    
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot)
+        service_port = get_service_port()
+        if service_port:
+            service_runners.append(await start_web_server(create_service_app(), service_port, host=SERVICE_HOST))
+        
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+        
+        await leader.start()
+        if not leader.is_leader:
+            logger.info("Экземпляр в резерве: обновления и фоновые задачи начнет обрабатывать после получения аренды")
+        await stop_event.wait()
     finally:
-        schedule_notifier.stop()
-        birthday_notifier.stop()
-        weekly_digest_notifier.stop()  
-        notifier_task.cancel()
-        birthday_task.cancel()
-        digest_task.cancel()  
-        try:
-            await notifier_task
-        except asyncio.CancelledError:
-            pass
-        try:
-            await birthday_task
-        except asyncio.CancelledError:
-            pass
-        try:
-            await digest_task   
-        except asyncio.CancelledError:
-            pass
-        await bot.session.close()
-
+        await lifecycle.shutdown()
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
+    finally:
+        shutdown_logging()
@@ -0,0 +1,80 @@
+"""
+Бенчмарк FSM-хранилищ: накладные расходы на один переход состояния
+(set_state + update_data + get_state + get_data) для MemoryStorage и SQLiteStorage,
+а также время фоновой записи на диск.
+
+Запуск из корня проекта:
+    python test/fsm_storage_benchmark.py --users 200 --steps 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from utils.fsm_storage import SQLiteStorage
+
+STATES = [
+    "HomeworkStates:choosing_subject",
+    "HomeworkStates:entering_task",
+    "HomeworkStates:choosing_date",
+    "HomeworkStates:confirming",
+]
+
+
+async def run_transitions(storage, users: int, steps: int) -> list:
+    timings = []
+    for step in range(steps):
+        for user_id in range(users):
+            key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+            started = time.perf_counter()
+            await storage.set_state(key, STATES[step % len(STATES)])
+            await storage.update_data(key, {"subject": "Математический анализ", "current_page": step})
+            await storage.get_state(key)
+            await storage.get_data(key)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+    return timings
+
+
+def report(title: str, timings: list):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{title:<28} среднее {statistics.mean(timings):>7.1f} мкс   p50 {timings[len(timings) // 2]:>7.1f}   p99 {p99:>7.1f}")
+
+
+async def main(users: int, steps: int):
+    print(f"Переходов: {users * steps} ({users} пользователей × {steps} шагов)\n")
+
+    memory = MemoryStorage()
+    report("MemoryStorage", await run_transitions(memory, users, steps))
+    await memory.close()
+
+    path = os.path.join(tempfile.mkdtemp(), "fsm.sqlite3")
+    sqlite = SQLiteStorage(path, flush_interval=3600)
+    report("SQLiteStorage (без записи)", await run_transitions(sqlite, users, steps))
+
+    started = time.perf_counter()
+    await sqlite.flush()
+    print(f"\nЗапись {users} состояний одной транзакцией: {(time.perf_counter() - started) * 1000:.1f} мс")
+    await sqlite.close()
+
+    started = time.perf_counter()
+    restored = SQLiteStorage(path)
+    print(f"Загрузка после перезапуска: {(time.perf_counter() - started) * 1000:.1f} мс, "
+          f"состояний: {len(restored._records)}, файл {os.path.getsize(path) / 1024:.0f} КБ")
+    await restored.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.steps))
@@ -0,0 +1,174 @@
+"""
+Бенчмарк генерации приветствий против локальной заглушки провайдеров
+(test/provider_stub_server.py): сквозная задержка «текст + картинка»
+и время блокировки event loop в разных сценариях.
+
+Запуск из корня проекта:
+    python test/greeting_benchmark.py
+    python test/greeting_benchmark.py --scenario slow --scenario flaky --runs 5
+
+Код возврата 1, если максимальная задержка тика event loop превысила --max-lag-ms —
+так регрессии асинхронной миграции ловятся без живых сервисов.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_SERVER = os.path.join(ROOT, "test", "provider_stub_server.py")
+
+SCENARIOS = {
+    "fast": ["--latency", "0.3"],
+    "slow": ["--latency", "6", "--jitter", "2"],
+    "flaky": ["--latency", "1", "--error-rate", "0.4"],
+    "cold_start": ["--latency", "1", "--loading", "1"],
+    "large_payload": ["--latency", "0.5", "--image-size", "2048", "--text-length", "900"],
+}
+
+TICK = 0.01
+
+
+def configure_env(port: int):
+    base = f"http://127.0.0.1:{port}"
+    os.environ.update({
+        "HF_TOKEN": "stub",
+        "HF_IMAGE_URL": f"{base}/models/flux",
+        "OPENROUTER_API_KEY": "stub",
+        "OPENROUTER_API_URL": f"{base}/api/v1/chat/completions",
+        "WISPBYTE_API_URL": base,
+        "WISPBYTE_API_KEY": "stub",
+        "FUSIONBRAIN_URL": f"{base}/",
+        "FUSIONBRAIN_API_KEY": "stub",
+        "FUSIONBRAIN_SECRET_KEY": "stub",
+        # Меряем генерацию в момент отправки, без очереди готовых текстов
+        "GREETING_TEXT_BATCH": "0",
+    })
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"Заглушка не поднялась на порту {port}")
+
+
+class LoopMonitor:
+    """Фиксирует, насколько тики event loop опаздывают относительно расписания."""
+
+    def __init__(self):
+        self.lags = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            self.lags.append(max(0.0, time.perf_counter() - started - TICK))
+
+    def start(self):
+        self.lags = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    @property
+    def max_lag_ms(self) -> float:
+        return max(self.lags, default=0.0) * 1000
+
+    @property
+    def blocked_ms(self) -> float:
+        # Суммарное время, когда loop был занят дольше 50 мс подряд
+        return sum(lag for lag in self.lags if lag > 0.05) * 1000
+
+
+async def run_scenario(greetings, runs: int) -> dict:
+    from utils.provider_router import ProviderHealth
+
+    for router in (greetings.text_router, greetings.image_router):
+        for name in router.health:
+            router.health[name] = ProviderHealth(name)
+
+    monitor = LoopMonitor()
+    monitor.start()
+
+    latencies, images = [], 0
+    for i in range(runs):
+        kind = "morning" if i % 2 == 0 else "evening"
+        started = time.perf_counter()
+        await greetings.generate_greeting_text(kind)
+        image = await greetings.generate_greeting_image(kind)
+        latencies.append(time.perf_counter() - started)
+        images += image is not None
+
+    await monitor.stop()
+    return {
+        "p50": statistics.median(latencies),
+        "max": max(latencies),
+        "images": images,
+        "max_lag_ms": monitor.max_lag_ms,
+        "blocked_ms": monitor.blocked_ms,
+    }
+
+
+async def main(args) -> int:
+    configure_env(args.port)
+    # Данные бота (data/...) пишем во временный каталог
+    sys.path.insert(0, ROOT)
+    os.chdir(tempfile.mkdtemp(prefix="greeting_bench_"))
+
+    from commands.greetings import greetings_command as greetings
+    from utils.image_pipeline import shutdown_image_pipeline
+
+    print(f"{'сценарий':<14} {'p50, с':>8} {'max, с':>8} {'картинок':>9} {'max lag, мс':>12} {'блокировка, мс':>15}")
+    exit_code = 0
+
+    try:
+        for name in args.scenario or SCENARIOS:
+            stub = subprocess.Popen(
+                [sys.executable, STUB_SERVER, "--port", str(args.port), *SCENARIOS[name]],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_for_port(args.port)
+                result = await run_scenario(greetings, args.runs)
+            finally:
+                stub.terminate()
+                stub.wait()
+
+            print(
+                f"{name:<14} {result['p50']:>8.1f} {result['max']:>8.1f} "
+                f"{result['images']:>4}/{args.runs:<4} {result['max_lag_ms']:>12.1f} {result['blocked_ms']:>15.1f}"
+            )
+            if result["max_lag_ms"] > args.max_lag_ms:
+                exit_code = 1
+    finally:
+        await greetings.close_providers()
+        shutdown_image_pipeline()
+
+    if exit_code:
+        print(f"\n❌ Event loop блокировался дольше {args.max_lag_ms:.0f} мс")
+    return exit_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--max-lag-ms", type=float, default=200.0)
+    sys.exit(asyncio.run(main(parser.parse_args())))
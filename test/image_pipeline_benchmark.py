@@ -0,0 +1,98 @@
+"""
+Бенчмарк постобработки картинок: время кодирования и размер результата
+для разных настроек, а также задержка event loop при обработке
+в основном потоке и в пуле процессов.
+
+Запуск из корня проекта:
+    python test/image_pipeline_benchmark.py
+"""
+import asyncio
+import io
+import os
+import statistics
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.image_pipeline import process_image, process_image_async, shutdown_image_pipeline
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mirea_cats")
+
+VARIANTS = [
+    ("старый: JPEG q90, без ресайза", dict(max_side=100000, quality=90, progressive=False, max_bytes=10 ** 9)),
+    ("1280, q87, progressive", dict(max_side=1280, quality=87, progressive=True)),
+    ("1280, q87, baseline", dict(max_side=1280, quality=87, progressive=False)),
+    ("1024, q85, progressive", dict(max_side=1024, quality=85, progressive=True)),
+    ("1280, cap 300 КБ", dict(max_side=1280, quality=87, progressive=True, max_bytes=300 * 1024)),
+]
+
+
+def load_sources() -> list[bytes]:
+    sources = []
+    for filename in sorted(os.listdir(SOURCE_DIR)):
+        with open(os.path.join(SOURCE_DIR, filename), 'rb') as f:
+            sources.append(f.read())
+    return sources
+
+
+def bench_variants(sources: list[bytes]):
+    print(f"{'вариант':<34} {'мс/шт':>8} {'КБ (ср.)':>10} {'разрешение':>12}")
+    for title, options in VARIANTS:
+        timings, sizes = [], []
+        resolution = ""
+        for image_bytes in sources:
+            started = time.perf_counter()
+            result = process_image(image_bytes, **options)
+            timings.append((time.perf_counter() - started) * 1000)
+            sizes.append(len(result) / 1024)
+            resolution = "x".join(map(str, Image.open(io.BytesIO(result)).size))
+        print(f"{title:<34} {statistics.mean(timings):>8.1f} {statistics.mean(sizes):>10.1f} {resolution:>12}")
+
+
+async def measure_loop_lag(work) -> tuple[float, float]:
+    """Максимальная задержка тика event loop (мс) и общее время работы (с)."""
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append((time.perf_counter() - started - 0.01) * 1000)
+
+    ticker_task = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker_task
+    return max(lags, default=0.0), elapsed
+
+
+async def bench_loop(sources: list[bytes]):
+    async def inline():
+        for image_bytes in sources:
+            process_image(image_bytes)
+            await asyncio.sleep(0)
+
+    async def in_pool():
+        for image_bytes in sources:
+            await process_image_async(image_bytes)
+
+    await process_image_async(sources[0])  # прогрев пула процессов
+
+    for title, work in (("в event loop", inline), ("в пуле процессов", in_pool)):
+        lag, elapsed = await measure_loop_lag(work)
+        print(f"{title:<20} макс. задержка loop: {lag:>7.1f} мс, всего: {elapsed:.2f} с")
+
+
+if __name__ == "__main__":
+    sources = load_sources()
+    print(f"Исходников: {len(sources)}, средний размер {statistics.mean(map(len, sources)) / 1024:.0f} КБ\n")
+    bench_variants(sources)
+    print()
+    asyncio.run(bench_loop(sources))
+    shutdown_image_pipeline()
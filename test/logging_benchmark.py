@@ -0,0 +1,150 @@
+"""
+Бенчмарк стоимости логирования на одно обновление: строка aiogram "Update is handled"
+плюс обращения к ScheduleStorage, как в обработчике отметки на паре
+(get_attendance_message_info + get_lesson_files).
+
+- before: ScheduleStorage из ревизии --before-ref (по умолчанию — коммит перед
+  появлением utils/logging_setup.py, исходник берется через git show) и
+  logging.basicConfig(level=INFO), как было в main.py;
+- after: текущий ScheduleStorage и utils.logging_setup (очередь, выборка
+  aiogram.event, новые уровни).
+
+Запуск из корня проекта (нужен git-репозиторий с историей):
+    python test/logging_benchmark.py --updates 2000 --subjects 30
+    python test/logging_benchmark.py --before-ref <ревизия>
+"""
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from commands.schedule import schedule_storage
+from utils import logging_setup
+
+STORAGE_PATH = "commands/schedule/schedule_storage.py"
+
+CHATTY_LOGGERS = ["commands.schedule.schedule_storage", "commands.schedule.schedule_notifier"]
+
+
+class CountingStream:
+    """Поток-заглушка: считает строки и ничего не пишет."""
+
+    def __init__(self):
+        self.lines = 0
+
+    def write(self, text: str):
+        self.lines += text.count("\n")
+
+    def flush(self):
+        pass
+
+
+def git(*args: str) -> str:
+    return subprocess.run(["git", *args], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+
+
+def default_before_ref() -> str:
+    added = git("log", "--diff-filter=A", "--format=%H", "--", "utils/logging_setup.py").split()
+    if not added:
+        raise SystemExit("utils/logging_setup.py нет в истории git, укажите --before-ref")
+    return f"{added[-1]}~1"
+
+
+def load_storage_module(ref: str) -> types.ModuleType:
+    """Модуль хранилища из ревизии ref под тем же именем, чтобы совпадали имена логгеров."""
+    module = types.ModuleType(schedule_storage.__name__)
+    module.__file__ = schedule_storage.__file__
+    exec(compile(git("show", f"{ref}:{STORAGE_PATH}"), f"{ref}:{STORAGE_PATH}", "exec"), module.__dict__)
+    return module
+
+
+def make_storage(module: types.ModuleType, subjects: int):
+    storage = module.ScheduleStorage(os.path.join(tempfile.mkdtemp(), "schedule_data.json"))
+    all_subjects = module.ALL_SUBJECTS
+    for subject in (all_subjects * (subjects // len(all_subjects) + 1))[:subjects]:
+        storage.data["lesson_files"][subject] = [f"data/files/{subject}.pdf"]
+    storage.data["attendance_messages"]["lesson"] = {"message_id": 1, "lesson_name": "Физика"}
+    storage._save_data()
+    return storage
+
+
+def run_updates(storage, updates: int) -> list:
+    event_logger = logging.getLogger("aiogram.event")
+    timings = []
+    for update_id in range(updates):
+        started = time.perf_counter()
+        event_logger.info("Update id=%s is handled. Duration %d ms by bot id=%d", update_id, 12, 1)
+        storage.get_attendance_message_info("lesson")
+        storage.get_lesson_files("lesson", "ЛК Введение в профессиональную деятельность")
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    return timings
+
+
+def reset_logging():
+    logging_setup.shutdown_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for name in CHATTY_LOGGERS + ["aiogram.event"]:
+        logging.getLogger(name).setLevel(logging.NOTSET)
+
+
+def report(title: str, timings: list, drain_ms: float, stream: CountingStream):
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(f"{title:<8} среднее {statistics.mean(timings):>7.1f} мкс   p50 {timings[len(timings) // 2]:>7.1f}   "
+          f"p99 {p99:>7.1f}   строк лога {stream.lines:>6}   дозапись {drain_ms:>6.1f} мс")
+
+
+def run_without_logging(storage, updates: int) -> float:
+    logging.disable(logging.CRITICAL)
+    try:
+        return statistics.mean(run_updates(storage, updates))
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def main(updates: int, subjects: int, before_ref: str):
+    before_storage = make_storage(load_storage_module(before_ref), subjects)
+    storage = make_storage(schedule_storage, subjects)
+    print(f"Обновлений: {updates}, предметов с файлами: {subjects}, before: {git('rev-parse', '--short', before_ref).strip()}\n")
+
+    # Свое время хранилища без логирования, чтобы было с чем сравнивать
+    print(f"{'без логов':<8} before {run_without_logging(before_storage, updates):>7.1f} мкс   "
+          f"after {run_without_logging(storage, updates):>7.1f} мкс")
+
+    # Прежний main.py: logging.basicConfig(level=INFO) с синхронным StreamHandler
+    stream = CountingStream()
+    logging.basicConfig(level=logging.INFO, format=logging_setup.TEXT_FORMAT, stream=stream, force=True)
+    timings = run_updates(before_storage, updates)
+    report("before", timings, 0.0, stream)
+    reset_logging()
+
+    stream = CountingStream()
+    stderr, sys.stderr = sys.stderr, stream
+    try:
+        logging_setup.setup_logging()
+        timings = run_updates(storage, updates)
+        started = time.perf_counter()
+        logging_setup.shutdown_logging()
+        report("after", timings, (time.perf_counter() - started) * 1000, stream)
+    finally:
+        sys.stderr = stderr
+        reset_logging()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--subjects", type=int, default=30)
+    parser.add_argument("--before-ref", help="ревизия git с прежним логированием")
+    args = parser.parse_args()
+    main(args.updates, args.subjects, args.before_ref or default_before_ref())
@@ -10,7 +10,8 @@ HF_TOKEN = ...
 # НОВЫЙ АДРЕС (Router API)
 # Мы указываем модель прямо в пути после /models/
 # Используем SCHNELL, но через правильный эндпоинт
-API_URL = "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell"
+# Для проверки без сети: HF_IMAGE_URL=http://127.0.0.1:8089/models/flux (test/provider_stub_server.py)
+API_URL = os.getenv("HF_IMAGE_URL", "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell")
 headers = {"Authorization": f"Bearer {HF_TOKEN}"}
 
 def generate_hq_cat(prompt_subject, folder="mirea_cats"):
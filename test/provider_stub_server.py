@@ -0,0 +1,168 @@
+"""
+Локальная заглушка всех AI-провайдеров бота: HuggingFace Inference (FLUX),
+OpenRouter, wispbyte и FusionBrain. Повторяет их HTTP-контракты и позволяет
+настроить задержку, долю ошибок, ответы 503 «модель загружается» и размер
+ответов.
+
+Запуск:
+    python test/provider_stub_server.py --latency 3 --loading 1 --error-rate 0.2
+
+Затем в .env бота:
+    HF_IMAGE_URL=http://127.0.0.1:8089/models/flux
+    OPENROUTER_API_URL=http://127.0.0.1:8089/api/v1/chat/completions
+    WISPBYTE_API_URL=http://127.0.0.1:8089
+    FUSIONBRAIN_URL=http://127.0.0.1:8089/
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import random
+import time
+import uuid
+
+from aiohttp import web
+from PIL import Image
+
+DEFAULT_CONFIG = {
+    "latency": 2.0,
+    "jitter": 0.0,
+    "error_rate": 0.0,
+    "loading": 0,
+    "image_size": 1024,
+    "text_length": 200,
+    "fusion_render_time": 10.0
+}
+
+
+def make_image(width: int, height: int, noise: bool = True) -> bytes:
+    # Шум плохо сжимается — размер ответа ближе к настоящим картинкам
+    if noise:
+        img = Image.frombytes("RGB", (width, height), random.randbytes(width * height * 3))
+    else:
+        img = Image.new("RGB", (width, height), tuple(random.randint(0, 255) for _ in range(3)))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def make_text(length: int) -> str:
+    words = ["Доброе", "утро,", "ИКБО-31-25!", "Кофе", "уже", "ждет,", "пары", "тоже", "☕️"]
+    text = ""
+    while len(text) < length:
+        text += random.choice(words) + " "
+    return text[:length].strip()
+
+
+def create_app(config: dict = None) -> web.Application:
+    """config можно менять на лету — обработчики читают его при каждом запросе."""
+    config = config if config is not None else dict(DEFAULT_CONFIG)
+    state = {"requests": 0, "hf_requests": 0, "fusion_jobs": {}}
+
+    async def simulate() -> web.Response | None:
+        state["requests"] += 1
+        await asyncio.sleep(config["latency"] + random.uniform(0, config["jitter"]))
+        if random.random() < config["error_rate"]:
+            return web.json_response({"error": "Internal error"}, status=500)
+        return None
+
+    async def hf_generate(request: web.Request) -> web.Response:
+        payload = await request.json()
+        params = payload.get("parameters", {})
+
+        # Первые loading запросов имитируют «модель просыпается»
+        state["hf_requests"] += 1
+        if state["hf_requests"] <= config["loading"]:
+            return web.json_response({"error": "Model is loading", "estimated_time": 20}, status=503)
+
+        error = await simulate()
+        if error:
+            return error
+
+        size = config["image_size"] or params.get("width", 1024)
+        return web.Response(body=make_image(size, size), content_type="image/jpeg")
+
+    async def openrouter_completions(request: web.Request) -> web.Response:
+        payload = await request.json()
+        prompt = payload["messages"][-1]["content"]
+
+        error = await simulate()
+        if error:
+            return error
+
+        if "JSON" in prompt:
+            content = json.dumps({
+                "morning": [make_text(config["text_length"]) for _ in range(5)],
+                "evening": [make_text(config["text_length"]) for _ in range(5)]
+            }, ensure_ascii=False)
+        else:
+            content = make_text(config["text_length"])
+
+        return web.json_response({"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+    async def wispbyte_generate(request: web.Request) -> web.Response:
+        await request.json()
+        error = await simulate()
+        if error:
+            return error
+        return web.json_response({"success": True, "text": make_text(config["text_length"])})
+
+    async def fusion_pipelines(request: web.Request) -> web.Response:
+        return web.json_response([{"id": "stub-pipeline", "name": "Kandinsky"}])
+
+    async def fusion_run(request: web.Request) -> web.Response:
+        await request.post()
+        error = await simulate()
+        if error:
+            return error
+        job_id = uuid.uuid4().hex
+        state["fusion_jobs"][job_id] = time.monotonic() + config["fusion_render_time"]
+        return web.json_response({"uuid": job_id, "status": "INITIAL"}, status=201)
+
+    async def fusion_status(request: web.Request) -> web.Response:
+        job_id = request.match_info["job_id"]
+        ready_at = state["fusion_jobs"].get(job_id)
+        if ready_at is None:
+            return web.json_response({"uuid": job_id, "status": "FAIL", "error": "unknown job"})
+        if time.monotonic() < ready_at:
+            return web.json_response({"uuid": job_id, "status": "PROCESSING"})
+
+        size = config["image_size"]
+        image = base64.b64encode(make_image(size, size)).decode()
+        return web.json_response({"uuid": job_id, "status": "DONE", "result": {"files": [image]}})
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app["config"] = config
+    app["state"] = state
+    app.router.add_post("/models/{model:.*}", hf_generate)
+    app.router.add_post("/api/v1/chat/completions", openrouter_completions)
+    app.router.add_post("/generate", wispbyte_generate)
+    app.router.add_get("/key/api/v1/pipelines", fusion_pipelines)
+    app.router.add_post("/key/api/v1/pipeline/run", fusion_run)
+    app.router.add_get("/key/api/v1/pipeline/status/{job_id}", fusion_status)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=DEFAULT_CONFIG["latency"], help="задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=DEFAULT_CONFIG["jitter"], help="случайная добавка к задержке, сек")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_CONFIG["error_rate"], help="доля ответов 500")
+    parser.add_argument("--loading", type=int, default=DEFAULT_CONFIG["loading"], help="сколько первых запросов к HF вернуть 503")
+    parser.add_argument("--image-size", type=int, default=DEFAULT_CONFIG["image_size"], help="сторона картинки, px")
+    parser.add_argument("--text-length", type=int, default=DEFAULT_CONFIG["text_length"], help="длина текста, символов")
+    parser.add_argument("--fusion-render-time", type=float, default=DEFAULT_CONFIG["fusion_render_time"])
+    args = parser.parse_args()
+
+    config = {
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "error_rate": args.error_rate,
+        "loading": args.loading,
+        "image_size": args.image_size,
+        "text_length": args.text_length,
+        "fusion_render_time": args.fusion_render_time
+    }
+    web.run_app(create_app(config), host="127.0.0.1", port=args.port)
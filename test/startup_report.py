@@ -0,0 +1,85 @@
+"""
+Отчет о времени импорта main.py по данным `python -X importtime`:
+самые дорогие модули и тяжелые зависимости, которые не должны грузиться при запуске
+(они импортируются лениво, при первом использовании).
+
+Запуск из корня проекта:
+    python test/startup_report.py
+    python test/startup_report.py --top 30 --budget-ms 1500
+
+Код возврата 1, если импорт дольше --budget-ms или подтянулась тяжелая зависимость.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Должны импортироваться только при первом использовании
+LAZY_PACKAGES = ["PIL", "apscheduler", "icalendar", "dateutil.rrule", "requests", "httpx"]
+
+LINE_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def collect_import_times() -> list:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"Не удалось импортировать main.py (код {result.returncode})")
+
+    modules = []
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({
+                "name": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": len(indent) // 2
+            })
+    return modules
+
+
+def main(args) -> int:
+    modules = collect_import_times()
+    total_ms = sum(module["self_ms"] for module in modules)
+
+    print(f"Импорт main.py: {total_ms:.0f} мс, модулей: {len(modules)}\n")
+
+    print("Самые дорогие пакеты верхнего уровня (cumulative):")
+    top_level = [module for module in modules if module["depth"] == 0]
+    for module in sorted(top_level, key=lambda m: m["cumulative_ms"], reverse=True)[:args.top]:
+        print(f"  {module['cumulative_ms']:>8.1f} мс  {module['name']}")
+
+    print("\nСамые дорогие модули (self):")
+    for module in sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:args.top]:
+        print(f"  {module['self_ms']:>8.1f} мс  {module['name']}")
+
+    names = {module["name"] for module in modules}
+    eager = [package for package in LAZY_PACKAGES if package in names]
+
+    exit_code = 0
+    if eager:
+        print(f"\n❌ Импортируются при запуске, хотя должны лениво: {', '.join(eager)}")
+        exit_code = 1
+    if args.budget_ms and total_ms > args.budget_ms:
+        print(f"\n❌ Импорт дольше бюджета {args.budget_ms:.0f} мс")
+        exit_code = 1
+    if not exit_code:
+        print("\n✅ Тяжелые зависимости не грузятся при запуске")
+    return exit_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=0.0, help="бюджет на импорт main.py, 0 — без проверки")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,133 @@
+"""
+Проверки AdmissionMiddleware: дубликат выполняемого запроса не занимает
+слот, дубликат отклоненного запроса получает "занято", а при отмене
+ожидающего оригинала дубликат допускается как новый запрос.
+
+Запуск из корня проекта:
+    python test/test_admission.py
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+from itertools import count
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import Chat, Message, User
+
+from utils import admission
+from utils.admission import AdmissionMiddleware
+
+_user_ids = count(1)
+
+
+def make_call(text: str):
+    # У каждого запроса свой пользователь в личном чате: лимиты пользователя и чата не мешают
+    user_id = next(_user_ids)
+    user = User(id=user_id, is_bot=False, first_name="Тест")
+    chat = Chat(id=user_id, type="private")
+    message = Message(message_id=1, date=datetime.now(), chat=chat, from_user=user, text=text)
+    return message, {"event_from_user": user, "event_chat": chat}
+
+
+class Harness:
+    """Middleware с одним слотом на класс и обработчик, который держит слот, пока не открыт gate."""
+
+    def __init__(self):
+        self.middleware = AdmissionMiddleware()
+        self.middleware._semaphores["schedule"] = asyncio.Semaphore(1)
+        self.warnings = []
+        self.handled = []
+        self.gate = asyncio.Event()
+
+        async def warn(message, user_id, text):
+            self.warnings.append(message.text)
+        self.middleware._warn = warn
+
+    async def handler(self, event, data):
+        self.handled.append(event.text)
+        await self.gate.wait()
+        return event.text
+
+    def call(self, text: str) -> asyncio.Task:
+        message, data = make_call(text)
+        return asyncio.create_task(self.middleware(self.handler, message, data))
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def run(test):
+    def wrapper():
+        old_timeout = admission.QUEUE_TIMEOUT
+        admission.QUEUE_TIMEOUT = 0.1
+        try:
+            asyncio.run(test())
+        finally:
+            admission.QUEUE_TIMEOUT = old_timeout
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@run
+async def test_duplicate_runs_without_own_slot():
+    h = Harness()
+    original = h.call("/schedule")
+    await settle()
+    duplicate = h.call("/schedule")
+    await settle()
+
+    # Дубликат вошел в обработчик, хотя единственный слот занят оригиналом
+    assert h.handled == ["/schedule", "/schedule"]
+    h.gate.set()
+    assert await original == "/schedule" and await duplicate == "/schedule"
+    assert not h.warnings
+    assert not h.middleware._running and not h.middleware._semaphores["schedule"].locked()
+
+
+@run
+async def test_busy_original_rejects_its_duplicates():
+    h = Harness()
+    holder = h.call("/today")
+    await settle()
+    original = h.call("/schedule")
+    await settle()
+    duplicate = h.call("/schedule")
+
+    # Слот занят дольше QUEUE_TIMEOUT: и ожидающий запрос, и его дубликат получают "занято"
+    assert await original is None and await duplicate is None
+    assert h.warnings == ["/schedule", "/schedule"]
+    assert h.handled == ["/today"]
+
+    h.gate.set()
+    await holder
+    assert not h.middleware._running
+
+
+@run
+async def test_duplicate_of_cancelled_original_is_admitted():
+    h = Harness()
+    holder = h.call("/today")
+    await settle()
+    original = h.call("/schedule")
+    await settle()
+    duplicate = h.call("/schedule")
+    await settle()
+
+    original.cancel()
+    await settle()
+    h.gate.set()
+    await holder
+    assert await duplicate == "/schedule"
+    assert h.handled == ["/today", "/schedule"]
+    assert not h.warnings
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
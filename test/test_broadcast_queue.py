@@ -0,0 +1,226 @@
+"""
+Проверки очереди рассылок при смене лидера: повторное избрание того же
+экземпляра не запускает рассылку второй раз, чужую живую рассылку лидер не
+трогает, а брошенную подхватывает; рассылку, поставленную после потери
+лидерства, начинает новый лидер; drain останавливается на границе пачки,
+и следующий лидер продолжает с сохраненной позиции. "chat not found" помечает
+получателя недоступным только в отправках без второго чата: при копировании
+из пропавшего источника рассылка останавливается.
+
+Запуск из корня проекта:
+    python test/test_broadcast_queue.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiogram.exceptions import TelegramBadRequest
+
+from commands.group.group_manager import GroupManager
+from commands.notifications import broadcast_queue as bq
+from commands.notifications.broadcast_queue import BroadcastQueue, STATUS_DONE, STATUS_FAILED, STATUS_RUNNING
+from utils import leader as leader_module
+from utils.broadcast import broadcast_engine
+
+
+class FakeBot:
+    """Считает отправки; пока gate не открыт, отправка ждет (пачка «в полете»)."""
+
+    def __init__(self):
+        self.sent = Counter()
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.in_flight = asyncio.Event()
+
+    async def send_message(self, chat_id, text=None, **kwargs):
+        self.in_flight.set()
+        await self.gate.wait()
+        self.sent[chat_id] += 1
+
+    async def edit_message_text(self, **kwargs):
+        pass
+
+
+class MissingChatBot(FakeBot):
+    """Чата missing не существует: ни как получателя, ни как источника копирования."""
+
+    missing = 404
+
+    def _check(self, chat_id):
+        if chat_id == self.missing:
+            raise TelegramBadRequest(method=None, message="Bad Request: chat not found")
+
+    async def send_message(self, chat_id, text=None, **kwargs):
+        self._check(chat_id)
+        await super().send_message(chat_id, text)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self._check(from_chat_id)
+        self._check(chat_id)
+        self.sent[chat_id] += 1
+
+
+def run(test):
+    """Каждая проверка — в своем каталоге: очередь хранит рассылки в data/ относительно cwd."""
+    def wrapper():
+        cwd = os.getcwd()
+        old_concurrency = broadcast_engine.concurrency
+        os.chdir(tempfile.mkdtemp())
+        os.makedirs("data")
+        broadcast_engine.concurrency = 2
+        old_group_manager = bq.group_manager
+        try:
+            asyncio.run(test())
+        finally:
+            broadcast_engine.concurrency = old_concurrency
+            bq.group_manager = old_group_manager
+            os.chdir(cwd)
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+def make_job(queue: BroadcastQueue, recipients) -> dict:
+    return queue.create_job("text", {"text": "hi"}, recipients, owner_id=1,
+                            progress_chat_id=None, progress_message_id=None, title="test")
+
+
+def read_jobs() -> dict:
+    with open("data/broadcast_jobs.json", encoding="utf-8") as f:
+        return json.load(f)["jobs"]
+
+
+async def finish(queue: BroadcastQueue):
+    await asyncio.gather(*queue._tasks.values())
+    await queue.drain()
+
+
+@run
+async def test_reelection_does_not_start_running_job_twice():
+    bot = FakeBot()
+    queue = BroadcastQueue(bot)
+    bot.gate.clear()
+    queue.submit(make_job(queue, [1, 2]))
+    await bot.in_flight.wait()
+
+    # Потеряли и снова получили лидерство, пока рассылка еще идет
+    assert queue.resume_pending() == 0
+    assert len(queue._tasks) == 1
+
+    bot.gate.set()
+    await finish(queue)
+    assert bot.sent == Counter({1: 1, 2: 1})
+
+
+@run
+async def test_only_orphaned_jobs_are_adopted():
+    other = BroadcastQueue(FakeBot())
+    job = make_job(other, [1, 2, 3])
+    job["owner"] = "other-replica"
+    other.store.save()
+
+    bot = FakeBot()
+    leader = BroadcastQueue(bot)
+    assert leader.resume_pending() == 0
+    assert not bot.sent
+
+    # Владелец перестал сохранять позицию дольше BROADCAST_JOB_TTL
+    job["heartbeat_at"] = time.time() - bq.BROADCAST_JOB_TTL - 1
+    other.store.save()
+    assert leader._adopt_orphaned() == 1
+    await finish(leader)
+    assert bot.sent == Counter({1: 1, 2: 1, 3: 1})
+    assert read_jobs()[job["id"]]["status"] == STATUS_DONE
+
+
+@run
+async def test_drain_stops_at_chunk_and_next_leader_resumes():
+    bot = FakeBot()
+    queue = BroadcastQueue(bot)
+    job = make_job(queue, [1, 2, 3, 4, 5, 6])
+    bot.gate.clear()
+    queue.submit(job)
+    await bot.in_flight.wait()
+
+    drain = asyncio.create_task(queue.drain())
+    await asyncio.sleep(0)
+    bot.gate.set()
+    await drain
+
+    saved = read_jobs()[job["id"]]
+    assert saved["cursor"] == 2 and saved["status"] == STATUS_RUNNING
+    assert saved["owner"] is None
+    assert bot.sent == Counter({1: 1, 2: 1})
+
+    # Следующий лидер подхватывает сразу, не дожидаясь срока heartbeat
+    successor = BroadcastQueue(bot)
+    assert successor.resume_pending() == 1
+    await finish(successor)
+    assert bot.sent == Counter({chat_id: 1 for chat_id in range(1, 7)})
+    assert read_jobs()[job["id"]]["status"] == STATUS_DONE
+
+
+class Demoted:
+    is_leader = False
+
+
+@run
+async def test_submit_after_demotion_is_left_for_next_leader():
+    bot = FakeBot()
+    queue = BroadcastQueue(bot)
+    job = make_job(queue, [1, 2])
+    leader_module._elector = Demoted()
+    try:
+        assert queue.submit(job) is None
+    finally:
+        leader_module._elector = None
+    assert not queue._tasks and read_jobs()[job["id"]]["owner"] is None
+
+    successor = BroadcastQueue(bot)
+    assert successor.resume_pending() == 1
+    await finish(successor)
+    assert bot.sent == Counter({1: 1, 2: 1})
+
+
+def use_group(*user_ids) -> GroupManager:
+    """Реестр группы из каталога проверки, куда очередь записывает итоги доставки."""
+    with open("data/group_data.json", "w", encoding="utf-8") as f:
+        json.dump({"members": {str(user_id): {"user_id": user_id} for user_id in user_ids}}, f)
+    bq.group_manager = GroupManager("data/group_data.json", flush_delay=0)
+    return bq.group_manager
+
+
+@run
+async def test_missing_recipient_is_marked_dead():
+    group = use_group(1, MissingChatBot.missing)
+    queue = BroadcastQueue(MissingChatBot())
+    queue.submit(make_job(queue, [1, MissingChatBot.missing]))
+    await finish(queue)
+    assert group.is_dead_recipient(MissingChatBot.missing) and not group.is_dead_recipient(1)
+
+
+@run
+async def test_missing_copy_source_fails_job_without_marking_recipients():
+    group = use_group(1, 2, 3, 4)
+    queue = BroadcastQueue(MissingChatBot())
+    job = queue.create_job("copy", {"from_chat_id": MissingChatBot.missing, "message_id": 1, "caption": None},
+                           [1, 2, 3, 4], owner_id=1, progress_chat_id=None, progress_message_id=None, title="test")
+    queue.submit(job)
+    await finish(queue)
+
+    saved = read_jobs()[job["id"]]
+    assert saved["status"] == STATUS_FAILED and saved["cursor"] == 2
+    assert not any(group.is_dead_recipient(user_id) for user_id in (1, 2, 3, 4))
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
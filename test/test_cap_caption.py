@@ -0,0 +1,41 @@
+"""
+Проверки cap_caption: подпись, которая укладывается в лимит по видимому
+тексту, не меняется; длинная обрезается с "..." в пределах лимита без
+разрезанных тегов и сущностей.
+
+Запуск из корня проекта:
+    python test/test_cap_caption.py
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.image_pipeline import CAPTION_LIMIT, _visible_length, cap_caption
+
+
+def test_caption_at_limit_is_unchanged():
+    for size in (CAPTION_LIMIT - 2, CAPTION_LIMIT - 1, CAPTION_LIMIT):
+        text = "<b>" + "а" * size + "</b>"
+        assert cap_caption(text) == text
+
+
+def test_entities_count_as_one_character():
+    text = "&amp;" * CAPTION_LIMIT
+    assert cap_caption(text) == text
+
+
+def test_long_caption_fits_limit():
+    text = "<b>Доброе утро</b>\n" + "<i>" + "б" * 1100 + " &lt;3</i>"
+    capped = cap_caption(text)
+    assert capped.endswith("...</i>")
+    assert _visible_length(capped) == CAPTION_LIMIT
+    assert re.findall(r"</?(\w+)", capped) == ["b", "b", "i", "i"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
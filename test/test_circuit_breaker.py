@@ -0,0 +1,179 @@
+"""
+Проверки CircuitBreaker: открытие после серии ошибок, одна пробная попытка
+в полуоткрытом состоянии и её возврат при отмене (в том числе проигравшего
+хеджа в ProviderRouter и запроса OpenRouterTextGenerator._complete).
+
+Запуск из корня проекта:
+    python test/test_circuit_breaker.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.circuit_breaker import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker
+from utils.openrouter_text_generator import OpenRouterTextGenerator
+from utils.provider_router import ProviderRouter
+
+
+def make_half_open(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN and not breaker.allow()
+
+
+def test_half_open_allows_single_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    make_half_open(breaker)
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED and breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    make_half_open(breaker)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN and not breaker.allow()
+
+
+def test_cancelled_trial_is_released():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    make_half_open(breaker)
+    failures = breaker.failures
+
+    async def trial():
+        assert breaker.allow()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+
+    async def scenario():
+        task = asyncio.create_task(trial())
+        await asyncio.sleep(0)
+        assert not breaker.allow()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(scenario())
+    # Отмена не считается ошибкой и не держит провайдера выключенным навсегда
+    assert breaker.failures == failures
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow()
+
+
+def test_router_releases_trial_of_hedged_loser():
+    router = ProviderRouter("test", min_hedge_delay=0.01, deadline=1.0)
+
+    async def slow():
+        await asyncio.sleep(10)
+        return "slow"
+
+    async def fast():
+        return "fast"
+
+    router.add("slow", slow)
+    router.add("fast", fast)
+    # slow — первый по рейтингу и в полуоткрытом состоянии: его пробный запрос проиграет хедж
+    router.health["fast"].latency = 1.0
+    breaker = router.health["slow"].breaker
+    make_half_open(breaker)
+    failures = breaker.failures
+
+    assert asyncio.run(router.call()) == "fast"
+    assert breaker.failures == failures
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow()
+
+
+class FakeResponse:
+    status = 200
+
+    async def json(self, content_type=None):
+        return {"choices": [{"message": {"content": "Доброе утро!"}}]}
+
+
+class FakeSession:
+    """Вместо aiohttp.ClientSession: ответ приходит через delay секунд."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def post(self, *args, **kwargs):
+        return self
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        return FakeResponse()
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def make_generator(delay: float) -> OpenRouterTextGenerator:
+    generator = OpenRouterTextGenerator(api_key="test")
+    generator._get_session = lambda: FakeSession(delay)
+    make_half_open(generator.breaker)
+    return generator
+
+
+def test_generator_cancelled_trial_is_released():
+    generator = make_generator(delay=10)
+    breaker = generator.breaker
+    failures = breaker.failures
+
+    async def scenario():
+        task = asyncio.create_task(generator._complete("prompt", deadline=5))
+        await asyncio.sleep(0)
+        assert not breaker.allow()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(scenario())
+    assert breaker.failures == failures
+    assert breaker.state == STATE_HALF_OPEN
+    assert breaker.allow()
+
+
+def test_generator_timed_out_trial_reopens():
+    generator = make_generator(delay=10)
+    assert asyncio.run(generator._complete("prompt", deadline=0.01)) is None
+    assert generator.breaker.state == STATE_OPEN
+    assert generator.stats["timeouts"] == 1
+
+
+def test_generator_successful_trial_closes():
+    generator = make_generator(delay=0)
+    assert asyncio.run(generator._complete("prompt", deadline=5)) == "Доброе утро!"
+    assert generator.breaker.state == STATE_CLOSED
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
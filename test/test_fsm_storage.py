@@ -0,0 +1,98 @@
+"""
+Проверки SQLiteStorage: состояние переживает перезапуск, изменения во время
+записи не теряются, а ключи неудавшейся транзакции записываются при
+следующем сбросе.
+
+Запуск из корня проекта:
+    python test/test_fsm_storage.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.fsm.storage.base import StorageKey
+
+from utils.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+OTHER = StorageKey(bot_id=1, chat_id=20, user_id=20)
+
+
+def make_storage(path: str = None) -> SQLiteStorage:
+    # Сбрасываем вручную: фоновый сброс по таймеру в проверках не участвует
+    return SQLiteStorage(path or os.path.join(tempfile.mkdtemp(), "fsm.sqlite3"), flush_interval=60)
+
+
+async def reopen(storage: SQLiteStorage) -> SQLiteStorage:
+    await storage.close()
+    return make_storage(storage.path)
+
+
+def test_state_survives_restart():
+    async def scenario():
+        storage = make_storage()
+        await storage.set_state(KEY, "Form:name")
+        await storage.set_data(KEY, {"name": "Иван"})
+        storage = await reopen(storage)
+        assert await storage.get_state(KEY) == "Form:name"
+        assert await storage.get_data(KEY) == {"name": "Иван"}
+        await storage.close()
+    asyncio.run(scenario())
+
+
+def test_failed_write_is_retried():
+    async def scenario():
+        storage = make_storage()
+        await storage.set_state(KEY, "Form:name")
+
+        def fail(*args):
+            raise OSError("disk full")
+        storage._write = fail
+        await storage.flush()
+        del storage._write
+        assert storage._dirty
+
+        storage = await reopen(storage)
+        assert await storage.get_state(KEY) == "Form:name"
+        await storage.close()
+    asyncio.run(scenario())
+
+
+def test_change_during_write_is_kept():
+    async def scenario():
+        storage = make_storage()
+        await storage.set_state(KEY, "Form:name")
+
+        entered, release = threading.Event(), threading.Event()
+        write = storage._write
+
+        def slow_write(*args):
+            entered.set()
+            release.wait(5)
+            write(*args)
+        storage._write = slow_write
+
+        flush = asyncio.create_task(storage.flush())
+        while not entered.is_set():
+            await asyncio.sleep(0.01)
+        await storage.set_state(OTHER, "Form:age")
+        release.set()
+        await flush
+        del storage._write
+
+        storage = await reopen(storage)
+        assert await storage.get_state(KEY) == "Form:name"
+        assert await storage.get_state(OTHER) == "Form:age"
+        await storage.close()
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,184 @@
+"""
+Проверки журнала JSON-хранилищ: повторная загрузка после падения между
+записью снимка и удалением журнала, оборванная последняя запись и записи
+нескольких обработчиков, которые пишут в один файл через общий экземпляр.
+SnapshotSaver: запись с цикла событий идет в потоке, а старый снимок не
+перезаписывает новый.
+
+Запуск из корня проекта:
+    python test/test_journal.py
+"""
+import asyncio
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands.schedule.schedule_storage import ScheduleStorage
+from utils import journal
+from utils.journal import SEQ_KEY, JsonJournal, SnapshotSaver
+
+
+class Records(logging.Handler):
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(record.getMessage())
+
+
+def make_path() -> str:
+    return os.path.join(tempfile.mkdtemp(), "schedule_data.json")
+
+
+def load_fresh(path: str) -> dict:
+    """Состояние файла так, как его увидит следующий запуск."""
+    gc.collect()
+    return ScheduleStorage(path).data
+
+
+def test_crash_between_snapshot_and_journal_removal():
+    path = make_path()
+    storage = ScheduleStorage(path)
+    storage.add_attendance_request("lesson", {"user_id": 1})
+    storage.add_attendance_request("lesson", {"user_id": 2})
+
+    # Снимок записан, а журнал удалить не успели
+    journal_file = storage._journal.journal_file
+    with open(journal_file, "rb") as f:
+        saved_journal = f.read()
+    storage._save_data()
+    with open(journal_file, "wb") as f:
+        f.write(saved_journal)
+    del storage
+
+    data = load_fresh(path)
+    assert data["attendance_requests"]["lesson"] == [{"user_id": 1}, {"user_id": 2}]
+    assert data[SEQ_KEY] == 2
+
+
+def test_truncated_tail_is_dropped():
+    path = make_path()
+    storage = ScheduleStorage(path)
+    storage.mark_as_notified("a")
+    journal_file = storage._journal.journal_file
+    del storage
+    with open(journal_file, "ab") as f:
+        f.write(b'{"op":"set","path":["notified_lessons","b"]')
+
+    data = load_fresh(path)
+    assert list(data["notified_lessons"]) == ["a"]
+    with open(journal_file, "rb") as f:
+        assert f.read().endswith(b"\n")
+
+
+def test_writers_sharing_one_instance_survive_compaction():
+    path = make_path()
+    shared = ScheduleStorage(path)
+    # Обработчик отметок и уведомитель держат один и тот же объект
+    attendance, notifier = shared, shared
+
+    old_limit = journal.JOURNAL_MAX_RECORDS
+    journal.JOURNAL_MAX_RECORDS = 3
+    try:
+        attendance.add_attendance_request("lesson", {"user_id": 7})
+        for lesson_id in ("a", "b", "c"):
+            notifier.mark_as_notified(lesson_id)
+        attendance.add_attendance_request("lesson", {"user_id": 8})
+    finally:
+        journal.JOURNAL_MAX_RECORDS = old_limit
+
+    with open(path, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    assert snapshot["attendance_requests"]["lesson"] == [{"user_id": 7}]
+    del shared, attendance, notifier
+
+    data = load_fresh(path)
+    assert data["attendance_requests"]["lesson"] == [{"user_id": 7}, {"user_id": 8}]
+    assert sorted(data["notified_lessons"]) == ["a", "b", "c"]
+
+
+def test_second_journal_on_same_file_is_reported():
+    path = make_path()
+    records = Records()
+    journal.logger.addHandler(records)
+    try:
+        first = JsonJournal(path)
+        assert not records.messages
+        second = JsonJournal(path)
+        assert len(records.messages) == 1 and "общий экземпляр" in records.messages[0]
+        del first, second
+        gc.collect()
+        JsonJournal(path)
+        assert len(records.messages) == 1
+    finally:
+        journal.logger.removeHandler(records)
+
+
+def read_json(path: str):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_saver_writes_off_the_loop():
+    path = make_path()
+    data = {"texts": []}
+    saver = SnapshotSaver(path, lambda: {"texts": list(data["texts"])}, "проверки")
+    writer_threads = []
+    write_snapshot = journal.write_snapshot
+
+    def recording_write(*args):
+        writer_threads.append(threading.current_thread())
+        write_snapshot(*args)
+
+    async def scenario():
+        for text in ("a", "b", "c"):
+            data["texts"].append(text)
+            saver.save()
+        # save() только планирует запись
+        assert not os.path.exists(path)
+        await saver.flush()
+
+    journal.write_snapshot = recording_write
+    try:
+        asyncio.run(scenario())
+    finally:
+        journal.write_snapshot = write_snapshot
+
+    assert read_json(path) == {"texts": ["a", "b", "c"]}
+    assert writer_threads and threading.main_thread() not in writer_threads
+    # Три сохранения подряд слились в одну запись
+    assert len(writer_threads) == 1
+
+
+def test_saver_outside_loop_writes_immediately():
+    path = make_path()
+    SnapshotSaver(path, lambda: {"n": 1}, "проверки").save()
+    assert read_json(path) == {"n": 1}
+
+
+def test_saver_skips_stale_snapshot():
+    path = make_path()
+    data = {"n": 1}
+    saver = SnapshotSaver(path, lambda: dict(data), "проверки")
+    older = saver._take()
+    data["n"] = 2
+    newer = saver._take()
+    # Поток с новым снимком успел записать раньше потока со старым
+    saver._write(*newer)
+    saver._write(*older)
+    assert read_json(path) == {"n": 2}
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
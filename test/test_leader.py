@@ -0,0 +1,100 @@
+"""
+Проверки передачи лидерства через общую аренду: второй экземпляр ждет в
+резерве, при штатной остановке лидера получает аренду сразу, при зависании —
+после истечения срока, а зависший лидер по своим часам перестает считать
+себя лидером раньше, чем аренду заберут.
+
+Запуск из корня проекта:
+    python test/test_leader.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import leader as leader_module
+from utils.leader import LeaderElector
+
+
+class Replica:
+    """Экземпляр бота: отмечает вызовы on_elected/on_demoted."""
+
+    def __init__(self, name: str, ttl: float = 30, heartbeat: float = 10):
+        self.events = []
+        self.elector = LeaderElector(self.elected, self.demoted, enabled=True,
+                                     ttl=ttl, heartbeat=heartbeat, instance_id=name)
+
+    async def elected(self):
+        self.events.append("elected")
+
+    async def demoted(self):
+        self.events.append("demoted")
+
+
+def run(test):
+    """Каждая проверка — со своим файлом аренды (data/ относительно cwd)."""
+    def wrapper():
+        cwd = os.getcwd()
+        os.chdir(tempfile.mkdtemp())
+        try:
+            asyncio.run(test())
+        finally:
+            leader_module._elector = None
+            os.chdir(cwd)
+    wrapper.__name__ = test.__name__
+    return wrapper
+
+
+@run
+async def test_standby_takes_over_after_graceful_stop():
+    first, second = Replica("first"), Replica("second")
+    await first.elector.start()
+    await second.elector.start()
+    assert first.elector.is_leader and not second.elector.is_leader
+    assert second.events == []
+    first_term = first.elector.term
+
+    await first.elector.stop()
+    assert first.events == ["elected", "demoted"]
+
+    # Аренда освобождена — следующий heartbeat резерва забирает ее без ожидания TTL
+    await second.elector._tick()
+    assert second.elector.is_leader and second.events == ["elected"]
+    assert second.elector.term == first_term + 1
+    await second.elector.stop()
+
+
+@run
+async def test_hung_leader_loses_lease_after_ttl():
+    hung = Replica("hung", ttl=0.3, heartbeat=0.1)
+    standby = Replica("standby", ttl=0.3, heartbeat=0.1)
+    await hung.elector.start()
+    # Лидер завис: цикл продления больше не выполняется, аренда не освобождается
+    hung.elector._task.cancel()
+    await standby.elector.start()
+    assert not standby.elector.is_leader
+
+    await asyncio.sleep(0.35)
+    assert not hung.elector.is_leader
+    await standby.elector._tick()
+    assert standby.elector.is_leader and standby.events == ["elected"]
+    await standby.elector.stop()
+
+
+@run
+async def test_module_is_leader_follows_started_elector():
+    assert leader_module.is_leader()
+    replica = Replica("only")
+    await replica.elector.start()
+    assert leader_module.is_leader()
+    await replica.elector.stop()
+    assert not leader_module.is_leader()
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,203 @@
+"""
+Контроль допуска для тяжелых команд (/schedule, /today, /preview, /homework).
+
+- токен-бакеты на пользователя и на чат: спам одной группы не отнимает
+  ресурсы у остальных;
+- общий лимит одновременных выполнений на класс команд;
+- одинаковые запросы, пришедшие во время ожидания или выполнения, не занимают
+  слот: они ждут допуска первого запроса и получают тот же результат через single_flight.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Chat, Message, TelegramObject, User
+
+from utils.metrics import ADMISSION_DECISIONS
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Команда -> класс: у команд одного класса общий лимит одновременных выполнений
+COMMAND_CLASSES = {
+    "schedule": "schedule",
+    "today": "schedule",
+    "homework": "homework",
+    "preview": "greeting",
+}
+
+CLASS_CONCURRENCY = {
+    "schedule": int(os.environ.get("ADMISSION_SCHEDULE_CONCURRENCY", "2")),
+    "homework": int(os.environ.get("ADMISSION_HOMEWORK_CONCURRENCY", "4")),
+    "greeting": int(os.environ.get("ADMISSION_GREETING_CONCURRENCY", "1")),
+}
+
+# Пользователь: 3 команды подряд, затем одна в 10 секунд
+USER_RATE = float(os.environ.get("ADMISSION_USER_RATE", "0.1"))
+USER_BURST = float(os.environ.get("ADMISSION_USER_BURST", "3"))
+# Групповой чат: 6 команд подряд, затем одна в 5 секунд
+CHAT_RATE = float(os.environ.get("ADMISSION_CHAT_RATE", "0.2"))
+CHAT_BURST = float(os.environ.get("ADMISSION_CHAT_BURST", "6"))
+# Сколько ждать свободного слота, прежде чем ответить "бот занят"
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "15"))
+# Не чаще одного предупреждения пользователю за этот интервал
+WARNING_INTERVAL = 30.0
+
+_MAX_BUCKETS = 1000
+
+
+class SingleFlight:
+    """
+    Одновременные вызовы с одним ключом выполняют factory один раз и делят результат.
+    Ключ — кортеж, первый элемент которого идет в метрики как имя операции.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    async def run(self, key: Tuple[Hashable, ...], factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._flights.get(key)
+        if future is not None:
+            ADMISSION_DECISIONS.inc(str(key[0]), "shared")
+            # shield: отмена одного из ожидающих не должна отменять общий вызов
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(factory())
+        self._flights[key] = future
+        future.add_done_callback(lambda _: self._flights.pop(key, None))
+        return await asyncio.shield(future)
+
+
+single_flight = SingleFlight()
+
+
+def parse_command(text: Optional[str]) -> Tuple[Optional[str], str]:
+    """'/today@bot завтра' -> ('today', 'завтра')."""
+    if not text or not text.startswith("/"):
+        return None, ""
+    head, _, args = text[1:].partition(" ")
+    return head.split("@", 1)[0].lower(), args.strip().lower()
+
+
+class _Run:
+    """Оригинальный запрос: admitted — получил слот (или выбыл), rejected — отклонен как "занято"."""
+
+    def __init__(self):
+        self.admitted = asyncio.Event()
+        self.rejected = False
+
+
+class AdmissionMiddleware(BaseMiddleware):
+    """Внешний middleware на dp.message, пропускает только команды из COMMAND_CLASSES."""
+
+    def __init__(self):
+        self._user_buckets: Dict[int, TokenBucket] = {}
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._semaphores = {name: asyncio.Semaphore(limit) for name, limit in CLASS_CONCURRENCY.items()}
+        # (команда, аргументы) -> выполнение, которое ждет слота или держит его
+        self._running: Dict[Tuple[str, str], _Run] = {}
+        self._warned_at: Dict[int, float] = {}
+
+    @staticmethod
+    def _get_bucket(buckets: Dict[int, TokenBucket], key: int, rate: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= _MAX_BUCKETS:
+                # Бакеты, успевшие наполниться, ничего не помнят, их можно выбросить
+                now = time.monotonic()
+                for stale_key in [k for k, b in buckets.items()
+                                  if b.tokens + (now - b.updated_at) * b.rate >= b.capacity]:
+                    del buckets[stale_key]
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    async def _warn(self, message: Message, user_id: int, text: str):
+        now = time.monotonic()
+        if now - self._warned_at.get(user_id, 0.0) < WARNING_INTERVAL:
+            return
+        self._warned_at[user_id] = now
+        try:
+            await message.reply(text)
+        except Exception as e:
+            logger.debug(f"Не удалось отправить предупреждение о лимите: {e}")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Message):
+            return await handler(event, data)
+
+        command, args = parse_command(event.text)
+        command_class = COMMAND_CLASSES.get(command)
+        user: Optional[User] = data.get("event_from_user")
+        if command_class is None or user is None:
+            return await handler(event, data)
+
+        chat: Optional[Chat] = data.get("event_chat")
+        if not self._get_bucket(self._user_buckets, user.id, USER_RATE, USER_BURST).try_acquire():
+            ADMISSION_DECISIONS.inc(command, "user_limited")
+            logger.info(f"Команда /{command} от {user.id} отклонена: лимит пользователя")
+            await self._warn(event, user.id, "⏳ Слишком часто. Попробуйте через несколько секунд.")
+            return None
+
+        if chat is not None and chat.id != user.id and \
+                not self._get_bucket(self._chat_buckets, chat.id, CHAT_RATE, CHAT_BURST).try_acquire():
+            ADMISSION_DECISIONS.inc(command, "chat_limited")
+            logger.info(f"Команда /{command} в чате {chat.id} отклонена: лимит чата")
+            await self._warn(event, user.id, "⏳ В этом чате команду вызывали слишком часто, подождите немного.")
+            return None
+
+        run_key = (command, args)
+        while True:
+            run = self._running.get(run_key)
+            if run is None:
+                break
+            # Такой же запрос уже выполняется или ждет слота. Дубликат ждет допуска оригинала
+            # и выполняется вместе с ним без своего слота: тяжелая часть общая через single_flight
+            ADMISSION_DECISIONS.inc(command, "duplicate")
+            try:
+                await asyncio.wait_for(run.admitted.wait(), QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            if run.rejected or not run.admitted.is_set():
+                ADMISSION_DECISIONS.inc(command, "busy")
+                await self._warn(event, user.id, "⏳ Бот сейчас занят, попробуйте чуть позже.")
+                return None
+            if self._running.get(run_key) is run:
+                return await handler(event, data)
+            # Оригинал уже закончил или был отменен — запрос допускается как новый
+
+        # Ключ занимается до ожидания слота, чтобы дубликаты не вставали в очередь за ним
+        run = self._running[run_key] = _Run()
+        semaphore = self._semaphores[command_class]
+        try:
+            try:
+                await asyncio.wait_for(semaphore.acquire(), QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                run.rejected = True
+                ADMISSION_DECISIONS.inc(command, "busy")
+                logger.warning(f"Команда /{command} отклонена: все слоты класса {command_class} "
+                               f"({CLASS_CONCURRENCY[command_class]}) заняты дольше {QUEUE_TIMEOUT:.0f} с")
+                await self._warn(event, user.id, "⏳ Бот сейчас занят, попробуйте чуть позже.")
+                return None
+
+            ADMISSION_DECISIONS.inc(command, "admitted")
+            run.admitted.set()
+            try:
+                return await handler(event, data)
+            finally:
+                semaphore.release()
+        finally:
+            # Будим дубликаты и при отказе или отмене оригинала
+            run.admitted.set()
+            if self._running.get(run_key) is run:
+                del self._running[run_key]
@@ -0,0 +1,170 @@
+"""
+Общий движок массовых рассылок: ограничение параллельности, глобальный
+token bucket под лимиты Bot API, паузы между сообщениями в один чат,
+обработка RetryAfter и повторы при сетевых ошибках.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "16"))
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "30"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.environ.get("BROADCAST_PER_CHAT_INTERVAL", "1.0"))
+BROADCAST_MAX_RETRIES = int(os.environ.get("BROADCAST_MAX_RETRIES", "3"))
+
+
+def classify_delivery_error(error: Exception) -> Optional[str]:
+    """
+    Класс постоянной ошибки доставки или None, если ошибка временная.
+    chat_not_found говорит о получателе, только если в запросе нет других чатов:
+    при пересылке и копировании это может быть from_chat_id (см. broadcast_queue).
+    """
+    message = str(error).lower()
+
+    if "deactivated" in message:
+        return "deactivated"
+    if isinstance(error, TelegramForbiddenError):
+        return "forbidden"
+    if isinstance(error, (TelegramBadRequest, TelegramNotFound)) and "chat not found" in message:
+        return "chat_not_found"
+    return None
+
+
+@dataclass
+class DeliveryResult:
+    chat_id: int
+    ok: bool
+    error: Optional[str] = None
+    error_class: Optional[str] = None
+
+
+@dataclass
+class BroadcastReport:
+    results: List[DeliveryResult] = field(default_factory=list)
+    duration: float = 0.0
+
+    @property
+    def sent(self) -> int:
+        return sum(1 for r in self.results if r.ok)
+
+    @property
+    def failed(self) -> int:
+        return sum(1 for r in self.results if not r.ok)
+
+    @property
+    def failed_results(self) -> List[DeliveryResult]:
+        return [r for r in self.results if not r.ok]
+
+    @property
+    def dead_results(self) -> List[DeliveryResult]:
+        return [r for r in self.results if r.error_class]
+
+
+class BroadcastEngine:
+
+    def __init__(
+        self,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        rate: float = BROADCAST_RATE,
+        per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+        max_retries: int = BROADCAST_MAX_RETRIES
+    ):
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self._chat_last_sent: Dict[int, float] = {}
+        self._chat_locks: Dict[int, asyncio.Lock] = {}
+
+    async def _pace_chat(self, chat_id: int):
+        last = self._chat_last_sent.get(chat_id)
+        if last is not None:
+            wait = self.per_chat_interval - (time.monotonic() - last)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    async def call(self, chat_id: int, request: Callable[[], Awaitable[T]]) -> T:
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        attempt = 0
+
+        async with lock:
+            while True:
+                attempt += 1
+                await self._pace_chat(chat_id)
+                await self.bucket.acquire()
+
+                try:
+                    result = await request()
+                    self._chat_last_sent[chat_id] = time.monotonic()
+                    return result
+                except TelegramRetryAfter as e:
+                    self._chat_last_sent[chat_id] = time.monotonic()
+                    logger.warning(f"Flood control для {chat_id}: ждем {e.retry_after}с (попытка {attempt})")
+                    # Флуд-лимит почти всегда означает, что превышен общий лимит бота
+                    self.bucket.pause(e.retry_after)
+                    if attempt > self.max_retries:
+                        raise
+                    await asyncio.sleep(e.retry_after)
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    self._chat_last_sent[chat_id] = time.monotonic()
+                    if attempt > self.max_retries:
+                        raise
+                    backoff = min(2 ** attempt, 30) + random.uniform(0, 1)
+                    logger.warning(f"Ошибка сети при отправке в {chat_id}: {e}. Повтор через {backoff:.1f}с")
+                    await asyncio.sleep(backoff)
+
+    async def send(
+        self,
+        chat_ids: Iterable[int],
+        deliver: Callable[[int], Awaitable[object]]
+    ) -> BroadcastReport:
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chat_ids = list(dict.fromkeys(chat_ids))
+
+        async def worker(chat_id: int) -> DeliveryResult:
+            async with semaphore:
+                try:
+                    await deliver(chat_id)
+                    return DeliveryResult(chat_id=chat_id, ok=True)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Не удалось доставить сообщение пользователю {chat_id}: {e}")
+                    return DeliveryResult(
+                        chat_id=chat_id,
+                        ok=False,
+                        error=str(e),
+                        error_class=classify_delivery_error(e)
+                    )
+
+        results = await asyncio.gather(*(worker(chat_id) for chat_id in chat_ids))
+        report = BroadcastReport(results=list(results), duration=time.monotonic() - started)
+
+        logger.info(
+            f"Рассылка завершена за {report.duration:.1f}с: "
+            f"доставлено {report.sent}, ошибок {report.failed}"
+        )
+        return report
+
+
+broadcast_engine = BroadcastEngine()
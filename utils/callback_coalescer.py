@@ -0,0 +1,107 @@
+"""
+Склейка повторных редактирований по нажатиям inline-кнопок.
+
+Частые нажатия на одном сообщении превращаются в одно редактирование с итоговым
+состоянием: первое нажатие ждет CALLBACK_DEBOUNCE секунд, последующие за это время
+только подменяют отложенные аргументы. Разметка, совпадающая с текущей,
+не отправляется вовсе — Telegram все равно ответил бы "message is not modified".
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup
+
+from utils.metrics import CALLBACK_EDITS
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_DEBOUNCE = float(os.environ.get("CALLBACK_DEBOUNCE", "0.4"))
+
+
+def _dump_markup(markup: Optional[InlineKeyboardMarkup]) -> Optional[dict]:
+    return markup.model_dump(exclude_none=True) if markup is not None else None
+
+
+def is_not_modified_error(error: TelegramBadRequest) -> bool:
+    return "message is not modified" in str(error).lower()
+
+
+class CallbackCoalescer:
+
+    def __init__(self, delay: float = CALLBACK_DEBOUNCE):
+        self.delay = delay
+        # (chat_id, message_id, user_id | None) -> последние аргументы редактирования
+        self._pending: Dict[Tuple[int, int, Optional[int]], dict] = {}
+
+    @staticmethod
+    def _key(callback: CallbackQuery, per_user: bool) -> Tuple[int, int, Optional[int]]:
+        message = callback.message
+        return message.chat.id, message.message_id, callback.from_user.id if per_user else None
+
+    @staticmethod
+    def _is_unchanged(callback: CallbackQuery, edit: dict) -> bool:
+        message = callback.message
+        if _dump_markup(getattr(message, "reply_markup", None)) != _dump_markup(edit["reply_markup"]):
+            return False
+        if edit["text"] is None:
+            return True
+        try:
+            return edit["text"] == message.html_text
+        except Exception:
+            return False
+
+    async def _edit(self, callback: CallbackQuery, text: Optional[str],
+                    reply_markup: Optional[InlineKeyboardMarkup], per_user: bool, **kwargs: Any):
+        if callback.message is None:
+            return
+
+        edit = {"callback": callback, "text": text, "reply_markup": reply_markup, "kwargs": kwargs}
+        key = self._key(callback, per_user)
+
+        if key in self._pending:
+            # Отложенное редактирование уже ждет — отдаем ему самое свежее состояние
+            self._pending[key] = edit
+            CALLBACK_EDITS.inc("coalesced")
+            return
+
+        self._pending[key] = edit
+        try:
+            if self.delay > 0:
+                await asyncio.sleep(self.delay)
+        finally:
+            edit = self._pending.pop(key)
+
+        # Сравниваем с сообщением из последнего нажатия — в нем актуальная разметка
+        if self._is_unchanged(edit["callback"], edit):
+            CALLBACK_EDITS.inc("unchanged")
+            return
+
+        message = edit["callback"].message
+        try:
+            if edit["text"] is None:
+                await message.edit_reply_markup(reply_markup=edit["reply_markup"])
+            else:
+                await message.edit_text(edit["text"], reply_markup=edit["reply_markup"], **edit["kwargs"])
+            CALLBACK_EDITS.inc("sent")
+        except TelegramBadRequest as e:
+            if not is_not_modified_error(e):
+                raise
+            CALLBACK_EDITS.inc("not_modified")
+
+    async def edit_reply_markup(self, callback: CallbackQuery, reply_markup: Optional[InlineKeyboardMarkup],
+                                per_user: bool = True):
+        """
+        per_user=False склеивает нажатия разных пользователей на одном сообщении
+        (например, общий счетчик под сообщением в группе).
+        """
+        await self._edit(callback, None, reply_markup, per_user)
+
+    async def edit_text(self, callback: CallbackQuery, text: str,
+                        reply_markup: Optional[InlineKeyboardMarkup] = None, per_user: bool = True, **kwargs: Any):
+        await self._edit(callback, text, reply_markup, per_user, **kwargs)
+
+
+callback_coalescer = CallbackCoalescer()
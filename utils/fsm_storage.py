@@ -0,0 +1,169 @@
+"""
+Персистентное хранилище FSM для aiogram на SQLite.
+
+Все чтения идут из памяти, изменения копятся и раз в FSM_FLUSH_INTERVAL секунд
+записываются одной транзакцией в отдельном потоке. Брошенные состояния
+удаляются по TTL.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Mapping, Optional, Set, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+FSM_STORAGE = os.environ.get("FSM_STORAGE", "sqlite").lower()
+FSM_STORAGE_FILE = os.environ.get("FSM_STORAGE_FILE", "data/fsm.sqlite3")
+FSM_FLUSH_INTERVAL = float(os.environ.get("FSM_FLUSH_INTERVAL", "1.0"))
+FSM_STATE_TTL = int(os.environ.get("FSM_STATE_TTL", str(7 * 24 * 3600)))
+
+# Запись: (состояние, данные, время последнего изменения)
+Record = Tuple[Optional[str], Dict[str, Any], float]
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id,
+        key.chat_id,
+        key.user_id,
+        key.thread_id,
+        getattr(key, "business_connection_id", None),
+        key.destiny
+    ))
+
+
+def _dumps(data: Mapping[str, Any]) -> Optional[str]:
+    if not data:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class SQLiteStorage(BaseStorage):
+
+    def __init__(
+        self,
+        path: str = FSM_STORAGE_FILE,
+        flush_interval: float = FSM_FLUSH_INTERVAL,
+        ttl: int = FSM_STATE_TTL
+    ):
+        self.path = os.path.abspath(path)
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self._records: Dict[str, Record] = {}
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT, updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        expired_before = time.time() - self.ttl
+        self._db.execute("DELETE FROM fsm WHERE updated_at < ?", (expired_before,))
+        self._db.commit()
+
+        for key, state, data, updated_at in self._db.execute("SELECT key, state, data, updated_at FROM fsm"):
+            self._records[key] = (state, json.loads(data) if data else {}, updated_at)
+
+        if self._records:
+            logger.info(f"Восстановлено FSM-состояний: {len(self._records)}")
+
+    def _touch(self, key: str, state: Optional[str], data: Dict[str, Any]):
+        self._records[key] = (state, data, time.time())
+        self._dirty.add(key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        # Отмена при остановке не должна обрывать уже начатую запись
+        await asyncio.shield(self.flush())
+
+    def _write(self, upserts: list, deletes: list, expired_before: float):
+        with self._db:
+            if upserts:
+                self._db.executemany(
+                    "INSERT INTO fsm (key, state, data, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET state=excluded.state, data=excluded.data, "
+                    "updated_at=excluded.updated_at",
+                    upserts
+                )
+            if deletes:
+                self._db.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+            self._db.execute("DELETE FROM fsm WHERE updated_at < ?", (expired_before,))
+
+    async def flush(self):
+        async with self._flush_lock:
+            expired_before = time.time() - self.ttl
+            for key in [k for k, (_, _, updated_at) in self._records.items() if updated_at < expired_before]:
+                del self._records[key]
+                self._dirty.discard(key)
+
+            if not self._dirty:
+                return
+
+            # Ключи снимаем с учета до записи: изменения, сделанные во время записи, попадут в следующую
+            written = set(self._dirty)
+            self._dirty.clear()
+            upserts, deletes = [], []
+            for key in written:
+                record = self._records.get(key)
+                if record is None or (record[0] is None and not record[1]):
+                    self._records.pop(key, None)
+                    deletes.append((key,))
+                else:
+                    state, data, updated_at = record
+                    upserts.append((key, state, _dumps(data), updated_at))
+
+            try:
+                await asyncio.to_thread(self._write, upserts, deletes, expired_before)
+            except Exception as e:
+                # Транзакция откатилась: ключи снова грязные и запишутся при следующем сбросе
+                self._dirty |= written
+                logger.error(f"Ошибка записи FSM-хранилища, повторим при следующем сбросе: {e}", exc_info=True)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = _key(key)
+        _, data, _ = self._records.get(k, (None, {}, 0.0))
+        self._touch(k, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._records.get(_key(key))
+        return record[0] if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = _key(key)
+        state, _, _ = self._records.get(k, (None, {}, 0.0))
+        self._touch(k, state, dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._records.get(_key(key))
+        return dict(record[1]) if record else {}
+
+    async def close(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+        self._db.close()
+        logger.info("FSM-хранилище сохранено и закрыто")
+
+
+def create_fsm_storage() -> BaseStorage:
+    if FSM_STORAGE == "memory":
+        from aiogram.fsm.storage.memory import MemoryStorage
+        return MemoryStorage()
+    return SQLiteStorage()
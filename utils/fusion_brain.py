@@ -1,47 +1,73 @@
+import asyncio
 import json
-import time
 import base64
-import requests
 import logging
+import os
+import random
+from typing import List, Optional
+
+import aiohttp
 
 logger = logging.getLogger(__name__)
 
+FUSIONBRAIN_DEADLINE = float(os.getenv("FUSIONBRAIN_DEADLINE", "180"))
+FUSIONBRAIN_POLL_INITIAL = 2.0
+FUSIONBRAIN_POLL_MAX = 15.0
+
 
 class FusionBrainAPI:
-    
+
     def __init__(self, url: str, api_key: str, secret_key: str):
         self.URL = url
         self.AUTH_HEADERS = {
             'X-Key': f'Key {api_key}',
             'X-Secret': f'Secret {secret_key}',
         }
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._pipeline_id: Optional[str] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.AUTH_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=30),
+                connector=aiohttp.TCPConnector(limit=8, keepalive_timeout=60)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def get_pipeline(self) -> str | None:
+        if self._pipeline_id:
+            return self._pipeline_id
 
-    def get_pipeline(self) -> str | None:
         try:
             url = self.URL + 'key/api/v1/pipelines'
-            response = requests.get(url, headers=self.AUTH_HEADERS, timeout=30)
-            
-            if response.status_code != 200:
-                logger.error(f"Ошибка получения pipeline: {response.status_code}")
-                return None
-                
-            data = response.json()
+            async with self._get_session().get(url) as response:
+                if response.status != 200:
+                    logger.error(f"Ошибка получения pipeline: {response.status}")
+                    return None
+                data = await response.json(content_type=None)
+
             if not data or len(data) == 0:
                 logger.error("Получен пустой список pipelines")
                 return None
-                
-            pipeline_id = data[0]['id']
-            logger.info(f"Получен pipeline ID: {pipeline_id}")
-            return pipeline_id
-            
-        except requests.exceptions.Timeout:
+
+            self._pipeline_id = data[0]['id']
+            logger.info(f"Получен pipeline ID: {self._pipeline_id}")
+            return self._pipeline_id
+
+        except asyncio.TimeoutError:
             logger.error("Превышено время ожидания запроса к API")
             return None
         except Exception as e:
             logger.error(f"Ошибка при получении pipeline: {e}")
             return None
 
-    def generate(
+    async def generate(
         self,
         prompt: str,
         pipeline_id: str,
@@ -59,108 +85,105 @@ class FusionBrainAPI:
             }
         }
 
-        data = {
-            'pipeline_id': (None, pipeline_id),
-            'params': (None, json.dumps(params), 'application/json')
-        }
+        form = aiohttp.FormData()
+        form.add_field('pipeline_id', pipeline_id)
+        form.add_field('params', json.dumps(params), content_type='application/json')
 
         try:
             url = self.URL + 'key/api/v1/pipeline/run'
             logger.info(f"Запуск генерации: {prompt[:50]}...")
-            
-            response = requests.post(
-                url,
-                headers=self.AUTH_HEADERS,
-                files=data,
-                timeout=30
-            )
 
-            if response.status_code not in (200, 201):
-                logger.error(f"Ошибка генерации: {response.status_code}")
-                return None
+            async with self._get_session().post(url, data=form) as response:
+                if response.status not in (200, 201):
+                    logger.error(f"Ошибка генерации: {response.status}")
+                    return None
+                result = await response.json(content_type=None)
 
-            result = response.json()
             uuid = result.get('uuid')
             if uuid:
                 logger.info(f"Генерация запущена, UUID: {uuid}")
             return uuid
-            
-        except requests.exceptions.Timeout:
+
+        except asyncio.TimeoutError:
             logger.error("Превышено время ожидания запроса генерации")
             return None
         except Exception as e:
             logger.error(f"Ошибка при запуске генерации: {e}")
             return None
 
-    def check_generation(
-        self,
-        request_id: str,
-        attempts: int = 15,
-        delay: int = 8
-    ) -> list | None:
-        logger.info(f"Ожидание завершения генерации (макс. {attempts * delay} сек)...")
-        
-        while attempts > 0:
-            try:
-                response = requests.get(
-                    self.URL + 'key/api/v1/pipeline/status/' + request_id,
-                    headers=self.AUTH_HEADERS,
-                    timeout=30
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"Ошибка проверки статуса: {response.status_code}")
-                    return None
+    async def check_generation(self, request_id: str) -> list | None:
+        """
+        Опрашивает статус генерации с растущей паузой (экспоненциально, с джиттером).
+        Общее время ограничивает вызывающий код через дедлайн.
+        """
+        delay = FUSIONBRAIN_POLL_INITIAL
+        polls = 0
 
-                data = response.json()
-                status = data.get('status')
-                
-                if status == 'DONE':
-                    logger.info("Генерация завершена успешно!")
-                    return data['result']['files']
-                elif status == 'FAIL':
-                    logger.error(f"Генерация завершилась с ошибкой: {data.get('error', 'Неизвестная ошибка')}")
-                    return None
-                else:
-                    logger.info(f"Статус: {status}, осталось попыток: {attempts}")
-
-                attempts -= 1
-                time.sleep(delay)
-                
-            except requests.exceptions.Timeout:
-                logger.error("Превышено время ожидания проверки статуса")
-                return None
-            except Exception as e:
-                logger.error(f"Ошибка при проверке генерации: {e}")
+        while True:
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            polls += 1
+
+            try:
+                url = self.URL + 'key/api/v1/pipeline/status/' + request_id
+                async with self._get_session().get(url) as response:
+                    if response.status != 200:
+                        logger.error(f"Ошибка проверки статуса: {response.status}")
+                        return None
+                    data = await response.json(content_type=None)
+            except asyncio.TimeoutError:
+                logger.warning("Превышено время ожидания проверки статуса, повторим")
+                continue
+            except aiohttp.ClientError as e:
+                logger.warning(f"Ошибка сети при проверке генерации: {e}, повторим")
+                continue
+
+            status = data.get('status')
+
+            if status == 'DONE':
+                logger.info(f"Генерация завершена успешно (опросов: {polls})")
+                return data['result']['files']
+            elif status == 'FAIL':
+                logger.error(f"Генерация завершилась с ошибкой: {data.get('error', 'Неизвестная ошибка')}")
                 return None
 
-        logger.error("Превышено время ожидания генерации")
-        return None
+            logger.debug(f"Статус: {status}, опрос #{polls}")
+            delay = min(delay * 1.5, FUSIONBRAIN_POLL_MAX)
 
-    def generate_image_bytes(self, prompt: str) -> bytes | None:
+    async def generate_image_bytes(self, prompt: str, deadline: float = FUSIONBRAIN_DEADLINE) -> bytes | None:
         """Генерация изображения и возврат в виде байтов."""
         logger.info(f"Начало генерации изображения: {prompt}")
-        
-        pipeline_id = self.get_pipeline()
-        if not pipeline_id:
-            logger.error("Не удалось получить pipeline ID")
-            return None
 
-        uuid = self.generate(prompt, pipeline_id)
-        if not uuid:
-            logger.error("Не удалось запустить генерацию")
+        try:
+            async with asyncio.timeout(deadline):
+                pipeline_id = await self.get_pipeline()
+                if not pipeline_id:
+                    logger.error("Не удалось получить pipeline ID")
+                    return None
+
+                uuid = await self.generate(prompt, pipeline_id)
+                if not uuid:
+                    logger.error("Не удалось запустить генерацию")
+                    return None
+
+                files = await self.check_generation(uuid)
+        except TimeoutError:
+            logger.error(f"Генерация FusionBrain не уложилась в {deadline:.0f}с")
             return None
 
-        files = self.check_generation(uuid)
         if not files:
             logger.error("Не удалось получить результат генерации")
             return None
 
         try:
-            image_base64 = files[0]
-            image_bytes = base64.b64decode(image_base64)
+            image_bytes = base64.b64decode(files[0])
             logger.info(f"Изображение успешно сгенерировано ({len(image_bytes)} байт)")
             return image_bytes
         except Exception as e:
             logger.error(f"Ошибка декодирования изображения: {e}")
             return None
+
+    async def generate_many(self, prompts: List[str], deadline: float = FUSIONBRAIN_DEADLINE) -> List[bytes | None]:
+        """Параллельная генерация нескольких изображений с общим дедлайном."""
+        return list(await asyncio.gather(
+            *(self.generate_image_bytes(prompt, deadline) for prompt in prompts)
+        ))
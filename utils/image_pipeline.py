@@ -0,0 +1,161 @@
+"""
+Постобработка картинок для Telegram в отдельном процессе: уменьшение до
+целевого размера, JPEG (optimize/progressive) и ограничение размера файла.
+"""
+import asyncio
+import io
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1280"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "87"))
+IMAGE_PROGRESSIVE = os.getenv("IMAGE_PROGRESSIVE", "true").lower() == "true"
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(1024 * 1024)))
+IMAGE_PIPELINE_WORKERS = int(os.getenv("IMAGE_PIPELINE_WORKERS", "1"))
+
+CAPTION_LIMIT = 1024
+MIN_JPEG_QUALITY = 60
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _encode_jpeg(img, quality: int, progressive: bool) -> bytes:
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True, progressive=progressive)
+    return out.getvalue()
+
+
+def process_image(
+    image_bytes: bytes,
+    max_side: int = IMAGE_MAX_SIDE,
+    quality: int = IMAGE_JPEG_QUALITY,
+    progressive: bool = IMAGE_PROGRESSIVE,
+    max_bytes: int = IMAGE_MAX_BYTES
+) -> Optional[bytes]:
+    """Синхронная обработка; выполняется в пуле процессов через process_image_async."""
+    # PIL импортируется только в рабочем процессе, а не при старте бота
+    from PIL import Image
+
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img = img.convert("RGB")
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        data = _encode_jpeg(img, quality, progressive)
+
+        # Сначала снижаем качество, и только потом разрешение
+        while len(data) > max_bytes and quality > MIN_JPEG_QUALITY:
+            quality = max(MIN_JPEG_QUALITY, quality - 10)
+            data = _encode_jpeg(img, quality, progressive)
+
+        while len(data) > max_bytes and min(img.size) > 320:
+            img = img.resize((int(img.width * 0.8), int(img.height * 0.8)), Image.LANCZOS)
+            data = _encode_jpeg(img, quality, progressive)
+
+        return data
+    except Exception:
+        return None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_PIPELINE_WORKERS)
+    return _executor
+
+
+async def process_image_async(image_bytes: bytes, **options) -> Optional[bytes]:
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_executor(), _process_with_options, image_bytes, options)
+    except Exception as e:
+        logger.error(f"Ошибка обработки изображения в пуле процессов: {e}", exc_info=True)
+        return None
+
+
+def _process_with_options(image_bytes: bytes, options: dict) -> Optional[bytes]:
+    return process_image(image_bytes, **options)
+
+
+def shutdown_image_pipeline():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# Тег или HTML-сущность в подписи с parse_mode="HTML"
+_MARKUP = re.compile(r"<[^<>]*>|&(?:#\d+|#x[0-9a-fA-F]+|[a-zA-Z]+);")
+_TAG_NAME = re.compile(r"<\s*(/?)\s*([a-zA-Z][a-zA-Z0-9-]*)")
+
+
+def _visible_length(text: str) -> int:
+    return len(_MARKUP.sub(lambda match: "" if match.group().startswith("<") else "&", text))
+
+
+def cap_caption(text: str, limit: int = CAPTION_LIMIT) -> str:
+    """
+    Обрезает HTML-подпись к фото до лимита Telegram, по возможности по границе строки.
+    Лимит считается по видимому тексту (как у Telegram после разбора разметки): теги
+    не режутся пополам, сущность (&amp; и т.п.) — один символ, незакрытые теги закрываются.
+    """
+    if _visible_length(text) <= limit:
+        return text
+
+    parts = []
+    open_tags = []
+    visible = 0
+    # Подпись длиннее лимита: оставляем место под "..."
+    budget = limit - 3
+    # (длина parts, открытые теги, видимых символов) на последнем переводе строки
+    last_newline = None
+    truncated = False
+
+    pos = 0
+    for match in list(_MARKUP.finditer(text)) + [None]:
+        chunk = text[pos:match.start()] if match else text[pos:]
+        for char in chunk:
+            if visible >= budget:
+                truncated = True
+                break
+            if char == "\n":
+                last_newline = (len(parts), list(open_tags), visible)
+            parts.append(char)
+            visible += 1
+        if truncated or match is None:
+            break
+
+        token = match.group()
+        pos = match.end()
+        if token.startswith("&"):
+            if visible >= budget:
+                truncated = True
+                break
+            parts.append(token)
+            visible += 1
+            continue
+
+        parts.append(token)
+        name = _TAG_NAME.match(token)
+        if name is None or token.endswith("/>"):
+            continue
+        tag = name.group(2).lower()
+        if not name.group(1):
+            open_tags.append(tag)
+        elif tag in open_tags:
+            del open_tags[len(open_tags) - 1 - open_tags[::-1].index(tag)]
+
+    if not truncated:
+        return text
+
+    if last_newline is not None and last_newline[2] > limit // 2:
+        del parts[last_newline[0]:]
+        open_tags = last_newline[1]
+    cut = "".join(parts).rstrip() + "..."
+    return cut + "".join(f"</{tag}>" for tag in reversed(open_tags))
@@ -0,0 +1,239 @@
+"""
+Журнал изменений (append-only) для JSON-хранилищ.
+
+Точечные изменения дописываются в файл <snapshot>.journal по одной записи
+на строку, при загрузке проигрываются поверх снимка и периодически
+сворачиваются в новый снимок.
+
+У каждой записи есть порядковый номер, снимок хранит номер последней вошедшей
+в него записи (SEQ_KEY). Если процесс упал между записью снимка и удалением
+журнала, уже учтенные записи при загрузке пропускаются, а не применяются повторно.
+
+Журнал файла должен вести один объект хранилища на процесс (общий синглтон
+модуля): снимок пишется из памяти того, кто сворачивает журнал, поэтому второй
+экземпляр на том же файле стер бы записи первого. Такое открытие попадает в лог.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_ENABLED = os.environ.get("STORAGE_JOURNAL", "true").lower() == "true"
+JOURNAL_MAX_RECORDS = int(os.environ.get("STORAGE_JOURNAL_MAX_RECORDS", "500"))
+JOURNAL_MAX_BYTES = int(os.environ.get("STORAGE_JOURNAL_MAX_BYTES", str(256 * 1024)))
+JOURNAL_MAX_AGE = int(os.environ.get("STORAGE_JOURNAL_MAX_AGE", "3600"))
+JOURNAL_FSYNC = os.environ.get("STORAGE_JOURNAL_FSYNC", "false").lower() == "true"
+
+# Ключ снимка с номером последней учтенной записи журнала
+SEQ_KEY = "_journal_seq"
+
+# Открытые журналы процесса по пути снимка
+_open_journals: "weakref.WeakValueDictionary[str, JsonJournal]" = weakref.WeakValueDictionary()
+
+
+def apply_record(data: dict, record: dict):
+    op = record["op"]
+    path = record["path"]
+
+    target = data
+    for key in path[:-1]:
+        target = target.setdefault(key, {})
+    last = path[-1]
+
+    if op == "set":
+        target[last] = record["value"]
+    elif op == "append":
+        target.setdefault(last, []).append(record["value"])
+    elif op == "delete":
+        target.pop(last, None)
+    else:
+        raise ValueError(f"Неизвестная операция журнала: {op}")
+
+
+def write_snapshot(path: str, data: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotSaver:
+    """
+    Сохранение небольшого индекса целиком из корутин: write_snapshot с fsync идет
+    в потоке, а не на цикле событий. Копию данных (snapshot) снимает цикл событий
+    перед записью; сохранения, запрошенные во время записи, сливаются в одно.
+    Вне цикла событий (to_thread, скрипты) запись выполняется сразу. Номер снимка
+    не дает более старому снимку из другого потока перезаписать новый.
+    """
+
+    def __init__(self, path: str, snapshot: Callable[[], Any], name: str):
+        self.path = path
+        self.snapshot = snapshot
+        self.name = name
+        self._seq_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._seq = 0
+        self._written = 0
+        self._pending = False
+        self._task: Optional[asyncio.Task] = None
+
+    def _take(self) -> tuple:
+        with self._seq_lock:
+            self._seq += 1
+            return self._seq, self.snapshot()
+
+    def _write(self, seq: int, data: Any):
+        with self._write_lock:
+            if seq <= self._written:
+                return
+            try:
+                write_snapshot(self.path, data)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения {self.name}: {e}", exc_info=True)
+                return
+            self._written = seq
+
+    def save(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(*self._take())
+            return
+        self._pending = True
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._pending:
+            self._pending = False
+            await asyncio.to_thread(self._write, *self._take())
+
+    async def flush(self):
+        """Дожидается последнего запрошенного сохранения (при остановке)."""
+        if self._task is not None and not self._task.done():
+            await self._task
+
+
+class JsonJournal:
+
+    def __init__(self, snapshot_file: str):
+        self.snapshot_file = snapshot_file
+        self.journal_file = f"{snapshot_file}.journal"
+        self.records = 0
+        self.size = 0
+        self.first_record_at: Optional[float] = None
+        self.seq = 0
+
+        path = os.path.abspath(snapshot_file)
+        if _open_journals.get(path) is not None:
+            logger.error(
+                f"Второй журнал для {path} в одном процессе: свертка одного экземпляра потеряет "
+                f"записи другого, используйте общий экземпляр хранилища"
+            )
+        _open_journals[path] = self
+
+    def replay(self, data: dict) -> int:
+        self.records = 0
+        self.size = 0
+        self.first_record_at = None
+        snapshot_seq = data.get(SEQ_KEY, 0)
+        self.seq = max(self.seq, snapshot_seq)
+
+        if not os.path.exists(self.journal_file):
+            return 0
+
+        with open(self.journal_file, 'rb') as f:
+            raw = f.read()
+
+        if raw and not raw.endswith(b"\n"):
+            # Последняя запись оборвана на середине — отрезаем её,
+            # иначе следующая дописанная запись склеится с мусором
+            cut = raw.rfind(b"\n") + 1
+            logger.warning(
+                f"Журнал {self.journal_file}: отброшена незавершенная запись ({len(raw) - cut} байт)"
+            )
+            raw = raw[:cut]
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(cut)
+
+        applied = 0
+        skipped = 0
+        for line in raw.splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                seq = record.get("seq")
+                if seq is not None and seq <= snapshot_seq:
+                    # Запись уже в снимке: журнал не успели удалить после его записи
+                    skipped += 1
+                    continue
+                apply_record(data, record)
+            except Exception as e:
+                logger.error(f"Журнал {self.journal_file}: пропущена поврежденная запись: {e}")
+                continue
+
+            if seq is not None:
+                self.seq = max(self.seq, seq)
+
+            applied += 1
+            if self.first_record_at is None:
+                self.first_record_at = record.get("ts", time.time())
+
+        if skipped:
+            logger.warning(f"Журнал {self.journal_file}: пропущено записей, уже вошедших в снимок: {skipped}")
+
+        self.records = applied
+        self.size = len(raw)
+        return applied
+
+    def append(self, op: str, path: List[str], value: Any = None) -> bool:
+        self.seq += 1
+        record = {"op": op, "path": path, "ts": round(time.time(), 3), "seq": self.seq}
+        if op != "delete":
+            record["value"] = value
+
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+        os.makedirs(os.path.dirname(self.journal_file), exist_ok=True)
+        with open(self.journal_file, 'ab') as f:
+            f.write(line)
+            f.flush()
+            if JOURNAL_FSYNC:
+                os.fsync(f.fileno())
+
+        self.records += 1
+        self.size += len(line)
+        if self.first_record_at is None:
+            self.first_record_at = record["ts"]
+
+        return self.needs_compaction()
+
+    def needs_compaction(self) -> bool:
+        if not self.records:
+            return False
+        if self.records >= JOURNAL_MAX_RECORDS or self.size >= JOURNAL_MAX_BYTES:
+            return True
+        return self.first_record_at is not None and time.time() - self.first_record_at >= JOURNAL_MAX_AGE
+
+    def write_snapshot(self, data: dict):
+        """Снимок с номером последней записи, затем удаление журнала."""
+        data[SEQ_KEY] = self.seq
+        write_snapshot(self.snapshot_file, data)
+        self.reset()
+
+    def reset(self):
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self.records = 0
+        self.size = 0
+        self.first_record_at = None
@@ -0,0 +1,73 @@
+"""
+Ленивые синглтоны: объект создается при первом обращении к его атрибутам,
+а не при импорте модуля. Время создания попадает в отчет о запуске.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, List
+
+logger = logging.getLogger(__name__)
+
+_registry: List["LazyProxy"] = []
+
+
+class LazyProxy:
+    """
+    Заместитель объекта, который создается через factory при первом использовании.
+    factory может вернуть None — тогда прокси ведет себя как пустое значение в if.
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_initialized", False)
+        object.__setattr__(self, "_init_seconds", 0.0)
+        object.__setattr__(self, "_lock", threading.Lock())
+        _registry.append(self)
+
+    def _get(self) -> Any:
+        if self._initialized:
+            return self._instance
+
+        # Часть обращений идет из asyncio.to_thread, поэтому создание под блокировкой
+        with self._lock:
+            if not self._initialized:
+                started = time.perf_counter()
+                object.__setattr__(self, "_instance", self._factory())
+                object.__setattr__(self, "_init_seconds", time.perf_counter() - started)
+                object.__setattr__(self, "_initialized", True)
+                logger.debug(f"{self._name} создан за {self._init_seconds * 1000:.1f} мс")
+        return self._instance
+
+    @property
+    def lazy_initialized(self) -> bool:
+        return self._initialized
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._get(), item)
+
+    def __setattr__(self, key: str, value: Any):
+        setattr(self._get(), key, value)
+
+    def __bool__(self) -> bool:
+        return bool(self._get())
+
+    def __len__(self) -> int:
+        return len(self._get())
+
+    def __repr__(self) -> str:
+        if not self._initialized:
+            return f"<LazyProxy {self._name} (не создан)>"
+        return repr(self._instance)
+
+
+def get_initialized() -> List[tuple]:
+    """(имя, время создания в секундах) для уже созданных объектов."""
+    return [(proxy._name, proxy._init_seconds) for proxy in _registry if proxy._initialized]
+
+
+def get_pending() -> List[str]:
+    return [proxy._name for proxy in _registry if not proxy._initialized]
+
@@ -0,0 +1,242 @@
+"""
+Выбор лидера среди нескольких экземпляров бота через аренду в SQLite.
+
+Фоновые рассылки — уведомления о парах, дни рождения, приветствия, дайджест,
+возобновление рассылок — выполняет только лидер, иначе при перекрытии
+экземпляров (выкатка, резервный экземпляр) каждое сообщение уходило бы дважды.
+Лидер продлевает аренду каждые LEADER_HEARTBEAT секунд; если он завис или
+упал, через LEADER_LEASE_TTL аренду забирает другой экземпляр. При штатной
+остановке аренда освобождается сразу, так что при выкатке новая версия
+подхватывает фоновые задачи без ожидания TTL.
+
+Обновления тоже получает только лидер. Хранилища обработчиков (SQLiteStorage
+для FSM, GroupManager, очередь рассылок) — кэши в памяти процесса поверх файлов
+в data/, и экземпляры, одновременно принимающие обновления, перезаписывали бы
+данные друг друга. Поэтому резервный экземпляр не запускает polling и не
+поднимает публичный webhook-сервер (балансировщик по проверке порта сам
+направит трафик на лидера): у него работают только цикл аренды и служебный
+сервер. При потере лидерства прием обновлений останавливается первым, затем
+дожидаются начатые обработчики и фоновые задачи. При получении лидерства данные,
+которые меняет прежний лидер (уведомленные пары, дайджест, позиции рассылок),
+перечитываются с диска.
+
+Файл аренды должен быть общим для всех экземпляров (общий том с data/ на одном
+хосте; SQLite поверх сетевых ФС блокировки не гарантирует). При
+LEADER_ELECTION=false экземпляр всегда лидер, как раньше.
+"""
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+from utils.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+LEADER_ELECTION = os.environ.get("LEADER_ELECTION", "false").lower() == "true"
+LEADER_LEASE_FILE = os.environ.get("LEADER_LEASE_FILE", "data/leader.sqlite3")
+LEADER_LEASE_TTL = float(os.environ.get("LEADER_LEASE_TTL", "30"))
+LEADER_HEARTBEAT = float(os.environ.get("LEADER_HEARTBEAT", "10"))
+INSTANCE_ID = os.environ.get("INSTANCE_ID") or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+LEASE_NAME = "background"
+
+IS_LEADER = Gauge("bot_is_leader", "1, если экземпляр держит аренду фоновых задач", ("instance",))
+
+_elector: Optional["LeaderElector"] = None
+
+
+def is_leader() -> bool:
+    """
+    Проверка перед каждой фоновой отправкой. Остановка фоновых задач при потере
+    лидерства ждет конца итерации, а завис экземпляр — и колбэка не будет вовсе,
+    поэтому срок аренды по локальным часам проверяется непосредственно перед отправкой.
+    Без запущенного LeaderElector (скрипты, тесты) экземпляр считается лидером.
+    """
+    return _elector is None or _elector.is_leader
+
+
+class SQLiteLease:
+    """Строка аренды: держатель, срок действия и номер срока (растет при каждой смене лидера)."""
+
+    def __init__(self, path: str = LEADER_LEASE_FILE, name: str = LEASE_NAME):
+        self.path = os.path.abspath(path)
+        self.name = name
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # isolation_level=None: транзакциями управляем сами через BEGIN IMMEDIATE
+        self._db = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS lease ("
+            "name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires_at REAL NOT NULL, term INTEGER NOT NULL)"
+        )
+
+    def try_acquire(self, holder: str, ttl: float) -> Optional[int]:
+        """Захватывает или продлевает аренду. Номер срока при успехе, иначе None."""
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT holder, expires_at, term FROM lease WHERE name = ?", (self.name,)
+            ).fetchone()
+            if row is None:
+                term = 1
+                self._db.execute(
+                    "INSERT INTO lease (name, holder, expires_at, term) VALUES (?, ?, ?, ?)",
+                    (self.name, holder, now + ttl, term)
+                )
+            elif row[0] == holder or row[1] < now:
+                term = row[2] if row[0] == holder else row[2] + 1
+                self._db.execute(
+                    "UPDATE lease SET holder = ?, expires_at = ?, term = ? WHERE name = ?",
+                    (holder, now + ttl, term, self.name)
+                )
+            else:
+                term = None
+            self._db.execute("COMMIT")
+            return term
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def release(self, holder: str):
+        self._db.execute(
+            "UPDATE lease SET expires_at = 0 WHERE name = ? AND holder = ?", (self.name, holder)
+        )
+
+    def get_holder(self) -> Optional[str]:
+        row = self._db.execute(
+            "SELECT holder FROM lease WHERE name = ? AND expires_at >= ?", (self.name, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self._db.close()
+
+
+class LeaderElector:
+    """
+    Цикл аренды: при получении лидерства вызывает on_elected, при потере — on_demoted.
+    Аренда продлевается с запасом в один heartbeat до истечения TTL; если продлить
+    не удалось (аренду забрал другой экземпляр или файл недоступен), фоновые
+    задачи останавливаются.
+    """
+
+    def __init__(
+        self,
+        on_elected: Callable[[], Awaitable[None]],
+        on_demoted: Callable[[], Awaitable[None]],
+        enabled: bool = LEADER_ELECTION,
+        ttl: float = LEADER_LEASE_TTL,
+        heartbeat: float = LEADER_HEARTBEAT,
+        instance_id: str = INSTANCE_ID
+    ):
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.enabled = enabled
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        self.instance_id = instance_id
+        self.term: Optional[int] = None
+        self._valid_until = 0.0
+        self._lease: Optional[SQLiteLease] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop_event = asyncio.Event()
+
+    @property
+    def is_leader(self) -> bool:
+        return self.term is not None and time.monotonic() < self._valid_until
+
+    async def start(self):
+        global _elector
+        _elector = self
+        if not self.enabled:
+            self.term = 0
+            self._valid_until = float("inf")
+            IS_LEADER.set(self.instance_id, value=1)
+            await self.on_elected()
+            return
+
+        self._lease = SQLiteLease()
+        logger.info(f"👑 Выбор лидера: экземпляр {self.instance_id}, аренда {self.ttl:.0f} с, {self._lease.path}")
+        await self._tick()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), self.heartbeat)
+            except asyncio.TimeoutError:
+                pass
+            if not self._stop_event.is_set():
+                await self._tick()
+
+    async def _tick(self):
+        # Продлеваем до того, как истечет срок, посчитанный по локальным часам
+        renew_started = time.monotonic()
+        try:
+            term = await asyncio.to_thread(self._lease.try_acquire, self.instance_id, self.ttl)
+        except Exception as e:
+            logger.error(f"Ошибка продления аренды лидера: {e}")
+            term = None
+
+        was_leader = self.term is not None
+        if term is not None:
+            self._valid_until = renew_started + self.ttl - self.heartbeat
+            if not was_leader:
+                self.term = term
+                IS_LEADER.set(self.instance_id, value=1)
+                logger.info(f"👑 Экземпляр {self.instance_id} стал лидером (срок {term})")
+                await self._call(self.on_elected)
+            return
+
+        if was_leader:
+            await self._demote("аренда не продлена")
+        elif self._lease is not None:
+            try:
+                holder = await asyncio.to_thread(self._lease.get_holder)
+                logger.debug(f"Лидер — {holder}, экземпляр {self.instance_id} в резерве")
+            except Exception as e:
+                logger.error(f"Не удалось прочитать аренду лидера: {e}")
+        IS_LEADER.set(self.instance_id, value=0)
+
+    async def _demote(self, reason: str):
+        logger.warning(f"👑 Экземпляр {self.instance_id} больше не лидер (срок {self.term}): {reason}")
+        self.term = None
+        self._valid_until = 0.0
+        IS_LEADER.set(self.instance_id, value=0)
+        await self._call(self.on_demoted)
+
+    async def _call(self, callback: Callable[[], Awaitable[None]]):
+        try:
+            await callback()
+        except Exception as e:
+            logger.error(f"Ошибка при смене лидерства: {e}", exc_info=True)
+
+    async def stop(self):
+        """Останавливает фоновые задачи лидера и освобождает аренду для следующего экземпляра."""
+        self._stop_event.set()
+        if self._task:
+            try:
+                await asyncio.wait({self._task})
+            except asyncio.CancelledError:
+                self._task.cancel()
+                raise
+
+        if self.term is not None:
+            self.term = None
+            await self._call(self.on_demoted)
+        IS_LEADER.set(self.instance_id, value=0)
+
+        if self._lease is not None:
+            try:
+                await asyncio.to_thread(self._lease.release, self.instance_id)
+                logger.info(f"👑 Аренда лидера освобождена экземпляром {self.instance_id}")
+            except Exception as e:
+                logger.error(f"Не удалось освободить аренду лидера: {e}")
+            self._lease.close()
+            self._lease = None
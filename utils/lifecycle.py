@@ -0,0 +1,185 @@
+"""
+Порядок остановки бота. Сервисы регистрируются в порядке, в котором их нужно
+останавливать; на всю остановку есть общий срок SHUTDOWN_TIMEOUT. Шаг, не
+успевший за оставшееся время, отменяется, а в итоговом отчете перечисляется
+брошенная работа, чтобы было видно, что продолжится после перезапуска, а что потеряно.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Union
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+logger = logging.getLogger(__name__)
+
+# docker stop по умолчанию ждет 10 секунд перед SIGKILL
+SHUTDOWN_TIMEOUT = float(os.environ.get("SHUTDOWN_TIMEOUT", "8"))
+# Сколько получает обязательный шаг (сброс буферов на диск), если общий срок уже вышел
+FORCED_STEP_TIMEOUT = 2.0
+
+StopCallback = Callable[[], Union[None, Awaitable[Any]]]
+
+
+async def interruptible_sleep(stop_event: asyncio.Event, seconds: float):
+    """Пауза фонового цикла, которую stop() прерывает сразу."""
+    try:
+        await asyncio.wait_for(stop_event.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def drain_task(task: Optional[asyncio.Task], stop: Optional[Callable[[], None]] = None):
+    """Просит цикл остановиться и ждет, пока он закончит текущую итерацию."""
+    if stop is not None:
+        stop()
+    if task is None:
+        return
+    try:
+        await asyncio.wait({task})
+    except asyncio.CancelledError:
+        # Срок остановки истек — прерываем итерацию
+        task.cancel()
+        raise
+    if not task.cancelled() and task.exception():
+        raise task.exception()
+
+
+class TaskTracker:
+    """
+    Выполняющиеся задачи одного вида (обработчики обновлений, задания планировщика),
+    которые никто не ждет: при остановке drain дожидается их, а не успевшие к сроку
+    отменяются и попадают в отчет через get_unfinished.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._tasks: Dict[asyncio.Task, str] = {}
+        # Задачи, которые при остановке отменяются сразу: их работа повторится после запуска
+        self._interruptible: Set[asyncio.Task] = set()
+        # Отмененные по сроку: к моменту отчета они уже могут завершиться
+        self._abandoned: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def track(self, description: str, task: Optional[asyncio.Task] = None, interruptible: bool = False):
+        """Отмечает задачу (по умолчанию текущую) до ее завершения."""
+        task = task or asyncio.current_task()
+        if task is None or task in self._tasks:
+            return
+        self._tasks[task] = description
+        if interruptible:
+            self._interruptible.add(task)
+        task.add_done_callback(self._forget)
+
+    def _forget(self, task: asyncio.Task):
+        self._tasks.pop(task, None)
+        self._interruptible.discard(task)
+
+    async def drain(self):
+        tasks = set(self._tasks)
+        if not tasks:
+            return
+        for task in self._interruptible:
+            logger.info(f"Прерываем: {self.kind} {self._tasks[task]}")
+            task.cancel()
+        logger.info(f"Ожидаем завершения: {self.kind} — {len(tasks)}")
+        try:
+            await asyncio.wait(tasks)
+        except asyncio.CancelledError:
+            # Срок остановки истек — прерываем, чтобы задачи успели выполнить finally
+            for task in tasks:
+                if not task.done() and task not in self._interruptible:
+                    self._abandoned.append(self._tasks.get(task, "?"))
+                task.cancel()
+            raise
+
+    def get_unfinished(self) -> List[str]:
+        unfinished = self._abandoned + list(self._tasks.values())
+        return [f"{self.kind} {description} прервано" for description in dict.fromkeys(unfinished)]
+
+
+class UpdateTrackingMiddleware(BaseMiddleware):
+    """Внешний middleware на dp.update: отмечает задачу обработки каждого обновления."""
+
+    def __init__(self, tracker: TaskTracker):
+        self.tracker = tracker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update):
+            self.tracker.track(f"id={event.update_id}")
+        return await handler(event, data)
+
+
+class _Step:
+
+    def __init__(self, name: str, stop: StopCallback, pending: Optional[Callable[[], List[str]]], force: bool):
+        self.name = name
+        self.stop = stop
+        self.pending = pending
+        self.force = force
+
+
+class LifecycleManager:
+
+    def __init__(self, timeout: float = SHUTDOWN_TIMEOUT):
+        self.timeout = timeout
+        self._steps: List[_Step] = []
+
+    def register(self, name: str, stop: StopCallback, pending: Optional[Callable[[], List[str]]] = None,
+                 force: bool = False):
+        """
+        stop — функция или корутинная функция остановки. pending вызывается после
+        остановки (или после срыва срока) и возвращает описания брошенной работы.
+        force — шаг выполняется и после общего срока (сброс буферов, закрытие хранилищ).
+        """
+        self._steps.append(_Step(name, stop, pending, force))
+
+    async def _run_step(self, step: _Step):
+        result = step.stop()
+        if inspect.isawaitable(result):
+            await result
+
+    async def shutdown(self) -> List[str]:
+        started = time.monotonic()
+        deadline = started + self.timeout
+        abandoned: List[str] = []
+        logger.info(f"Остановка: {len(self._steps)} шагов, срок {self.timeout:.0f} с")
+
+        for step in self._steps:
+            remaining = deadline - time.monotonic()
+            if step.force:
+                remaining = max(remaining, FORCED_STEP_TIMEOUT)
+            step_started = time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(self._run_step(step), remaining)
+                logger.debug(f"Остановлен {step.name} за {time.monotonic() - step_started:.2f} с")
+            except asyncio.TimeoutError:
+                abandoned.append(f"{step.name}: не успел остановиться до срока")
+            except Exception as e:
+                abandoned.append(f"{step.name}: ошибка при остановке ({e})")
+                logger.error(f"Ошибка при остановке {step.name}: {e}", exc_info=True)
+
+            if step.pending is not None:
+                try:
+                    abandoned.extend(f"{step.name}: {item}" for item in step.pending())
+                except Exception as e:
+                    logger.error(f"Не удалось получить незавершенную работу {step.name}: {e}")
+
+        elapsed = time.monotonic() - started
+        if abandoned:
+            logger.warning(f"Остановка за {elapsed:.1f} с, прервано: " + "; ".join(abandoned))
+        else:
+            logger.info(f"✅ Остановка за {elapsed:.1f} с, вся работа завершена")
+        return abandoned
@@ -0,0 +1,138 @@
+"""
+Настройка логирования: записи из цикла событий только кладутся в очередь
+(QueueHandler), форматирование и запись в поток выполняет отдельный поток
+QueueListener. Формат — текст или JSON (LOG_FORMAT), уровни и выборка
+задаются по модулям.
+
+    LOG_LEVEL=INFO
+    LOG_FORMAT=json
+    LOG_LEVELS=commands.schedule.schedule_storage=DEBUG,httpx=WARNING
+    LOG_SAMPLING=aiogram.event=20      # каждая 20-я запись INFO и ниже
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from typing import Dict, Optional
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+# httpx и apscheduler пишут INFO на каждый запрос и запуск задачи
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "httpx=WARNING,apscheduler=WARNING")
+# aiogram пишет "Update id=... is handled" на каждое обновление
+LOG_SAMPLING = os.environ.get("LOG_SAMPLING", "aiogram.event=20")
+
+# Поля LogRecord, которые не считаются дополнительными (extra=...)
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def parse_mapping(value: str) -> Dict[str, str]:
+    """'a=1, b.c=2' -> {'a': '1', 'b.c': '2'}."""
+    result = {}
+    for item in value.split(","):
+        name, sep, setting = item.partition("=")
+        if sep and name.strip() and setting.strip():
+            result[name.strip()] = setting.strip()
+    return result
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON; поля из extra= попадают в объект как есть."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает каждую N-ю запись уровня INFO и ниже от указанных логгеров
+    (и их дочерних). WARNING и выше проходят всегда.
+    """
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        self.rates = {name: rate for name, rate in rates.items() if rate > 1}
+        self._counters: Dict[str, int] = {}
+
+    def _match(self, name: str) -> Optional[str]:
+        while name:
+            if name in self.rates:
+                return name
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or not self.rates:
+            return True
+        prefix = self._match(record.name)
+        if prefix is None:
+            return True
+        count = self._counters.get(prefix, 0)
+        self._counters[prefix] = count + 1
+        return count % self.rates[prefix] == 0
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    """
+    Очередь внутри процесса, поэтому запись не нужно копировать и форматировать
+    заранее, как делает QueueHandler.prepare: в вызывающем потоке только
+    подставляются аргументы (они могут измениться позже), остальное — в потоке слушателя.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    global _listener
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    queue_handler = LocalQueueHandler(queue.SimpleQueue())
+    sampling = {name: int(rate) for name, rate in parse_mapping(LOG_SAMPLING).items() if rate.isdigit()}
+    queue_handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    for name, level in parse_mapping(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Дописывает очередь и останавливает поток слушателя."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
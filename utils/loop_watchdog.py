@@ -0,0 +1,146 @@
+"""
+Сторож цикла событий (включается LOOP_WATCHDOG=true, для отладки).
+
+Корутина-пульс на цикле каждые LOOP_WATCHDOG_INTERVAL секунд отмечается и
+измеряет задержку своего пробуждения. Отдельный поток следит за пульсом: если
+цикл не отвечает дольше LOOP_STALL_THRESHOLD, он снимает стек потока цикла и
+находит место в коде бота, которое его держит (синхронный requests, time.sleep,
+чтение JSON и т.п.). Остановки копятся по месту вызова и попадают в /metrics.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_WATCHDOG = os.environ.get("LOOP_WATCHDOG", "false").lower() == "true"
+LOOP_WATCHDOG_INTERVAL = float(os.environ.get("LOOP_WATCHDOG_INTERVAL", "0.05"))
+LOOP_STALL_THRESHOLD = float(os.environ.get("LOOP_STALL_THRESHOLD", "0.1"))
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOOP_LAG = Histogram(
+    "bot_event_loop_lag_seconds",
+    "Задержка пробуждения пульса цикла событий",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_STALLS = Counter("bot_event_loop_stalls_total", "Остановки цикла событий по месту вызова", ("site",))
+LOOP_STALL_SECONDS = Counter(
+    "bot_event_loop_stall_seconds_total",
+    "Суммарная длительность остановок цикла событий по месту вызова",
+    ("site",)
+)
+
+
+def _is_own_code(filename: str) -> bool:
+    path = os.path.abspath(filename)
+    return path.startswith(ROOT + os.sep) and "site-packages" not in path and path != os.path.abspath(__file__)
+
+
+def describe_stack(frames: List[traceback.FrameSummary]) -> Tuple[str, str]:
+    """
+    (место вызова, стек) по стеку потока цикла. Место — самый глубокий кадр кода бота:
+    сам блокирующий вызов обычно в библиотеке, но исправлять нужно вызывающего.
+    """
+    site = None
+    for frame in reversed(frames):
+        if _is_own_code(frame.filename):
+            site = f"{os.path.relpath(frame.filename, ROOT)}:{frame.lineno} {frame.name}"
+            break
+    if site is None and frames:
+        innermost = frames[-1]
+        site = f"{os.path.basename(innermost.filename)}:{innermost.lineno} {innermost.name}"
+    return site or "unknown", "".join(traceback.format_list(frames[-12:]))
+
+
+class LoopWatchdog:
+
+    def __init__(self, interval: float = LOOP_WATCHDOG_INTERVAL, threshold: float = LOOP_STALL_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._last_beat = time.perf_counter()
+        self._loop_thread_id: Optional[int] = None
+        # Снимок стека, сделанный потоком-сторожем во время текущей остановки
+        self._captured: Optional[Tuple[str, str]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._task: Optional[asyncio.Task] = None
+        self.sites: Dict[str, List[float]] = {}
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"🐶 Сторож цикла событий запущен: порог {self.threshold * 1000:.0f} мс")
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            self._thread.join(timeout=1)
+        top = self.get_top_sites(5)
+        if top:
+            logger.info("🐶 Самые долгие остановки цикла: " + "; ".join(
+                f"{site} — {count} раз, {seconds:.2f} с" for site, count, seconds in top
+            ))
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - expected)
+            self._last_beat = now
+            LOOP_LAG.observe(lag)
+
+            if lag >= self.threshold:
+                self._record_stall(lag)
+
+    def _record_stall(self, lag: float):
+        captured, self._captured = self._captured, None
+        site, stack = captured or ("unknown", "")
+        LOOP_STALLS.inc(site)
+        LOOP_STALL_SECONDS.inc(site, amount=lag)
+        stats = self.sites.setdefault(site, [0, 0.0])
+        stats[0] += 1
+        stats[1] += lag
+
+        # Первая остановка в месте — со стеком, повторные коротко
+        if stats[0] == 1:
+            logger.warning(f"🐶 Цикл событий заблокирован на {lag * 1000:.0f} мс: {site}\n{stack}")
+        else:
+            logger.warning(f"🐶 Цикл событий заблокирован на {lag * 1000:.0f} мс: {site} ({stats[0]}-й раз)")
+
+    def _watch(self):
+        poll = max(self.interval / 2, 0.01)
+        while not self._stop.wait(poll):
+            stalled_for = time.perf_counter() - self._last_beat - self.interval
+            if stalled_for < self.threshold or self._captured is not None:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._captured = describe_stack(traceback.extract_stack(frame))
+
+    def get_top_sites(self, limit: int = 10) -> List[Tuple[str, int, float]]:
+        top = sorted(self.sites.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [(site, count, seconds) for site, (count, seconds) in top]
+
+
+loop_watchdog = LoopWatchdog()
@@ -0,0 +1,248 @@
+"""
+Метрики бота в текстовом формате Prometheus без внешних зависимостей:
+задержки и ошибки обработчиков, исходящие вызовы Bot API и итерации фоновых циклов.
+
+Запись метрики — несколько операций со словарем, поэтому ее можно делать на
+каждом обновлении. Отдаются на /metrics служебного веб-сервера (utils.web_server).
+"""
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.event.bases import CancelHandler, SkipHandler
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self._samples()
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float):
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счетчики по корзинам (+Inf последней), сумма, количество]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._values.get(labels)
+        if series is None:
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        # Храним попадания по корзинам, накопительные суммы считаются при выдаче
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+UPDATES_TOTAL = Counter("bot_updates_total", "Обработанные обновления по типу", ("update_type",))
+UPDATE_LATENCY = Histogram("bot_update_duration_seconds", "Полное время обработки обновления", ("update_type",))
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Время работы обработчика", ("router", "handler"))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ("router", "handler", "error"))
+BOT_API_CALLS = Counter("bot_api_calls_total", "Исходящие вызовы Bot API", ("method", "outcome"))
+BOT_API_LATENCY = Histogram("bot_api_call_duration_seconds", "Время вызова Bot API", ("method",))
+LOOP_ITERATIONS = Counter("bot_background_iterations_total", "Итерации фоновых циклов", ("loop",))
+LOOP_ERRORS = Counter("bot_background_errors_total", "Ошибки в фоновых циклах", ("loop",))
+STORAGE_SAVES = Counter(
+    "bot_storage_saves_total",
+    "Запросы на сохранение хранилищ (requested) и фактические записи на диск (written)",
+    ("storage", "outcome")
+)
+CALLBACK_EDITS = Counter(
+    "bot_callback_edits_total",
+    "Редактирования сообщений по нажатиям кнопок: sent, coalesced, unchanged, not_modified",
+    ("outcome",)
+)
+
+ADMISSION_DECISIONS = Counter(
+    "bot_admission_decisions_total",
+    "Решения контроля допуска тяжелых команд: admitted, duplicate, shared, user_limited, chat_limited, busy",
+    ("command", "outcome")
+)
+
+
+def record_loop_iteration(loop: str, failed: bool = False):
+    LOOP_ITERATIONS.inc(loop)
+    if failed:
+        LOOP_ERRORS.inc(loop)
+
+
+# Подписи обработчиков кэшируются: имя модуля роутера и функции не меняются
+_handler_labels: Dict[Callable, Tuple[str, str]] = {}
+
+
+def _get_handler_labels(data: Dict[str, Any]) -> Tuple[str, str]:
+    handler = data.get("handler")
+    callback = getattr(handler, "callback", None)
+    if callback is None:
+        return "unknown", "unknown"
+
+    labels = _handler_labels.get(callback)
+    if labels is None:
+        module = getattr(callback, "__module__", "") or "unknown"
+        labels = (module.rsplit(".", 1)[-1], getattr(callback, "__name__", "unknown"))
+        _handler_labels[callback] = labels
+    return labels
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware на dp.update: количество и полное время обработки обновлений."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            update_type = event.event_type
+        except Exception:
+            update_type = "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            UPDATE_LATENCY.observe(time.perf_counter() - started, update_type)
+            UPDATES_TOTAL.inc(update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: вызывается, когда обработчик уже выбран, поэтому знает
+    его роутер (модуль) и имя функции. Регистрируется на наблюдателях диспетчера
+    и действует на все вложенные роутеры.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except (SkipHandler, CancelHandler):
+            raise
+        except Exception as e:
+            HANDLER_ERRORS.inc(*_get_handler_labels(data), type(e).__name__)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, *_get_handler_labels(data))
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: исходящие вызовы по методу Bot API и их исход."""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method):
+        api_method = getattr(method, "__api_method__", type(method).__name__)
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            outcome = type(e).__name__
+            raise
+        finally:
+            BOT_API_LATENCY.observe(time.perf_counter() - started, api_method)
+            BOT_API_CALLS.inc(api_method, outcome)
+
+
+def setup_metrics(dp, bot):
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    handler_middleware = HandlerMetricsMiddleware()
+    for observer in dp.observers.values():
+        if observer.event_name not in ("update", "error"):
+            observer.middleware(handler_middleware)
+    bot.session.middleware(BotApiMetricsMiddleware())
+    logger.info("Метрики обработчиков и Bot API подключены")
@@ -1,17 +1,49 @@
+import asyncio
+import json
 import logging
 import os
-from typing import Literal
+import time
+from typing import Literal, Optional
+
+import aiohttp
 import requests
 
+from utils.circuit_breaker import CircuitBreaker
+from utils.text_queue import TextQueue
+
 logger = logging.getLogger(__name__)
 
+OPENROUTER_DEADLINE = float(os.environ.get("OPENROUTER_DEADLINE", "20"))
+OPENROUTER_BREAKER_FAILURES = int(os.environ.get("OPENROUTER_BREAKER_FAILURES", "3"))
+OPENROUTER_BREAKER_RESET = float(os.environ.get("OPENROUTER_BREAKER_RESET", "300"))
+OPENROUTER_BATCH_DEADLINE = float(os.environ.get("OPENROUTER_BATCH_DEADLINE", "60"))
+
+# Сколько текстов каждого вида запрашивать одним запросом (0 — без очереди)
+GREETING_TEXT_BATCH = int(os.environ.get("GREETING_TEXT_BATCH", "5"))
+GREETING_TEXT_QUEUE_MIN = int(os.environ.get("GREETING_TEXT_QUEUE_MIN", "2"))
+
+KINDS = ("morning", "evening")
+
 
 class OpenRouterTextGenerator:
     
-    def __init__(self, api_key: str = None, model: str = None):
+    def __init__(self, api_key: str = None, model: str = None, text_queue: Optional[TextQueue] = None):
         self.api_key = api_key or os.environ.get("OPENROUTER_API_KEY")
         self.model = model or os.environ.get("OPENROUTER_MODEL", "x-ai/grok-4.1-fast")
-        self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.api_url = os.environ.get("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+        self.breaker = CircuitBreaker(OPENROUTER_BREAKER_FAILURES, OPENROUTER_BREAKER_RESET)
+        self.stats = {
+            "requests": 0,
+            "success": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "short_circuited": 0,
+            "latency_total": 0.0,
+            "last_latency": None
+        }
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.text_queue = text_queue
+        self._top_up_task: Optional[asyncio.Task] = None
         
         if not self.api_key:
             logger.error("OPENROUTER_API_KEY не настроен в переменных окружения")
@@ -22,26 +54,12 @@ class OpenRouterTextGenerator:
         
         if not self.api_key:
             logger.error("OPENROUTER_API_KEY не настроен")
-            return self._get_fallback_text(kind)
+            return self.fallback_text(kind)
         
         try:
             logger.info(f"Генерация {kind} приветствия через Grok...")
             
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            prompt = self._get_prompt(kind)
-            
-            data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "user", "content": prompt}
-                ],
-                "temperature": 0.7,
-                "max_tokens": 500
-            }
+            headers, data = self._build_request(self._get_prompt(kind))
             
             response = requests.post(
                 self.api_url,
@@ -56,23 +74,211 @@ class OpenRouterTextGenerator:
                 
                 if not generated_text:
                     logger.warning("Получен пустой текст от Grok")
-                    return self._get_fallback_text(kind)
+                    return self.fallback_text(kind)
                 
                 logger.info(f"✅ Текст успешно сгенерирован ({len(generated_text)} символов)")
                 return generated_text
             else:
                 logger.error(f"Ошибка от OpenRouter API: {response.status_code} - {response.text}")
-                return self._get_fallback_text(kind)
+                return self.fallback_text(kind)
                 
         except requests.exceptions.Timeout:
             logger.error("Таймаут при запросе к OpenRouter API")
-            return self._get_fallback_text(kind)
+            return self.fallback_text(kind)
         except requests.exceptions.RequestException as e:
             logger.error(f"Ошибка сети при запросе к OpenRouter API: {e}")
-            return self._get_fallback_text(kind)
+            return self.fallback_text(kind)
         except Exception as e:
             logger.exception(f"Непредвиденная ошибка при генерации текста: {e}")
-            return self._get_fallback_text(kind)
+            return self.fallback_text(kind)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=8, keepalive_timeout=60)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _build_request(self, prompt: str, max_tokens: int = 500) -> tuple[dict, dict]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.7,
+            "max_tokens": max_tokens
+        }
+        return headers, data
+
+    async def _complete(self, prompt: str, deadline: float, max_tokens: int = 500) -> Optional[str]:
+        """
+        Один запрос к OpenRouter с учетом circuit breaker и общего дедлайна.
+        Возвращает текст ответа или None при любой ошибке.
+        """
+        if not self.api_key:
+            return None
+
+        if not self.breaker.allow():
+            self.stats["short_circuited"] += 1
+            logger.warning(
+                f"OpenRouter временно отключен после серии ошибок, "
+                f"повторная попытка через {self.breaker.retry_in():.0f}с"
+            )
+            return None
+
+        headers, data = self._build_request(prompt, max_tokens)
+        self.stats["requests"] += 1
+        started = time.monotonic()
+
+        try:
+            async with asyncio.timeout(deadline):
+                async with self._get_session().post(self.api_url, headers=headers, json=data) as response:
+                    if response.status != 200:
+                        body = await response.text()
+                        raise RuntimeError(f"{response.status} - {body[:200]}")
+                    result = await response.json(content_type=None)
+
+            generated_text = result["choices"][0]["message"]["content"].strip()
+            if not generated_text:
+                raise RuntimeError("пустой ответ")
+        except asyncio.CancelledError:
+            # Ответ не дождались — это не ошибка провайдера, но пробную попытку надо вернуть
+            self.breaker.release()
+            raise
+        except TimeoutError:
+            self.stats["timeouts"] += 1
+            self.stats["errors"] += 1
+            self.breaker.record_failure()
+            logger.error(f"OpenRouter не ответил за {deadline:.0f}с")
+            return None
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.breaker.record_failure()
+            logger.error(f"Ошибка запроса к OpenRouter API: {e}")
+            return None
+
+        latency = time.monotonic() - started
+        self.stats["success"] += 1
+        self.stats["latency_total"] += latency
+        self.stats["last_latency"] = latency
+        self.breaker.record_success()
+        return generated_text
+
+    async def agenerate_greeting(
+        self,
+        kind: Literal["morning", "evening"],
+        deadline: float = OPENROUTER_DEADLINE
+    ) -> str:
+        """Асинхронный вариант generate_greeting на общем пуле соединений."""
+        queued = self.take_queued(kind)
+        if queued:
+            return queued
+
+        if not self.api_key:
+            logger.error("OPENROUTER_API_KEY не настроен")
+            return self.fallback_text(kind)
+
+        generated_text = await self.agenerate_text(kind, deadline)
+        if not generated_text:
+            return self.fallback_text(kind)
+        return generated_text
+
+    async def agenerate_text(
+        self,
+        kind: Literal["morning", "evening"],
+        deadline: float = OPENROUTER_DEADLINE
+    ) -> Optional[str]:
+        """Только запрос к OpenRouter, без очереди и запасных текстов; None при ошибке."""
+        logger.info(f"Генерация {kind} приветствия через OpenRouter...")
+        generated_text = await self._complete(self._get_prompt(kind), deadline)
+        if generated_text:
+            logger.info(f"✅ Текст успешно сгенерирован ({len(generated_text)} символов)")
+        return generated_text
+
+    def take_queued(self, kind: Literal["morning", "evening"]) -> Optional[str]:
+        if not self.text_queue or GREETING_TEXT_BATCH <= 0:
+            return None
+        text = self.text_queue.pop(kind)
+        if text:
+            logger.info(f"Текст {kind} приветствия взят из очереди (осталось {self.text_queue.size(kind)})")
+        self._schedule_top_up()
+        return text
+
+    def fallback_text(self, kind: Literal["morning", "evening"]) -> str:
+        if self.text_queue:
+            text = self.text_queue.pop(kind)
+            if text:
+                logger.info("Вместо стандартного текста используем текст из очереди")
+                return text
+        return self._get_fallback_text(kind)
+
+    def _schedule_top_up(self):
+        if self._top_up_task and not self._top_up_task.done():
+            return
+        try:
+            self._top_up_task = asyncio.get_running_loop().create_task(self.top_up_text_queue())
+        except RuntimeError:
+            pass
+
+    async def top_up_text_queue(self) -> int:
+        """Дозаполняет очередь текстов одним запросом, если она почти пуста."""
+        if not self.text_queue or GREETING_TEXT_BATCH <= 0 or not self.api_key:
+            return 0
+        if all(self.text_queue.size(kind) >= GREETING_TEXT_QUEUE_MIN for kind in KINDS):
+            return 0
+
+        batch = await self.agenerate_batch(GREETING_TEXT_BATCH)
+        added = 0
+        for kind, texts in batch.items():
+            if texts:
+                self.text_queue.extend(kind, texts)
+                added += len(texts)
+        if added:
+            logger.info(
+                f"Очередь текстов пополнена: утро {self.text_queue.size('morning')}, "
+                f"вечер {self.text_queue.size('evening')}"
+            )
+        return added
+
+    async def agenerate_batch(self, count: int, deadline: float = OPENROUTER_BATCH_DEADLINE) -> dict:
+        raw = await self._complete(self._get_batch_prompt(count), deadline, max_tokens=count * 2 * 150)
+        if not raw:
+            return {}
+        try:
+            return self._parse_batch(raw)
+        except (ValueError, AttributeError) as e:
+            logger.error(f"Не удалось разобрать пакет текстов от OpenRouter: {e}")
+            return {}
+
+    @staticmethod
+    def _parse_batch(raw: str) -> dict:
+        start = raw.find("{")
+        end = raw.rfind("}")
+        if start == -1 or end == -1:
+            raise ValueError("в ответе нет JSON-объекта")
+
+        data = json.loads(raw[start:end + 1])
+        return {
+            kind: [text.strip() for text in data.get(kind, []) if isinstance(text, str) and text.strip()]
+            for kind in KINDS
+        }
+
+    def get_stats(self) -> dict:
+        success = self.stats["success"]
+        return {
+            **self.stats,
+            "avg_latency": self.stats["latency_total"] / success if success else None,
+            "breaker_state": self.breaker.state
+        }
 
     def _get_prompt(self, kind: Literal["morning", "evening"]) -> str:
         if kind == "morning":
@@ -92,6 +298,19 @@ class OpenRouterTextGenerator:
                 "Стиль — дружелюбный, смешной, расслабляющий, уютный. Разрешено до двух уместных эмодзи"
             )
 
+    def _get_batch_prompt(self, count: int) -> str:
+        return (
+            f"Сгенерируй {count} разных очень коротких и смешных пожеланий доброго утра и "
+            f"{count} разных пожеланий спокойной ночи на русском языке для чата группы ИКБО-31-25 "
+            "(каждое 1–3 предложения). Используй маты, черный юмор и смешной зумерский стиль. "
+            "Утренние — энергичные и вдохновляющие, вечерние — расслабляющие и уютные. "
+            "В каждом разрешено до двух уместных эмодзи. "
+            'Ответь только JSON-объектом без пояснений: {"morning": ["...", ...], "evening": ["...", ...]}'
+        )
+
+    def is_fallback_text(self, kind: Literal["morning", "evening"], text: str) -> bool:
+        return text == self._get_fallback_text(kind)
+
     def _get_fallback_text(self, kind: Literal["morning", "evening"]) -> str:
         if kind == "morning":
             return "Доброе утро, ИКБО-31-25! Пусть день будет продуктивным! 🌅"
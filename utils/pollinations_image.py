@@ -1,18 +1,25 @@
+import asyncio
 import logging
-import requests
 import random
-import time
 import os
+from typing import Optional
+
+import aiohttp
 
 logger = logging.getLogger(__name__)
 
 HF_TOKEN = os.getenv("HF_TOKEN")
+HF_IMAGE_URL = os.getenv(
+    "HF_IMAGE_URL",
+    "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell"
+)
+IMAGE_GENERATION_DEADLINE = float(os.getenv("IMAGE_GENERATION_DEADLINE", "180"))
 
 class PollinationsImageAPI:
 
     def __init__(
         self,
-        base_url: str = "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell",
+        base_url: str = HF_IMAGE_URL,
         width: int = 1024,
         height: int = 1024,
         model: str = "flux-schnell", 
@@ -23,6 +30,7 @@ class PollinationsImageAPI:
         self.headers = {"Authorization": f"Bearer {HF_TOKEN}"}
         self.width = width
         self.height = height
+        self._session: Optional[aiohttp.ClientSession] = None
         logger.info(f"HuggingFaceImageAPI initialized (Target: FLUX.1-schnell)")
 
     def _construct_hq_prompt(self, raw_prompt: str) -> str:
@@ -93,8 +101,40 @@ class PollinationsImageAPI:
         )
         return clean_prompt
 
-    def generate_image_bytes(self, prompt: str, timeout: int = 60, max_retries: int = 5) -> bytes | None:
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=60)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def generate_image_bytes(
+        self,
+        prompt: str,
+        timeout: int = 60,
+        max_retries: int = 5,
+        deadline: float = IMAGE_GENERATION_DEADLINE
+    ) -> bytes | None:
+        """
+        Генерирует изображение, не блокируя event loop.
+        deadline ограничивает суммарное время всех попыток вместе с паузами.
+        """
+        try:
+            async with asyncio.timeout(deadline):
+                return await self._generate_with_retries(prompt, timeout, max_retries)
+        except TimeoutError:
+            logger.warning(f"Image generation deadline exceeded ({deadline:.0f}s)")
+            return None
+
+    async def _generate_with_retries(self, prompt: str, timeout: int, max_retries: int) -> bytes | None:
         final_prompt = self._construct_hq_prompt(prompt)
+        session = self._get_session()
         
         attempt = 0
         while attempt < max_retries:
@@ -113,32 +153,33 @@ class PollinationsImageAPI:
             try:
                 logger.info(f"Image attempt={attempt}. Prompt: {final_prompt[:80]}...")
                 
-                resp = requests.post(
-                    self.base_url, 
-                    headers=self.headers, 
-                    json=payload, 
-                    timeout=timeout
-                )
+                async with session.post(
+                    self.base_url,
+                    json=payload,
+                    timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as resp:
+                    status = resp.status
+                    content = await resp.read()
                 
-                if resp.status_code == 503:
+                if status == 503:
                     wait_time = 20
                     logger.warning(f"Model is loading (503). Sleeping {wait_time}s...")
-                    time.sleep(wait_time)
+                    await asyncio.sleep(wait_time)
                     continue 
                 
-                if resp.status_code != 200:
-                    logger.warning(f"HF Error {resp.status_code}")
-                    if resp.status_code in [400, 401, 403, 410]:
+                if status != 200:
+                    logger.warning(f"HF Error {status}")
+                    if status in [400, 401, 403, 410]:
                         return None
                 else:
-                    if len(resp.content) > 1000:
-                        return resp.content
+                    if len(content) > 1000:
+                        return content
 
                 backoff = (2 ** attempt) + random.uniform(0, 1)
-                time.sleep(backoff)
+                await asyncio.sleep(backoff)
 
             except Exception as e:
                 logger.exception(f"Error: {e}")
-                time.sleep(2)
+                await asyncio.sleep(2)
 
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,170 @@
+"""
+Маршрутизация запросов между несколькими провайдерами генерации.
+
+Для каждого провайдера ведется скользящее среднее (EWMA) задержки и доли
+успешных ответов. Первым вызывается самый быстрый здоровый провайдер; если он
+не ответил за время хеджирования, параллельно запускается следующий, и
+побеждает первый успешный ответ.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from utils.circuit_breaker import CircuitBreaker, STATE_OPEN
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_EWMA_ALPHA = float(os.getenv("PROVIDER_EWMA_ALPHA", "0.3"))
+PROVIDER_HEDGE_FACTOR = float(os.getenv("PROVIDER_HEDGE_FACTOR", "1.5"))
+PROVIDER_BREAKER_FAILURES = int(os.getenv("PROVIDER_BREAKER_FAILURES", "3"))
+PROVIDER_BREAKER_RESET = float(os.getenv("PROVIDER_BREAKER_RESET", "300"))
+
+
+@dataclass
+class ProviderHealth:
+    name: str
+    latency: Optional[float] = None
+    success_rate: float = 1.0
+    calls: int = 0
+    failures: int = 0
+    hedged: int = 0
+    last_error_at: Optional[float] = None
+    breaker: CircuitBreaker = field(
+        default_factory=lambda: CircuitBreaker(PROVIDER_BREAKER_FAILURES, PROVIDER_BREAKER_RESET)
+    )
+
+    def record(self, ok: bool, latency: float):
+        self.calls += 1
+        self.success_rate += PROVIDER_EWMA_ALPHA * ((1.0 if ok else 0.0) - self.success_rate)
+        if ok:
+            self.latency = latency if self.latency is None else (
+                self.latency + PROVIDER_EWMA_ALPHA * (latency - self.latency)
+            )
+            self.breaker.record_success()
+        else:
+            self.failures += 1
+            self.last_error_at = time.time()
+            self.breaker.record_failure()
+
+    def record_cancelled(self, elapsed: float):
+        # Проигравший хедж или сорванный срок — не ошибка провайдера, но пробную
+        # попытку полуоткрытого breaker'а нужно вернуть, иначе он не закроется никогда
+        self.breaker.release()
+        # Ответ не дождались: время ожидания — нижняя оценка задержки
+        if self.latency is None or elapsed > self.latency:
+            self.latency = elapsed if self.latency is None else (
+                self.latency + PROVIDER_EWMA_ALPHA * (elapsed - self.latency)
+            )
+
+    @property
+    def score(self) -> float:
+        # Неизвестная задержка — пробуем провайдера в первую очередь, чтобы узнать её
+        latency = self.latency if self.latency is not None else 0.0
+        return latency / max(self.success_rate, 0.05)
+
+
+class ProviderRouter:
+
+    def __init__(self, name: str, min_hedge_delay: float, deadline: float):
+        self.name = name
+        self.min_hedge_delay = min_hedge_delay
+        self.deadline = deadline
+        self.providers: Dict[str, Callable[..., Awaitable[Optional[object]]]] = {}
+        self.health: Dict[str, ProviderHealth] = {}
+
+    def add(self, name: str, call: Callable[..., Awaitable[Optional[object]]]):
+        self.providers[name] = call
+        self.health[name] = ProviderHealth(name)
+
+    def ranked(self) -> List[str]:
+        available = [name for name in self.providers if self.health[name].breaker.state != STATE_OPEN]
+        return sorted(available, key=lambda name: self.health[name].score)
+
+    def _hedge_delay(self, name: str) -> float:
+        latency = self.health[name].latency
+        if latency is None:
+            return self.min_hedge_delay
+        return max(self.min_hedge_delay, latency * PROVIDER_HEDGE_FACTOR)
+
+    async def _run(self, name: str, *args) -> Optional[object]:
+        health = self.health[name]
+        if not health.breaker.allow():
+            return None
+
+        started = time.monotonic()
+        try:
+            result = await self.providers[name](*args)
+        except asyncio.CancelledError:
+            health.record_cancelled(time.monotonic() - started)
+            raise
+        except Exception as e:
+            logger.error(f"[{self.name}] провайдер {name} завершился с ошибкой: {e}")
+            result = None
+
+        health.record(result is not None, time.monotonic() - started)
+        return result
+
+    async def call(self, *args, deadline: Optional[float] = None) -> Optional[object]:
+        candidates = self.ranked()
+        if not candidates:
+            logger.warning(f"[{self.name}] нет доступных провайдеров")
+            return None
+
+        pending: Dict[asyncio.Task, str] = {}
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            name = candidates[next_index]
+            next_index += 1
+            pending[asyncio.create_task(self._run(name, *args))] = name
+
+        try:
+            async with asyncio.timeout(deadline or self.deadline):
+                while pending or next_index < len(candidates):
+                    if not pending:
+                        launch()
+
+                    hedge_delay = None
+                    if next_index < len(candidates):
+                        hedge_delay = min(self._hedge_delay(name) for name in pending.values())
+
+                    done, _ = await asyncio.wait(
+                        pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED
+                    )
+
+                    if not done:
+                        slow = ", ".join(pending.values())
+                        logger.info(f"[{self.name}] {slow} отвечает слишком долго, подключаем {candidates[next_index]}")
+                        self.health[candidates[next_index]].hedged += 1
+                        launch()
+                        continue
+
+                    for task in done:
+                        name = pending.pop(task)
+                        result = task.result()
+                        if result is not None:
+                            logger.info(f"[{self.name}] ответ получен от {name}")
+                            return result
+        except TimeoutError:
+            logger.warning(f"[{self.name}] ни один провайдер не ответил за {deadline or self.deadline:.0f}с")
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return None
+
+    def describe(self) -> List[str]:
+        lines = []
+        for name, health in self.health.items():
+            state = health.breaker.state
+            icon = "✅" if state == "closed" else ("⛔" if state == STATE_OPEN else "⚠️")
+            latency = f"{health.latency:.1f}с" if health.latency is not None else "—"
+            lines.append(
+                f"{icon} {name}: задержка {latency}, успех {health.success_rate * 100:.0f}%, "
+                f"вызовов {health.calls}, ошибок {health.failures}, хеджей {health.hedged}"
+            )
+        return lines
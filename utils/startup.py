@@ -0,0 +1,70 @@
+"""
+Замер запуска бота: этапы от импорта main.py до первого обработанного обновления
+и время создания ленивых синглтонов (utils.lazy).
+"""
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Отсчет начинается до импорта aiogram: main.py импортирует этот модуль первым
+_started_at = time.perf_counter()
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from utils.lazy import get_initialized, get_pending
+
+logger = logging.getLogger(__name__)
+
+# Целевое время от запуска процесса до обработки первого обновления
+STARTUP_TARGET_SECONDS = float(os.environ.get("STARTUP_TARGET_SECONDS", "5"))
+# Обновления, пришедшие во время перезапуска, по умолчанию не выбрасываются
+DROP_PENDING_UPDATES = os.environ.get("DROP_PENDING_UPDATES", "false").lower() == "true"
+
+_stages: List[Tuple[str, float]] = []
+_first_update_after: Optional[float] = None
+
+
+def elapsed() -> float:
+    return time.perf_counter() - _started_at
+
+
+def mark(stage: str):
+    _stages.append((stage, elapsed()))
+
+
+def get_report_lines() -> List[str]:
+    lines = [f"{stage}: {seconds:.2f} с" for stage, seconds in _stages]
+    if _first_update_after is not None:
+        lines.append(f"первое обновление: {_first_update_after:.2f} с (цель {STARTUP_TARGET_SECONDS:.0f} с)")
+
+    initialized = sorted(get_initialized(), key=lambda item: item[1], reverse=True)
+    if initialized:
+        lines.append("создано лениво: " + ", ".join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in initialized))
+    pending = get_pending()
+    if pending:
+        lines.append(f"еще не создано: {len(pending)}")
+    return lines
+
+
+class FirstUpdateMiddleware(BaseMiddleware):
+    """Фиксирует время до первого обработанного обновления и пишет отчет о запуске."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            global _first_update_after
+            if _first_update_after is None:
+                _first_update_after = elapsed()
+                report = "; ".join(get_report_lines())
+                if _first_update_after > STARTUP_TARGET_SECONDS:
+                    logger.warning(f"⏱ Запуск медленнее цели: {report}")
+                else:
+                    logger.info(f"⏱ Запуск: {report}")
@@ -1,6 +1,6 @@
 import logging
 import os
-from typing import Literal
+from typing import Literal, Optional
 import httpx
 
 logger = logging.getLogger(__name__)
@@ -20,6 +20,61 @@ class TextGenerator:
             logger.info("TextGenerator настроен для работы с wispbyte API: %s", self.api_url)
         else:
             logger.warning("TextGenerator не полностью настроен - некоторые функции не будут работать")
+        
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def is_configured(self) -> bool:
+        return bool(self.api_url and self.api_key)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4)
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+    async def agenerate_text(self, kind: Literal["morning", "evening"]) -> Optional[str]:
+        """Асинхронный запрос к wispbyte API; None при любой ошибке."""
+        if not self.is_configured:
+            return None
+        
+        try:
+            logger.info("Отправка запроса на генерацию текста (%s) к wispbyte API", kind)
+            response = await self._get_client().post(
+                f"{self.api_url}/generate",
+                json={"type": kind, "model": "gemini-2.0-flash-exp"},
+                headers={"X-API-Key": self.api_key, "Content-Type": "application/json"}
+            )
+            
+            if response.status_code != 200:
+                logger.error("Ошибка от wispbyte API: %d - %s", response.status_code, response.text)
+                return None
+            
+            data = response.json()
+            if not data.get("success"):
+                logger.error("API вернул ошибку: %s", data.get("error"))
+                return None
+            
+            generated_text = data.get("text", "").strip()
+            if not generated_text:
+                logger.warning("Получен пустой текст от API")
+                return None
+            
+            logger.info("Текст успешно получен от wispbyte API (%d символов)", len(generated_text))
+            return generated_text
+        except httpx.TimeoutException:
+            logger.error("Таймаут при запросе к wispbyte API")
+            return None
+        except httpx.RequestError as e:
+            logger.error("Ошибка сети при запросе к wispbyte API: %s", e)
+            return None
 
     def generate_greeting(self, kind: Literal["morning", "evening"]) -> str:
         if not self.api_url or not self.api_key:
@@ -0,0 +1,52 @@
+"""
+Персистентная очередь заранее сгенерированных текстов приветствий.
+"""
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from utils.journal import SnapshotSaver
+
+logger = logging.getLogger(__name__)
+
+
+class TextQueue:
+
+    def __init__(self, storage_file: str = "data/greeting_texts.json"):
+        self.storage_file = os.path.abspath(storage_file)
+        self.texts: Dict[str, List[str]] = self._load()
+        self._saver = SnapshotSaver(
+            self.storage_file, lambda: {kind: list(texts) for kind, texts in self.texts.items()}, "очереди текстов"
+        )
+
+    def _load(self) -> Dict[str, List[str]]:
+        if os.path.exists(self.storage_file):
+            try:
+                with open(self.storage_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки очереди текстов: {e}", exc_info=True)
+        return {}
+
+    def _save(self):
+        self._saver.save()
+
+    async def flush(self):
+        await self._saver.flush()
+
+    def size(self, kind: str) -> int:
+        return len(self.texts.get(kind, []))
+
+    def pop(self, kind: str) -> Optional[str]:
+        texts = self.texts.get(kind)
+        if not texts:
+            return None
+        text = texts.pop(0)
+        self._save()
+        return text
+
+    def extend(self, kind: str, texts: List[str]):
+        queue = self.texts.setdefault(kind, [])
+        queue.extend(text for text in texts if text not in queue)
+        self._save()
@@ -0,0 +1,105 @@
+"""
+Встроенные aiohttp-серверы. Публичный (WEB_SERVER_HOST:WEB_SERVER_PORT) принимает
+только обновления через webhook. Служебные эндпоинты (/health, /metrics и всё,
+что добавлено в service_routes) отдаются отдельным сервером на SERVICE_HOST:SERVICE_PORT,
+по умолчанию только на 127.0.0.1: метрики раскрывают внутреннее состояние бота.
+Чтобы их забирал Prometheus из соседнего контейнера, задайте SERVICE_HOST=0.0.0.0
+и закройте порт снаружи.
+"""
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from utils.metrics import render as render_metrics
+
+logger = logging.getLogger(__name__)
+
+# polling (по умолчанию) или webhook
+BOT_RUN_MODE = os.environ.get("BOT_RUN_MODE", "polling").lower()
+WEBHOOK_BASE_URL = os.environ.get("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/webhook")
+WEB_SERVER_HOST = os.environ.get("WEB_SERVER_HOST", "0.0.0.0")
+WEB_SERVER_PORT = os.environ.get("WEB_SERVER_PORT")
+SERVICE_HOST = os.environ.get("SERVICE_HOST", "127.0.0.1")
+# В режиме polling служебный сервер поднимается, только если порт задан явно
+SERVICE_PORT = os.environ.get("SERVICE_PORT")
+
+service_routes = web.RouteTableDef()
+_started_at = time.time()
+
+
+def get_webhook_secret(bot_token: str) -> str:
+    """
+    Секрет для заголовка X-Telegram-Bot-Api-Secret-Token. Если WEBHOOK_SECRET не задан,
+    выводится из токена бота, чтобы у всех экземпляров за балансировщиком он совпадал.
+    """
+    secret = os.environ.get("WEBHOOK_SECRET")
+    if secret:
+        return secret
+    return hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()[:48]
+
+
+def get_webhook_url() -> str:
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("Для BOT_RUN_MODE=webhook нужно задать WEBHOOK_BASE_URL")
+    return f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}"
+
+
+def get_web_server_port() -> int:
+    return int(WEB_SERVER_PORT or 8080)
+
+
+def get_service_port() -> Optional[int]:
+    if SERVICE_PORT:
+        return int(SERVICE_PORT)
+    if BOT_RUN_MODE == "webhook":
+        return 9090
+    # Раньше в polling служебный сервер включался через WEB_SERVER_PORT
+    return int(WEB_SERVER_PORT) if WEB_SERVER_PORT else None
+
+
+@service_routes.get("/health")
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({
+        "status": "ok",
+        "mode": BOT_RUN_MODE,
+        "uptime": round(time.time() - _started_at, 1)
+    })
+
+
+@service_routes.get("/metrics")
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8")
+
+
+def create_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    """Публичное приложение: только путь webhook."""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=get_webhook_secret(bot.token)
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def create_service_app() -> web.Application:
+    app = web.Application()
+    app.add_routes(service_routes)
+    return app
+
+
+async def start_web_server(app: web.Application, port: int, host: str = WEB_SERVER_HOST) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info(f"Веб-сервер запущен на {host}:{port}")
+    return runner